@@ -0,0 +1,217 @@
+# Barberia/agenda.py
+"""
+Reglas de atención (ReglaAgenda, ExcepcionAgenda, ConfiguracionAgenda)
+compiladas sobre la grilla de Horas.
+
+Las reglas de cada sucursal se leen con cinco consultas y se guardan como
+foto versionada por sucursal (igual que el catálogo). Después se "compilan" contra la grilla del
+catálogo: por cada día de semana y cada excepción quedan dos máscaras de
+bits, del mismo largo que la grilla:
+
+- apertura: bloques que caen dentro del horario (empiezan >= abre y
+  terminan <= cierra),
+- inicios:  bloques donde puede empezar una cita (granularidad).
+
+Evaluar una fecha o un rango de N días es un lookup por día, sin BD: ampliar
+el horizonte de reserva no suma consultas. La compilación se rehace solo
+si cambian las reglas o el catálogo de esa sucursal.
+
+Los recursos activos (sillas / barberos) y sus jornadas van en la misma
+foto: aperturas(fecha) da la máscara de trabajo de cada recurso ese día
+(la del local, recortada por su jornada si la tiene).
+"""
+from datetime import time, timedelta
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalogo
+from .catalogo import FotosPorSucursal
+from .models import ConfiguracionAgenda, ExcepcionAgenda, JornadaRecurso, Recurso, ReglaAgenda
+
+CLAVE_VERSION = "barberia:agenda:version"
+BLOQUE_MINUTOS = 30
+
+NOMBRES_DIA = [nombre for _, nombre in ReglaAgenda.DIAS]
+
+# Lo que crea `seed` si no hay reglas (el horario histórico del local)
+REGLAS_POR_DEFECTO = {
+    **{dia: (time(12, 0), time(20, 0)) for dia in range(5)},
+    5: (time(12, 0), time(15, 30)),
+}
+
+
+def _minuto(t):
+    return t.hour * 60 + t.minute
+
+
+def _etiqueta(minuto):
+    return f"{minuto // 60:02d}:{minuto % 60:02d}"
+
+
+def bloques_entre(abre, cierra):
+    """Horas de inicio (time) de los bloques que caben en [abre, cierra)."""
+    return [
+        time(m // 60, m % 60)
+        for m in range(_minuto(abre), _minuto(cierra) - BLOQUE_MINUTOS + 1, BLOQUE_MINUTOS)
+    ]
+
+
+class Reglas:
+    def __init__(self, version, semana, excepciones, config, recursos=(), jornadas=None):
+        self.version = version
+        self.semana = semana                # {dia_semana: (abre, cierra)} en minutos
+        self.excepciones = excepciones      # {fecha: (abre, cierra)} en minutos
+        self.granularidad = config.granularidad_minutos
+        self.horizonte = config.horizonte_dias
+        self.recursos = list(recursos)      # [(id, nombre)] activos, por id
+        self.jornadas = jornadas or {}      # {recurso_id: {dia_semana: (abre, cierra)}} en minutos
+
+
+def _cargar(sucursal_id, version):
+    config = (
+        ConfiguracionAgenda.objects.filter(sucursal_id=sucursal_id).first()
+        or ConfiguracionAgenda(sucursal_id=sucursal_id)
+    )
+    return Reglas(
+        version,
+        {d: (_minuto(a), _minuto(c)) for d, a, c in
+         ReglaAgenda.objects.filter(sucursal_id=sucursal_id).values_list("dia_semana", "abre", "cierra")},
+        {f: (_minuto(a), _minuto(c)) for f, a, c in
+         ExcepcionAgenda.objects.filter(sucursal_id=sucursal_id).values_list("fecha", "abre", "cierra")},
+        config,
+        Recurso.objects.filter(sucursal_id=sucursal_id, activo=True).order_by("id").values_list("id", "nombre"),
+        _jornadas(sucursal_id),
+    )
+
+
+def _jornadas(sucursal_id):
+    out = {}
+    for r, d, a, c in JornadaRecurso.objects.filter(
+        recurso__sucursal_id=sucursal_id, recurso__activo=True
+    ).values_list("recurso_id", "dia_semana", "abre", "cierra"):
+        out.setdefault(r, {})[d] = (_minuto(a), _minuto(c))
+    return out
+
+
+class Agenda:
+    """Reglas compiladas contra una foto del catálogo. Solo lectura."""
+
+    def __init__(self, reglas, cat):
+        self.reglas = reglas
+        self.catalogo = cat
+        self._minutos = cat.minutos
+        self._semana = [
+            self._compilar(*reglas.semana[d]) if d in reglas.semana else None
+            for d in range(7)
+        ]
+        self._excepciones = {f: self._compilar(*r) for f, r in reglas.excepciones.items()}
+        self.recursos = [rid for rid, _ in reglas.recursos]
+        self.nombres_recurso = dict(reglas.recursos)
+        # Solo los recursos con jornada propia: [apertura por día de semana] (0 = no trabaja)
+        self._jornadas = {
+            rid: [self._compilar(*j[d])[0] if d in j else 0 for d in range(7)]
+            for rid, j in reglas.jornadas.items()
+        }
+
+    def _compilar(self, abre, cierra):
+        apertura = inicios = 0
+        for i, m in enumerate(self._minutos):
+            if m < abre or m + BLOQUE_MINUTOS > cierra:
+                continue
+            apertura |= 1 << i
+            if (m - abre) % self.reglas.granularidad == 0:
+                inicios |= 1 << i
+        return apertura, inicios
+
+    def dia(self, fecha):
+        """(apertura, inicios) de `fecha`, o None si ese día no se atiende."""
+        compilado = self._excepciones.get(fecha)
+        if compilado is None:
+            compilado = self._semana[fecha.weekday()]
+        return compilado
+
+    def abre(self, fecha) -> bool:
+        return self.dia(fecha) is not None
+
+    def aperturas(self, fecha):
+        """{recurso_id: bloques en que trabaja} de `fecha`; {} si el local no abre."""
+        dia = self.dia(fecha)
+        if dia is None:
+            return {}
+        apertura, w = dia[0], fecha.weekday()
+        return {
+            rid: apertura if rid not in self._jornadas else apertura & self._jornadas[rid][w]
+            for rid in self.recursos
+        }
+
+    def grilla(self, desde, hasta):
+        """{fecha: (apertura, inicios)} de los días que se atienden en [desde, hasta]."""
+        out = {}
+        f = desde
+        while f <= hasta:
+            compilado = self.dia(f)
+            if compilado is not None:
+                out[f] = compilado
+            f += timedelta(days=1)
+        return out
+
+    def ventana(self, hoy):
+        """(primera, última) fecha reservable: hoy + horizonte_dias - 1."""
+        return hoy, hoy + timedelta(days=self.reglas.horizonte - 1)
+
+    def horario_semana(self):
+        """[(nombre del día, "12:00 – 20:00" | "Cerrado")] de lunes a domingo."""
+        out = []
+        for d, nombre in enumerate(NOMBRES_DIA):
+            r = self.reglas.semana.get(d)
+            out.append((nombre, f"{_etiqueta(r[0])} – {_etiqueta(r[1])}" if r else "Cerrado"))
+        return out
+
+
+_fotos = FotosPorSucursal(CLAVE_VERSION, _cargar)
+_compiladas = {}      # {sucursal_id: Agenda}
+
+
+def _compilar(sucursal_id, reglas, cat):
+    a = _compiladas.get(sucursal_id)
+    if a is None or a.reglas is not reglas or a.catalogo is not cat:
+        a = _compiladas[sucursal_id] = Agenda(reglas, cat)
+    return a
+
+
+def actual(sucursal_id) -> Agenda:
+    return _compilar(sucursal_id, _fotos.actual(sucursal_id), catalogo.actual(sucursal_id))
+
+
+async def aactual(sucursal_id) -> Agenda:
+    return _compilar(sucursal_id, await _fotos.aactual(sucursal_id), await catalogo.aactual(sucursal_id))
+
+
+def limpiar(sucursal_id=None):
+    _fotos.limpiar(sucursal_id)
+    if sucursal_id is None:
+        _compiladas.clear()
+    else:
+        _compiladas.pop(sucursal_id, None)
+
+
+@receiver(post_save, sender=ReglaAgenda, dispatch_uid="agenda_regla_guardada")
+@receiver(post_delete, sender=ReglaAgenda, dispatch_uid="agenda_regla_borrada")
+@receiver(post_save, sender=ExcepcionAgenda, dispatch_uid="agenda_excepcion_guardada")
+@receiver(post_delete, sender=ExcepcionAgenda, dispatch_uid="agenda_excepcion_borrada")
+@receiver(post_save, sender=ConfiguracionAgenda, dispatch_uid="agenda_config_guardada")
+@receiver(post_delete, sender=ConfiguracionAgenda, dispatch_uid="agenda_config_borrada")
+@receiver(post_save, sender=Recurso, dispatch_uid="agenda_recurso_guardado")
+@receiver(post_delete, sender=Recurso, dispatch_uid="agenda_recurso_borrado")
+def _reglas_cambiadas(sender, instance, **kwargs):
+    _fotos.invalidar(instance.sucursal_id)
+
+
+@receiver(post_save, sender=JornadaRecurso, dispatch_uid="agenda_jornada_guardada")
+@receiver(post_delete, sender=JornadaRecurso, dispatch_uid="agenda_jornada_borrada")
+def _jornada_cambiada(sender, instance, **kwargs):
+    # La jornada es de la sucursal de su recurso
+    sucursal_id = Recurso.objects.filter(pk=instance.recurso_id).values_list("sucursal_id", flat=True).first()
+    if sucursal_id is not None:
+        _fotos.invalidar(sucursal_id)
@@ -0,0 +1,154 @@
+# Barberia/analitica.py
+"""
+Analítica del panel: ingresos por período, ocupación por bloque y día de
+semana, tasa de cancelación y tasa de agregados.
+
+Cada métrica agrupa en SQL (values().annotate() / aggregate()): a Python
+llega una fila por grupo, no una por cita. Los ingresos salen del rollup
+diario (EstadisticaDiaria) sumados por día en SQL y luego llevados al
+período (a lo más una fila por día: Trunc* en SQLite es una función Python
+por fila, más lenta); las tasas son UN aggregate con conteos filtrados. `manage.py bench_analitica` compara con
+agrupar fila a fila en Python.
+Todo es de UNA sucursal: las consultas filtran por ella primero (índices
+sucursal+fecha) y la grilla, el horario y los cierres son los suyos.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+
+from . import agenda, catalogo, cierres
+from .agenda import BLOQUE_MINUTOS
+from .disponibilidad import cubre
+from .models import DIAS_SEMANA, EstadisticaDiaria, Horario
+
+PERIODOS = {
+    "dia": lambda f: f,
+    "semana": lambda f: f - timedelta(days=f.weekday()),
+    "mes": lambda f: f.replace(day=1),
+}
+
+
+def _tasa(parte, total):
+    return round(parte / total, 4) if total else 0.0
+
+
+def _sumar(conteo, base, mascara, n):
+    """Suma `n` en conteo[base + i] por cada bit i de `mascara`."""
+    i = 0
+    while mascara:
+        if mascara & 1:
+            conteo[base + i] += n
+        mascara >>= 1
+        i += 1
+
+
+def ingresos(sucursal_id, start, end, periodo="dia", servicio=None):
+    """Ingresos (base + agregados) de citas no canceladas, por día/semana/mes."""
+    qs = (
+        EstadisticaDiaria.objects
+        .filter(sucursal_id=sucursal_id, fecha__gte=start, fecha__lt=end)
+        .exclude(estado="C")
+    )
+    if servicio:
+        qs = qs.filter(servicio_id=servicio)
+    por_dia = (
+        qs.values("fecha")
+        .annotate(monto=Sum("ingresos"), n=Sum("citas"))
+        .order_by("fecha")
+        .values_list("fecha", "monto", "n")
+    )
+    clave = PERIODOS[periodo]
+    grupos = {}  # las fechas llegan ordenadas: los períodos también
+    for fecha, monto, n in por_dia:
+        g = grupos.setdefault(clave(fecha), [0, 0])
+        g[0] += monto
+        g[1] += n
+    return {
+        "periodo": periodo,
+        "labels": [e.isoformat() for e in grupos],
+        "ingresos": [m for m, _ in grupos.values()],
+        "citas": [n for _, n in grupos.values()],
+        "total": sum(m for m, _ in grupos.values()),
+    }
+
+
+def ocupacion(sucursal_id, start, end):
+    """
+    % de bloques tomados por (día de semana, hora): citas activas cuyo
+    intervalo [hora_inicio, hora_fin) cruza ese bloque (una cita de 60' o con
+    agregados tapa varios) / capacidad del bloque: suma, sobre los días con
+    horario (agenda) y sin cierre de ese día de semana en el rango, de los
+    recursos que trabajan ese bloque (jornadas, cierres parciales).
+    Filas: los días de semana que la agenda abre en el rango (reglas o
+    excepciones, también el domingo) y los que tengan citas.
+    """
+    cat = catalogo.actual(sucursal_id)
+    nh = len(cat.minutos)
+
+    ultimo = end - timedelta(days=1)
+    ag = agenda.actual(sucursal_id)
+    cierre_desde = cierres.actual(sucursal_id).en_rango(start, ultimo)
+    abiertos = [0] * len(DIAS_SEMANA)
+    capacidad = [0] * (len(DIAS_SEMANA) * nh)
+    for dia in ag.grilla(start, ultimo):
+        desde = cierre_desde.get(dia)
+        if desde == cierres.DIA_COMPLETO:
+            continue
+        w = dia.weekday()
+        abiertos[w] += 1
+        atiende = -1 if desde is None else sum(  # cierre parcial: hasta su hora
+            1 << i for i, m in enumerate(cat.minutos) if m + BLOQUE_MINUTOS <= desde
+        )
+        for trabaja in ag.aperturas(dia).values():
+            _sumar(capacidad, w * nh, trabaja & atiende, 1)
+
+    grupos = (
+        Horario.objects
+        .filter(sucursal_id=sucursal_id, fecha__gte=start, fecha__lt=end, estado__in=["P", "A"])
+        .values("dia_semana", "hora_inicio", "hora_fin")
+        .annotate(n=Count("id"))
+        .order_by()
+        .values_list("dia_semana", "hora_inicio", "hora_fin", "n")
+    )
+    ocupadas = [0] * (len(DIAS_SEMANA) * nh)
+    for dia, inicio, fin, n in grupos:
+        if dia is None:
+            continue
+        _sumar(ocupadas, dia * nh, cubre(cat.minutos, inicio, fin), n)
+
+    dias = [d for d, _ in DIAS_SEMANA if abiertos[d] or any(ocupadas[d * nh:(d + 1) * nh])]
+    return {
+        "horas": cat.etiquetas,
+        "dias": [DIAS_SEMANA[d][1] for d in dias],
+        "dias_abiertos": [abiertos[d] for d in dias],
+        "capacidad": [capacidad[d * nh:(d + 1) * nh] for d in dias],
+        "citas": [ocupadas[d * nh:(d + 1) * nh] for d in dias],
+        "ocupacion": [
+            [_tasa(ocupadas[k], capacidad[k]) for k in range(d * nh, (d + 1) * nh)]
+            for d in dias
+        ],
+    }
+
+
+def tasas(sucursal_id, start, end, servicio=None):
+    """Tasa de cancelación (sobre todas) y de agregados (sobre las no canceladas)."""
+    Agregado = Horario.agregados.through
+    qs = Horario.objects.filter(sucursal_id=sucursal_id, fecha__gte=start, fecha__lt=end)
+    if servicio:
+        qs = qs.filter(Tipo_servicio_id=servicio)
+    m = (
+        qs.annotate(con_agregado=Exists(Agregado.objects.filter(horario_id=OuterRef("pk"))))
+        .aggregate(
+            total=Count("id"),
+            canceladas=Count("id", filter=Q(estado="C")),
+            activas_con_agregado=Count("id", filter=~Q(estado="C") & Q(con_agregado=True)),
+        )
+    )
+    total, canceladas, activas_con_agregado = m["total"], m["canceladas"], m["activas_con_agregado"]
+    return {
+        "citas": total,
+        "canceladas": canceladas,
+        "tasa_cancelacion": _tasa(canceladas, total),
+        "con_agregados": activas_con_agregado,
+        "tasa_agregados": _tasa(activas_con_agregado, total - canceladas),
+    }
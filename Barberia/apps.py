@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class BarberiaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Barberia'
+
+    def ready(self):
+        # Registra las señales que mantienen el catálogo, los cierres y las
+        # reglas de atención y las sucursales en memoria, el motor de disponibilidad, el
+        # cache de comprobantes, el índice de búsqueda de clientes, el rollup
+        # de estadísticas, la versión del feed del calendario y los avisos
+        # en vivo (SSE)
+        from . import agenda, busqueda, catalogo, cierres, difusion, disponibilidad, estadisticas, eventos, reportes, sucursales  # noqa: F401
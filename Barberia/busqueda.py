@@ -0,0 +1,55 @@
+# Barberia/busqueda.py
+"""
+Búsqueda de clientes del panel sobre TerminoBusqueda (en vez de icontains
+sobre Horario ⋈ Usuario, que recorre toda la historia en cada tecla).
+
+- Postgres: `termino LIKE '%x%'` servido por el índice GIN gin_trgm_ops
+  (coincide también a mitad de palabra o de RUT).
+- MySQL / SQLite: prefijo por palabra como rango [x, x + "{") sobre el
+  índice B-tree (termino, usuario); "{" va justo después de "z" y los
+  términos solo tienen [a-z0-9].
+Varias palabras en la consulta se combinan con AND.
+"""
+from django.db import connection
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import TerminoBusqueda, Usuario
+from .utils import plegar_texto, terminos_busqueda
+
+
+def usuarios_que_coinciden(q):
+    """Subconsulta de ids de Usuario que calzan con todas las palabras de `q` (o None si q queda vacía)."""
+    palabras = plegar_texto(q).split()
+    if not palabras:
+        return None
+
+    ids = None
+    for p in palabras:
+        if connection.vendor == "postgresql":
+            sub = TerminoBusqueda.objects.filter(termino__contains=p)
+        else:
+            sub = TerminoBusqueda.objects.filter(termino__gte=p, termino__lt=p + "{")
+        sub = sub.values("usuario_id")
+        ids = sub if ids is None else ids.filter(usuario_id__in=sub)
+    return ids
+
+
+def indexar(usuario):
+    """Sincroniza los términos del usuario; no escribe si no cambiaron."""
+    nuevos = terminos_busqueda(usuario.nombre, usuario.rut)
+    actuales = set(
+        TerminoBusqueda.objects.filter(usuario=usuario).values_list("termino", flat=True)
+    )
+    if nuevos == actuales:
+        return
+    TerminoBusqueda.objects.filter(usuario=usuario, termino__in=actuales - nuevos).delete()
+    TerminoBusqueda.objects.bulk_create([
+        TerminoBusqueda(usuario=usuario, termino=t) for t in nuevos - actuales
+    ])
+
+
+@receiver(post_save, sender=Usuario, dispatch_uid="busqueda_usuario_guardado")
+def _usuario_guardado(sender, instance, raw=False, **kwargs):
+    if not raw:
+        indexar(instance)
@@ -0,0 +1,208 @@
+# Barberia/catalogo.py
+"""
+Catálogo en memoria: Horas, Dias y Tipo_servicio.
+
+Son tablas chicas que casi no cambian y que casi todas las vistas públicas
+y del panel leen. Horas y Tipo_servicio son de cada sucursal: cada una se
+carga una vez por proceso (tres consultas) y se comparte como una foto
+inmutable (`Catalogo`) con los mapas por id, por nombre y de precios.
+
+Invalidación (por sucursal, FotosPorSucursal):
+- Las señales de los tres modelos descartan la foto local en el acto y, al
+  confirmar la transacción, cambian la versión guardada en el cache de
+  Django (clave_version(sucursal_id)). Cambiar un local no recarga los
+  otros; Dias es común y los invalida a todos.
+- Cada proceso compara su versión con la compartida a lo más cada
+  CATALOGO_REVISION segundos, así un cambio hecho en otro worker se ve en
+  ese plazo sin consultar la BD en cada request. Con el LocMemCache por
+  defecto la versión es por proceso; con Redis/Memcached es común a todos.
+"""
+import threading
+import time
+import uuid
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Dias, Horas, Sucursal, Tipo_servicio
+
+CLAVE_VERSION = "barberia:catalogo:version"
+
+
+class FotoVersionada:
+    """
+    Foto en memoria de una tabla chica, recargada con `cargar(version)`
+    cuando cambia la versión compartida `clave` en el cache de Django.
+    La versión se revisa a lo más cada CATALOGO_REVISION segundos.
+    """
+
+    def __init__(self, clave, cargar):
+        self.clave = clave
+        self.cargar = cargar
+        self._lock = threading.Lock()
+        self._actual = None
+        self._revisar_en = 0.0
+
+    def _version_compartida(self):
+        version = cache.get(self.clave)
+        if version is None:
+            cache.add(self.clave, uuid.uuid4().hex, None)
+            version = cache.get(self.clave)
+        return version
+
+    def actual(self):
+        ahora = time.monotonic()
+        c = self._actual
+        if c is not None and ahora < self._revisar_en:
+            return c
+
+        # La versión se lee ANTES de cargar: si cambia mientras tanto, la
+        # próxima revisión vuelve a cargar.
+        version = self._version_compartida()
+        if c is None or c.version != version:
+            c = self.cargar(version)
+        with self._lock:
+            self._actual = c
+            self._revisar_en = ahora + getattr(settings, "CATALOGO_REVISION", 5)
+        return c
+
+    async def aactual(self):
+        """Para vistas async: sin saltar de hilo si la foto está vigente."""
+        c = self._actual
+        if c is not None and time.monotonic() < self._revisar_en:
+            return c
+        return await sync_to_async(self.actual)()
+
+    def limpiar(self):
+        with self._lock:
+            self._actual = None
+
+    def invalidar(self):
+        """Descarta la foto de este proceso y, al confirmar, la de todos."""
+        self.limpiar()
+
+        def publicar():
+            cache.set(self.clave, uuid.uuid4().hex, None)
+            # Una lectura concurrente pudo recargar datos aún no confirmados
+            self.limpiar()
+
+        transaction.on_commit(publicar)
+
+
+class FotosPorSucursal:
+    """
+    Una FotoVersionada por sucursal, creada en el primer uso: cada local
+    carga, revisa e invalida la suya (versión en `<clave>:<sucursal_id>`),
+    así un cambio o un local con mucho movimiento no recarga a los demás.
+    `cargar(sucursal_id, version)`.
+    """
+
+    def __init__(self, clave, cargar):
+        self.clave_base = clave
+        self.cargar = cargar
+        self._lock = threading.Lock()
+        self._fotos = {}
+
+    def clave(self, sucursal_id):
+        return f"{self.clave_base}:{sucursal_id}"
+
+    def foto(self, sucursal_id) -> FotoVersionada:
+        f = self._fotos.get(sucursal_id)
+        if f is None:
+            with self._lock:
+                f = self._fotos.get(sucursal_id)
+                if f is None:
+                    f = self._fotos[sucursal_id] = FotoVersionada(
+                        self.clave(sucursal_id), partial(self.cargar, sucursal_id)
+                    )
+        return f
+
+    def actual(self, sucursal_id):
+        return self.foto(sucursal_id).actual()
+
+    async def aactual(self, sucursal_id):
+        return await self.foto(sucursal_id).aactual()
+
+    def limpiar(self, sucursal_id=None):
+        """Descarta la foto local de `sucursal_id` (None = de todas)."""
+        if sucursal_id is not None:
+            self.foto(sucursal_id).limpiar()
+            return
+        for f in list(self._fotos.values()):
+            f.limpiar()
+
+    def invalidar(self, sucursal_id):
+        self.foto(sucursal_id).invalidar()
+
+    def invalidar_todas(self):
+        # También las que este proceso aún no cargó: otro worker puede tenerlas
+        for sid in Sucursal.objects.values_list("id", flat=True):
+            self.invalidar(sid)
+
+
+class Catalogo:
+    """Foto de solo lectura: no modificar las instancias que expone."""
+
+    def __init__(self, version, horas, dias, servicios, sucursal_id=None):
+        self.version = version
+        self.sucursal_id = sucursal_id
+        self.horas = horas                  # por hora (orden de la grilla)
+        self.dias = dias                    # por id
+        self.servicios = servicios          # por nombre
+        self.bases = [s for s in servicios if s.tipo == "BASE"]
+        self.addons = [s for s in servicios if s.tipo == "ADDON"]
+
+        # Paralelos a `horas`: "HH:MM" y minuto del día
+        self.etiquetas = [f"{h.hora_Horas:%H:%M}" for h in horas]
+        self.minutos = [h.hora_Horas.hour * 60 + h.hora_Horas.minute for h in horas]
+        self.hora_por_id = {h.id: h for h in horas}
+        self.hora_por_etiqueta = dict(zip(self.etiquetas, horas))
+        self.dia_por_id = {d.id: d for d in dias}
+        self.dia_por_nombre = {d.dia_Dias: d for d in dias}
+        self.servicio_por_id = {s.id: s for s in servicios}
+        self.nombres = {s.id: s.nombre for s in servicios}
+        self.precios = {s.id: s.precio_servicio for s in servicios}
+        self.duraciones = {s.id: s.duracion_minutos for s in servicios}
+
+    def duracion(self, servicio_id, addons_ids=()):
+        """Minutos de una cita: servicio base + agregados (los ids desconocidos no suman)."""
+        d = self.duraciones
+        return d.get(servicio_id, 0) + sum(d.get(a, 0) for a in addons_ids)
+
+
+def _cargar(sucursal_id, version):
+    return Catalogo(
+        version,
+        list(Horas.objects.filter(sucursal_id=sucursal_id).order_by("hora_Horas", "id")),
+        list(Dias.objects.order_by("id")),
+        list(Tipo_servicio.objects.filter(sucursal_id=sucursal_id).order_by("nombre", "id")),
+        sucursal_id,
+    )
+
+
+_fotos = FotosPorSucursal(CLAVE_VERSION, _cargar)
+
+actual = _fotos.actual      # (sucursal_id) -> Catalogo vigente de esa sucursal
+aactual = _fotos.aactual
+limpiar = _fotos.limpiar
+invalidar = _fotos.invalidar
+clave_version = _fotos.clave
+
+
+@receiver(post_save, sender=Horas, dispatch_uid="catalogo_horas_guardada")
+@receiver(post_delete, sender=Horas, dispatch_uid="catalogo_horas_borrada")
+@receiver(post_save, sender=Tipo_servicio, dispatch_uid="catalogo_servicio_guardado")
+@receiver(post_delete, sender=Tipo_servicio, dispatch_uid="catalogo_servicio_borrado")
+def _catalogo_cambiado(sender, instance, **kwargs):
+    invalidar(instance.sucursal_id)
+
+
+@receiver(post_save, sender=Dias, dispatch_uid="catalogo_dias_guardado")
+@receiver(post_delete, sender=Dias, dispatch_uid="catalogo_dias_borrado")
+def _dias_cambiados(sender, **kwargs):
+    _fotos.invalidar_todas()
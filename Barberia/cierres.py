@@ -0,0 +1,78 @@
+# Barberia/cierres.py
+"""
+Calendario de cierres (DiaCerrado) en memoria.
+
+Cada fila puede cubrir un rango de fechas y, con `desde_hora`, solo la
+tarde de cada día. Se expande a {fecha: minuto desde el que se cierra}
+(0 = todo el día) más la lista ordenada de fechas, así:
+
+- cerrado(f) / cierre_desde(f) son un lookup en dict,
+- los rangos (semana reservable, analítica) son dos bisect sobre la lista.
+
+La tabla es chica (una fila por cierre) y cada sucursal carga sus filas
+con UNA consulta; se invalida igual que el catálogo, por sucursal
+(señales + versión compartida en el cache de Django).
+"""
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalogo import FotosPorSucursal
+from .models import DiaCerrado
+
+CLAVE_VERSION = "barberia:cierres:version"
+DIA_COMPLETO = 0
+
+
+class Cierres:
+    def __init__(self, version, filas):
+        desde = {}
+        for fecha, hasta, hora in filas:
+            minuto = DIA_COMPLETO if hora is None else hora.hour * 60 + hora.minute
+            f = fecha
+            while f <= (hasta or fecha):
+                # Dos cierres el mismo día: manda el que cierra antes
+                desde[f] = min(minuto, desde.get(f, minuto))
+                f += timedelta(days=1)
+        self.version = version
+        self.fechas = sorted(desde)
+        self.desde_minuto = desde
+
+    def cierre_desde(self, fecha):
+        """Minuto del día desde el que `fecha` está cerrada (0 = todo el día); None si abre normal."""
+        return self.desde_minuto.get(fecha)
+
+    def cerrado(self, fecha) -> bool:
+        return self.desde_minuto.get(fecha) == DIA_COMPLETO
+
+    def en_rango(self, desde, hasta):
+        """{fecha: minuto} de los cierres con fecha en [desde, hasta] (ambos inclusive)."""
+        i = bisect_left(self.fechas, desde)
+        j = bisect_right(self.fechas, hasta)
+        return {f: self.desde_minuto[f] for f in self.fechas[i:j]}
+
+    def cerrados(self, desde, hasta):
+        """Fechas cerradas todo el día en [desde, hasta]."""
+        return {f for f, m in self.en_rango(desde, hasta).items() if m == DIA_COMPLETO}
+
+
+def _cargar(sucursal_id, version):
+    return Cierres(
+        version,
+        DiaCerrado.objects.filter(sucursal_id=sucursal_id).values_list("fecha", "hasta", "desde_hora"),
+    )
+
+
+_fotos = FotosPorSucursal(CLAVE_VERSION, _cargar)
+
+actual = _fotos.actual      # (sucursal_id) -> Cierres vigentes de esa sucursal
+aactual = _fotos.aactual
+limpiar = _fotos.limpiar
+
+
+@receiver(post_save, sender=DiaCerrado, dispatch_uid="cierres_guardado")
+@receiver(post_delete, sender=DiaCerrado, dispatch_uid="cierres_borrado")
+def _cierre_cambiado(sender, instance, **kwargs):
+    _fotos.invalidar(instance.sucursal_id)
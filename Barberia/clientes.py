@@ -0,0 +1,68 @@
+# Barberia/clientes.py
+"""
+Deduplicación de clientes (Usuario) por RUT normalizado.
+Recibe las clases de modelo para servir tanto en migraciones (modelos
+históricos) como en `manage.py fusionar_usuarios`.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+
+
+def fusionar_duplicados(Usuario, Horario, lote=500, dry_run=False):
+    """
+    Une los Usuario con el mismo rut_normalizado: conserva el id más bajo con el
+    nombre/celular del más reciente, repunta sus Horario y borra el resto.
+    Procesa `lote` RUTs por transacción (3 escrituras por lote).
+    Retorna (ruts_fusionados, usuarios_borrados).
+    """
+    total_ruts = total_borrados = 0
+    while True:
+        ruts = list(
+            Usuario.objects
+            .exclude(rut_normalizado=None)
+            .values("rut_normalizado")
+            .annotate(n=Count("id"))
+            .filter(n__gt=1)
+            .order_by("rut_normalizado")
+            .values_list("rut_normalizado", flat=True)[:lote]
+        )
+        if not ruts:
+            break
+
+        grupos = defaultdict(list)
+        filas = (
+            Usuario.objects
+            .filter(rut_normalizado__in=ruts)
+            .order_by("rut_normalizado", "id")
+            .values_list("id", "rut_normalizado", "nombre", "celular")
+        )
+        for fila in filas:
+            grupos[fila[1]].append(fila)
+
+        destino = {}        # id duplicado -> id conservado
+        conservados = []
+        for g in grupos.values():
+            pk, _, _, _ = g[0]
+            _, _, nombre, celular = g[-1]
+            conservados.append(Usuario(id=pk, nombre=nombre, celular=celular))
+            for dup in g[1:]:
+                destino[dup[0]] = pk
+
+        total_ruts += len(grupos)
+        total_borrados += len(destino)
+        if dry_run:
+            break
+
+        with transaction.atomic():
+            Horario.objects.filter(usuario_horario_id__in=destino).update(
+                usuario_horario_id=Case(
+                    *[When(usuario_horario_id=d, then=Value(k)) for d, k in destino.items()],
+                    output_field=IntegerField(),
+                )
+            )
+            Usuario.objects.bulk_update(conservados, ["nombre", "celular"])
+            Usuario.objects.filter(id__in=destino).delete()
+
+    return total_ruts, total_borrados
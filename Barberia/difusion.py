@@ -0,0 +1,131 @@
+# Barberia/difusion.py
+"""
+Avisos en vivo (Server-Sent Events) de reservas, cancelaciones y cambios de
+estado, por sucursal y fecha.
+
+Broker en memoria del proceso, sin servicios externos: cada conexión SSE
+(una corrutina en el event loop de ASGI) registra una cola con su sucursal
+y su rango de fechas (se indexan por sucursal: publicar en un local no
+recorre las conexiones de los otros); las señales de Horario publican al confirmar la transacción desde
+el hilo que sea, y el aviso se entrega con call_soon_threadsafe.
+
+Es por proceso: con varios workers ASGI, cada uno avisa solo de lo que se
+escribió en él (los clientes igual reciben el resto al refrescar/pollear).
+El aviso no lleva datos del cliente ni el id de la cita: es público.
+"""
+import asyncio
+import logging
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Horario
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDIENTES = 100  # por suscriptor; si un cliente lento se llena, se descartan avisos
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscriptores = {}  # {sucursal_id: set(_Suscripcion)}
+
+    def suscribir(self, sucursal_id, desde, hasta):
+        """Cola que recibe los avisos de la sucursal con fecha en [desde, hasta). Llamar desde el event loop."""
+        s = _Suscripcion(self, asyncio.get_running_loop(), sucursal_id, desde, hasta)
+        with self._lock:
+            self._suscriptores.setdefault(sucursal_id, set()).add(s)
+        return s
+
+    def _quitar(self, s):
+        with self._lock:
+            grupo = self._suscriptores.get(s.sucursal_id)
+            if grupo is not None:
+                grupo.discard(s)
+                if not grupo:
+                    del self._suscriptores[s.sucursal_id]
+
+    def publicar(self, sucursal_id, aviso):
+        """Thread-safe. `aviso` es un dict con al menos "fecha" (date)."""
+        fecha = aviso["fecha"]
+        datos = {**aviso, "fecha": fecha.isoformat()}
+        with self._lock:
+            destinos = [
+                s for s in self._suscriptores.get(sucursal_id, ())
+                if s.desde <= fecha < s.hasta
+            ]
+        for s in destinos:
+            try:
+                s.loop.call_soon_threadsafe(s.entregar, datos)
+            except RuntimeError:
+                # El loop de esa conexión ya cerró
+                self._quitar(s)
+        return len(destinos)
+
+    def __len__(self):
+        with self._lock:
+            return sum(map(len, self._suscriptores.values()))
+
+
+class _Suscripcion:
+    def __init__(self, broker, loop, sucursal_id, desde, hasta):
+        self.broker = broker
+        self.loop = loop
+        self.sucursal_id = sucursal_id
+        self.desde = desde
+        self.hasta = hasta
+        self.cola = asyncio.Queue(maxsize=MAX_PENDIENTES)
+
+    def entregar(self, datos):
+        try:
+            self.cola.put_nowait(datos)
+        except asyncio.QueueFull:
+            logger.warning("Suscriptor SSE lento: aviso descartado")
+
+    def __enter__(self):
+        return self.cola
+
+    def __exit__(self, *exc):
+        self.broker._quitar(self)
+
+
+broker = Broker()
+
+
+# =========================
+# Señales: publicar al confirmar
+# =========================
+
+def _publicar_al_confirmar(sucursal_id, tipo, fecha, hora, estado):
+    def publicar():
+        if not len(broker):
+            return
+        broker.publicar(sucursal_id, {
+            "tipo": tipo,
+            "fecha": fecha,
+            "hora": f"{hora:%H:%M}",
+            "estado": estado,
+        })
+    transaction.on_commit(publicar, robust=True)
+
+
+@receiver(post_save, sender=Horario, dispatch_uid="difusion_horario_guardado")
+def _horario_guardado(sender, instance, created, raw=False, **kwargs):
+    if raw or instance.fecha is None:
+        return
+    if created:
+        tipo = "reserva"
+    elif instance.estado == "C":
+        tipo = "cancelacion"
+    else:
+        tipo = "estado"
+    _publicar_al_confirmar(instance.sucursal_id, tipo, instance.fecha, instance.hora_inicio, instance.estado)
+
+
+@receiver(post_delete, sender=Horario, dispatch_uid="difusion_horario_borrado")
+def _horario_borrado(sender, instance, **kwargs):
+    if instance.fecha is not None:
+        _publicar_al_confirmar(instance.sucursal_id, "cancelacion", instance.fecha, instance.hora_inicio, "C")
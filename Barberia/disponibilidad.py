@@ -0,0 +1,372 @@
+# Barberia/disponibilidad.py
+"""
+Motor de disponibilidad en memoria, por sucursal.
+
+Por cada fecha y recurso (silla / barbero) se guarda un bitmap sobre la grilla
+de Horas (ordenada por hora): bit i = 1 si el bloque i cruza el intervalo
+[hora_inicio, hora_fin) de alguna cita Pendiente/Atendida de ese recurso (una
+cita de 60' o con agregados tapa varios bloques).
+La grilla y la duración de cada servicio salen del catálogo en memoria de la
+sucursal (catalogo.py); si ese catálogo cambia, sus bitmaps se descartan.
+
+- Marcar una cita son dos bisect sobre los minutos de la grilla (cubre()).
+- Buscar inicios para N bloques son N operaciones sobre enteros por recurso,
+  para todos los inicios del día a la vez, sin consultas. "Cualquier
+  barbero" es el OR de las máscaras de inicio de cada recurso.
+
+- Un rango de fechas se construye con UNA consulta (todos los recursos de la
+  sucursal, índice sucursal+fecha+estado) la primera vez que se pide.
+- Cada sucursal tiene su estado (_Estado: grilla, fechas y lock): el
+  movimiento de un local no expulsa ni bloquea las fechas de otro.
+- Las señales de Horario mantienen el bitmap al crear, cancelar o reactivar
+  (panel_set_estado guarda con update_fields=["estado"]).
+- Las entradas expiran tras DISPONIBILIDAD_TTL segundos para acotar lo
+  desactualizado entre workers; RegistrarHorario igual valida contra la BD.
+- Las vistas async llaman antes a alistar(): con todo vigente, el cálculo
+  corre en el event loop sin saltar de hilo.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import agenda, catalogo, cierres
+from .agenda import BLOQUE_MINUTOS
+from .models import Horario
+
+ESTADOS_ACTIVOS = ("P", "A")
+
+
+class _Estado:
+    """Bitmaps de una sucursal."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.base = None      # foto del catálogo de la que sale grilla
+        self.grilla = None    # (horas ["12:00", ...], minutos [720, ...], continua)
+        self.dias = {}        # {fecha: (expira, {recurso_id: mascara_ocupadas})}
+
+
+_lock = threading.Lock()
+_estados = {}         # {sucursal_id: _Estado}
+
+
+def _estado(sucursal_id) -> _Estado:
+    e = _estados.get(sucursal_id)
+    if e is None:
+        with _lock:
+            e = _estados.setdefault(sucursal_id, _Estado())
+    return e
+
+
+def _ttl():
+    return getattr(settings, "DISPONIBILIDAD_TTL", 30)
+
+
+def _minuto(t):
+    return t.hour * 60 + t.minute
+
+
+def bloques_de(minutos: int) -> int:
+    """Bloques de BLOQUE_MINUTOS que necesita una cita de `minutos` (al menos 1)."""
+    return max(1, -(-minutos // BLOQUE_MINUTOS))
+
+
+def cubre(minutos, inicio, fin):
+    """
+    Máscara de los bloques de la grilla (`minutos`, ordenada) que cruzan el
+    intervalo [inicio, fin) (time): dos bisect, O(log n).
+    """
+    a = _minuto(inicio)
+    b = max(_minuto(fin), a + 1)
+    i = bisect_right(minutos, a - BLOQUE_MINUTOS)
+    j = bisect_left(minutos, b)
+    return (1 << j) - (1 << i) if j > i else 0
+
+
+def _sincronizar(sucursal_id):
+    """
+    La grilla sale del catálogo en memoria de la sucursal. Si el catálogo
+    cambió (nueva foto) los índices de los bitmaps ya no valen: se rehacen
+    todos los de esa sucursal.
+    `continua`: bit i = el bloque i+1 empieza justo donde termina el i
+    (una cita larga no puede saltar un hueco de la grilla).
+    """
+    e = _estado(sucursal_id)
+    cat = catalogo.actual(sucursal_id)
+    if cat is not e.base:
+        minutos = cat.minutos
+        continua = 0
+        for i in range(len(minutos) - 1):
+            if minutos[i + 1] == minutos[i] + BLOQUE_MINUTOS:
+                continua |= 1 << i
+        grilla = (cat.etiquetas, minutos, continua)
+        with e.lock:
+            e.dias.clear()
+            e.grilla, e.base = grilla, cat
+    return e.grilla
+
+
+def _faltan(e, desde, hasta, ahora):
+    """Fechas de [desde, hasta] sin bitmap vigente en memoria."""
+    faltan = []
+    f = desde
+    while f <= hasta:
+        d = e.dias.get(f)
+        if d is None or d[0] <= ahora:
+            faltan.append(f)
+        f += timedelta(days=1)
+    return faltan
+
+
+def _citas(sucursal_id, faltan):
+    return (
+        Horario.objects
+        .filter(
+            sucursal_id=sucursal_id, fecha__gte=faltan[0], fecha__lte=faltan[-1],
+            estado__in=ESTADOS_ACTIVOS,
+        )
+        .values_list("fecha", "recurso_id", "hora_inicio", "hora_fin")
+    )
+
+
+def _guardar(e, faltan, minutos, filas, ahora):
+    mascaras = {f: {} for f in faltan}
+    for fecha, rid, inicio, fin in filas:
+        m = mascaras.get(fecha)
+        if m is not None:
+            m[rid] = m.get(rid, 0) | cubre(minutos, inicio, fin)
+
+    expira = ahora + _ttl()
+    with e.lock:
+        if len(e.dias) > 64:
+            for f in [f for f, (exp, _) in e.dias.items() if exp <= ahora]:
+                del e.dias[f]
+        for fecha, m in mascaras.items():
+            e.dias[fecha] = (expira, m)
+    return mascaras
+
+
+def precargar(sucursal_id, desde, hasta):
+    """
+    Construye con UNA consulta (para todos los recursos de la sucursal) los
+    bitmaps de las fechas [desde, hasta] que no estén vigentes en memoria.
+    Retorna {fecha: {recurso_id: mascara}} de lo cargado.
+    """
+    e, ahora = _estado(sucursal_id), time.monotonic()
+    faltan = _faltan(e, desde, hasta, ahora)
+    if not faltan:
+        return {}
+    _, minutos, _ = _sincronizar(sucursal_id)
+    return _guardar(e, faltan, minutos, _citas(sucursal_id, faltan), ahora)
+
+
+async def alistar(sucursal_id, fecha):
+    """
+    Para vistas async: deja vigentes las fotos de la sucursal (catálogo,
+    agenda, cierres) y el bitmap de `fecha`, leyendo con el ORM async. Después
+    slots_libres / horas_ocupadas de esa fecha son solo memoria: corren en el
+    event loop, sin pasar por el hilo de sync_to_async.
+    """
+    await agenda.aactual(sucursal_id)  # y el catálogo
+    await cierres.aactual(sucursal_id)
+    e, ahora = _estado(sucursal_id), time.monotonic()
+    faltan = _faltan(e, fecha, fecha, ahora)
+    if faltan:
+        _, minutos, _ = _sincronizar(sucursal_id)
+        _guardar(e, faltan, minutos, [fila async for fila in _citas(sucursal_id, faltan)], ahora)
+
+
+def _mascaras_ocupadas(sucursal_id, fecha):
+    """{recurso_id: bloques tomados} de `fecha` (no modificar: se comparte)."""
+    dias = _estado(sucursal_id).dias
+    while True:
+        d = dias.get(fecha)
+        if d is not None and d[0] > time.monotonic():
+            return d[1]
+        cargadas = precargar(sucursal_id, fecha, fecha)
+        if fecha in cargadas:
+            return cargadas[fecha]
+
+
+def horas_ocupadas(sucursal_id, fecha):
+    """
+    Bloques sin lugar: tomados por alguna cita y sin ningún recurso que
+    trabaje y esté libre en ellos.
+    """
+    horas, _, _ = _sincronizar(sucursal_id)
+    ocupadas = _mascaras_ocupadas(sucursal_id, fecha)
+    tomadas = 0
+    for m in ocupadas.values():
+        tomadas |= m
+    for rid, trabaja in agenda.actual(sucursal_id).aperturas(fecha).items():
+        tomadas &= ocupadas.get(rid, 0) | ~trabaja
+    return [h for i, h in enumerate(horas) if tomadas >> i & 1]
+
+
+def _inicios(sucursal_id, fecha, bloques, recurso_id=None):
+    """
+    {recurso_id: máscara de inicios libres} en `fecha` para una cita de
+    `bloques` bloques, de todos los recursos activos de la sucursal o solo
+    `recurso_id`.
+    - Si fecha == HOY: descarta las horas que ya pasaron (sin margen)
+    - Necesita `bloques` bloques libres y seguidos desde el inicio
+    - Un cierre (cierres.py) bloquea el día entero o desde su hora
+    - Solo bloques dentro del horario del día y de la jornada del recurso,
+      que empiecen según la granularidad (agenda.py)
+    """
+    ag = agenda.actual(sucursal_id)
+    dia = ag.dia(fecha)
+    if dia is None:
+        return {}
+    apertura, inicios = dia
+
+    _, minutos, continua = _sincronizar(sucursal_id)
+    comun = apertura
+
+    if fecha == timezone.localdate():
+        now = timezone.localtime(timezone.now())
+        ahora_min = now.hour * 60 + now.minute
+        for i, m in enumerate(minutos):
+            if m <= ahora_min:
+                comun &= ~(1 << i)
+
+    # Cierre parcial (ej. desde las 16:00): esos bloques no se pueden usar
+    cierre = cierres.actual(sucursal_id).cierre_desde(fecha)
+    if cierre is not None:
+        for i, m in enumerate(minutos):
+            if m + BLOQUE_MINUTOS > cierre:
+                comun &= ~(1 << i)
+
+    ocupadas = _mascaras_ocupadas(sucursal_id, fecha)
+    out = {}
+    for rid, trabaja in ag.aperturas(fecha).items():
+        if recurso_id is not None and rid != recurso_id:
+            continue
+        libres = comun & trabaja & ~ocupadas.get(rid, 0)
+        inicio = libres & inicios
+        for k in range(1, bloques):
+            inicio &= (libres >> k) & (continua >> (k - 1))
+        out[rid] = inicio
+    return out
+
+
+def _etiquetas(sucursal_id, mascara):
+    horas = _sincronizar(sucursal_id)[0]
+    return [h for i, h in enumerate(horas) if mascara >> i & 1]
+
+
+def _union(mascaras):
+    u = 0
+    for m in mascaras:
+        u |= m
+    return u
+
+
+def slots_libres(sucursal_id, fecha, servicio_id: int, addons_ids=(), recurso_id=None):
+    """
+    Horas de inicio en `fecha` en que algún recurso de la sucursal (o
+    `recurso_id`) está libre para el servicio más sus agregados (la duración
+    suma la de todos). Retorna None si el servicio no es de la sucursal.
+    """
+    cat = catalogo.actual(sucursal_id)
+    if servicio_id not in cat.servicio_por_id:
+        return None
+    bloques = bloques_de(cat.duracion(servicio_id, addons_ids))
+    return _etiquetas(sucursal_id, _union(_inicios(sucursal_id, fecha, bloques, recurso_id).values()))
+
+
+def slots_por_bloques(sucursal_id, fecha, bloques):
+    """
+    ({cantidad de bloques: horas con algún recurso libre},
+     {recurso_id: {cantidad de bloques: horas libres}}) para cada valor de `bloques`.
+    """
+    cualquiera, por_recurso = {}, {}
+    for b in bloques:
+        inicios = _inicios(sucursal_id, fecha, b)
+        cualquiera[b] = _etiquetas(sucursal_id, _union(inicios.values()))
+        for rid, m in inicios.items():
+            por_recurso.setdefault(rid, {})[b] = _etiquetas(sucursal_id, m)
+    return cualquiera, por_recurso
+
+
+def recursos_libres(sucursal_id, fecha, inicio, bloques):
+    """Recursos (en orden) libres para empezar una cita de `bloques` bloques a la hora `inicio` (time)."""
+    _, minutos, _ = _sincronizar(sucursal_id)
+    i = bisect_left(minutos, _minuto(inicio))
+    if i == len(minutos) or minutos[i] != _minuto(inicio):
+        return []
+    return [rid for rid, m in _inicios(sucursal_id, fecha, bloques).items() if m >> i & 1]
+
+
+def bloques_reservables(sucursal_id):
+    """Largos posibles de una cita en bloques: cada servicio base con cualquier combinación de agregados."""
+    cat = catalogo.actual(sucursal_id)
+    totales = {cat.duraciones[s.id] for s in cat.bases}
+    for a in cat.addons:
+        if cat.duraciones[a.id]:
+            totales |= {t + cat.duraciones[a.id] for t in totales}
+    return sorted({bloques_de(t) for t in totales})
+
+
+def limpiar(sucursal_id=None):
+    """Descarta los bitmaps de `sucursal_id` (None = de todas)."""
+    with _lock:
+        if sucursal_id is None:
+            _estados.clear()
+        else:
+            _estados.pop(sucursal_id, None)
+
+
+# =========================
+# Señales
+# =========================
+
+@receiver(post_save, sender=Horario, dispatch_uid="disponibilidad_horario_guardado")
+def _horario_guardado(sender, instance, created, update_fields=None, **kwargs):
+    # Solo si la transacción confirma (una reserva revertida no marca el bloque)
+    datos = (
+        instance.sucursal_id, instance.fecha, instance.recurso_id, instance.hora_inicio, instance.hora_fin,
+        instance.estado, created, update_fields,
+    )
+    transaction.on_commit(lambda: _aplicar_guardado(*datos))
+
+
+def _aplicar_guardado(sucursal_id, fecha, recurso_id, inicio, fin, estado, created, update_fields):
+    e = _estados.get(sucursal_id)
+    if e is None:
+        return
+    # Un guardado completo pudo mover la cita de fecha u hora: se descarta
+    # todo lo de su sucursal.
+    if not created and (update_fields is None or set(update_fields) - {"estado", "modified_at"}):
+        with e.lock:
+            e.dias.clear()
+        return
+
+    g = e.grilla
+    with e.lock:
+        d = e.dias.get(fecha)
+        if d is None:
+            return
+        if estado in ESTADOS_ACTIVOS and g is not None:
+            # Copia: quien leyó el dict anterior lo sigue viendo entero
+            m = dict(d[1])
+            m[recurso_id] = m.get(recurso_id, 0) | cubre(g[1], inicio, fin)
+            e.dias[fecha] = (d[0], m)
+        else:
+            # Liberar bloques requiere saber si otra cita activa los ocupa.
+            del e.dias[fecha]
+
+
+@receiver(post_delete, sender=Horario, dispatch_uid="disponibilidad_horario_borrado")
+def _horario_borrado(sender, instance, **kwargs):
+    e = _estados.get(instance.sucursal_id)
+    if e is not None:
+        with e.lock:
+            e.dias.pop(instance.fecha, None)
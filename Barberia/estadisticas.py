@@ -0,0 +1,119 @@
+# Barberia/estadisticas.py
+"""
+Mantenimiento del rollup EstadisticaDiaria.
+
+Cada cambio de Horario (creación, cancelación, cambio de estado, agregados)
+recalcula SOLO su día y su sucursal al confirmar la transacción: un GROUP BY
+sobre las citas de esa fecha en ese local (índice sucursal+fecha+estado).
+Así los agregados, que se insertan después del Horario, y las cancelaciones
+quedan bien contados sin llevar deltas a mano, y el movimiento de un local
+no bloquea ni recalcula a los otros. `recalcular_estadisticas` rellena
+rangos completos.
+
+Los ingresos usan el precio ACTUAL de cada servicio (como with_totals(), el
+export y el comprobante): al cambiar un precio se recalcula el rango de días
+con citas de ese servicio, como base o como agregado.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import EstadisticaDiaria, Horario, Tipo_servicio
+
+
+def recalcular_rango(sucursal_id, desde, hasta):
+    """Reconstruye el rollup de la sucursal en [desde, hasta). Retorna cuántas filas quedaron."""
+    with transaction.atomic():
+        citas = Horario.objects.filter(sucursal_id=sucursal_id, fecha__gte=desde, fecha__lt=hasta)
+        # Serializa recálculos concurrentes del mismo rango
+        list(citas.select_for_update().values_list("id"))
+
+        filas = (
+            citas
+            .with_totals()
+            .values("fecha", "Tipo_servicio_id", "estado")
+            .annotate(n=Count("id"), monto=Sum("monto_total"))
+            .order_by()
+        )
+        nuevas = [
+            EstadisticaDiaria(
+                sucursal_id=sucursal_id, fecha=f["fecha"], servicio_id=f["Tipo_servicio_id"], estado=f["estado"],
+                citas=f["n"], ingresos=f["monto"] or 0,
+            )
+            for f in filas
+        ]
+        EstadisticaDiaria.objects.filter(sucursal_id=sucursal_id, fecha__gte=desde, fecha__lt=hasta).delete()
+        EstadisticaDiaria.objects.bulk_create(nuevas)
+    return len(nuevas)
+
+
+def recalcular_dia(sucursal_id, fecha):
+    if fecha is not None:
+        recalcular_rango(sucursal_id, fecha, fecha + timedelta(days=1))
+
+
+def _programar(*dias):
+    """`dias`: pares (sucursal_id, fecha)."""
+    # robust: si el recálculo falla se registra en el log y la reserva ya
+    # confirmada no se cae (`recalcular_estadisticas` repara el rango)
+    for d in {d for d in dias if d[1] is not None}:
+        def recalcular(dia=d):
+            recalcular_dia(*dia)
+        transaction.on_commit(recalcular, robust=True)
+
+
+# =========================
+# Señales
+# =========================
+
+@receiver(pre_save, sender=Horario, dispatch_uid="estadisticas_horario_previo")
+def _horario_previo(sender, instance, update_fields=None, **kwargs):
+    # Un save completo (admin) puede mover la cita de fecha: recordar la anterior
+    if instance.pk and update_fields is None:
+        instance._dia_anterior = (
+            Horario.objects.filter(pk=instance.pk).values_list("sucursal_id", "fecha").first()
+        )
+
+
+@receiver(post_save, sender=Horario, dispatch_uid="estadisticas_horario_guardado")
+@receiver(post_delete, sender=Horario, dispatch_uid="estadisticas_horario_borrado")
+def _horario_cambiado(sender, instance, raw=False, **kwargs):
+    if not raw:
+        anterior = getattr(instance, "_dia_anterior", None)
+        _programar((instance.sucursal_id, instance.fecha), *([anterior] if anterior else []))
+
+
+@receiver(m2m_changed, sender=Horario.agregados.through, dispatch_uid="estadisticas_agregados")
+def _agregados_cambiados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        _programar((instance.sucursal_id, instance.fecha))
+    elif pk_set:
+        _programar(*Horario.objects.filter(pk__in=pk_set).values_list("sucursal_id", "fecha").distinct())
+
+
+@receiver(pre_save, sender=Tipo_servicio, dispatch_uid="estadisticas_servicio_previo")
+def _servicio_previo(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._precio_anterior = (
+            Tipo_servicio.objects.filter(pk=instance.pk).values_list("precio_servicio", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Tipo_servicio, dispatch_uid="estadisticas_servicio_guardado")
+def _servicio_guardado(sender, instance, created, raw=False, **kwargs):
+    anterior = getattr(instance, "_precio_anterior", None)
+    if created or raw or anterior is None or anterior == instance.precio_servicio:
+        return
+    rango = (
+        Horario.objects
+        .filter(Q(Tipo_servicio=instance) | Q(agregados=instance), sucursal_id=instance.sucursal_id)
+        .aggregate(desde=Min("fecha"), hasta=Max("fecha"))
+    )
+    if rango["desde"] is not None:
+        sid, desde, hasta = instance.sucursal_id, rango["desde"], rango["hasta"] + timedelta(days=1)
+        transaction.on_commit(lambda: recalcular_rango(sid, desde, hasta), robust=True)
@@ -0,0 +1,168 @@
+# Barberia/eventos.py
+"""
+Feed de eventos del calendario del panel (FullCalendar).
+
+- version_rango(): versión de un rango = (cantidad, max(modified_at)) en UNA
+  consulta agregada. Cualquier alta, cambio de estado o baja la mueve; de
+  ahí sale la ETag, así volver a una semana ya vista cuesta un 304.
+  Renombrar un cliente marca sus citas (señal de Usuario); los nombres de
+  servicio y recurso salen de las fotos en memoria, así que su versión
+  (version_nombres) también entra en la ETag y, si el cliente trae otra,
+  el modo delta reenvía todo el rango.
+- Modo delta (?updated_since=): solo las citas con modified_at posterior.
+  El cursor devuelto es el último cambio visto menos DELTA_MARGEN segundos,
+  para no perder escrituras que confirmaron tarde (el cliente reaplica
+  duplicados sin problema). Si nada cambió el cursor no avanza: la misma
+  URL vuelve a dar 304.
+- SerializadorEventos: escribe los eventos como texto JSON desde filas
+  `values_list` (sin instancias de Horario ni select_related) y los emite
+  como un arreglo compacto por lotes, para responder en streaming.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from json.encoder import encode_basestring_ascii
+
+from django.db.models import Count, Max
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import DIAS_SEMANA, Horario, Recurso, Tipo_servicio, Usuario
+
+DELTA_MARGEN = 10  # segundos
+EVENTOS_LOTE = 500  # filas por lote: iterator() de la BD y trozo de JSON emitido
+
+# Columnas que lee el feed, en el orden que espera SerializadorEventos.evento()
+CAMPOS_EVENTO = (
+    "id", "fecha", "hora_inicio", "hora_fin", "estado", "dia_semana", "Tipo_servicio_id", "recurso_id",
+    "usuario_horario__nombre", "usuario_horario__rut", "usuario_horario__celular",
+)
+
+COLOR_ESTADO = {
+    "P": "#f59e0b",
+    "A": "#22c55e",
+    "C": "#ef4444",
+}
+
+
+def version_rango(qs, *extra):
+    """(ETag entre comillas, último modified_at) del queryset `qs` SIN filtrar por estado."""
+    v = qs.order_by().aggregate(n=Count("id"), ultimo=Max("modified_at"))
+    ultimo = v["ultimo"]
+    datos = "|".join(map(str, (v["n"], ultimo.isoformat() if ultimo else "", *extra)))
+    return f'"{hashlib.sha256(datos.encode("utf-8")).hexdigest()[:32]}"', ultimo
+
+
+def version_nombres(cat, ag) -> str:
+    """Versión de los nombres que muestra el feed: catálogo (servicios) y agenda (recursos)."""
+    return f"{cat.version}.{ag.reglas.version}"
+
+
+def cursor_delta(ultimo, desde=None) -> str:
+    cursor = (ultimo or timezone.now()) - timedelta(seconds=DELTA_MARGEN)
+    if desde is not None:
+        cursor = max(cursor, desde)
+    return cursor.isoformat()
+
+
+_js = encode_basestring_ascii  # str -> literal JSON con comillas (implementación en C)
+
+
+def _js_o_null(valor):
+    return "null" if valor is None else _js(valor)
+
+
+class SerializadorEventos:
+    """
+    Eventos de FullCalendar escritos directo como texto JSON a partir de
+    filas `values_list(*CAMPOS_EVENTO)`.
+
+    Lo que no depende de la fila se arma una sola vez: el nombre de cada
+    servicio (del catálogo) y de cada recurso (de la agenda), el texto de
+    cada fecha y, por combinación (servicio, recurso, estado, día, inicio,
+    fin), las horas y el trozo fijo del
+    evento ya escapado. Por fila solo se escapan nombre, rut y celular:
+    sin instancias de modelo ni dicts intermedios.
+    """
+
+    def __init__(self, cat, recursos=None):
+        self.servicios = dict(cat.nombres)
+        self.recursos = dict(recursos or {})
+        self.estados = dict(Horario.ESTADOS)
+        self.dias = dict(DIAS_SEMANA)
+        self._fechas = {}
+        self._fijos = {}
+
+    def _servicio(self, servicio_id):
+        s = self.servicios.get(servicio_id)
+        if s is None:
+            # Servicio creado en otro worker y aún fuera de la foto del catálogo
+            s = self.servicios[servicio_id] = (
+                Tipo_servicio.objects.filter(pk=servicio_id).values_list("nombre", flat=True).first() or ""
+            )
+        return s
+
+    def _recurso(self, recurso_id):
+        r = self.recursos.get(recurso_id)
+        if r is None:
+            # Recurso inactivo (fuera de la agenda) o creado en otro worker
+            r = self.recursos[recurso_id] = (
+                Recurso.objects.filter(pk=recurso_id).values_list("nombre", flat=True).first() or ""
+            )
+        return r
+
+    def _fijo(self, clave):
+        servicio_id, recurso_id, estado, dia, hora, hora_fin = clave
+        servicio = self._servicio(servicio_id)
+        f = self._fijos[clave] = (
+            " · " + servicio,
+            "T" + hora.isoformat(),
+            "T" + hora_fin.isoformat(),
+            '"color":%s,"extendedProps":{"estado":%s,"servicio":%s,"recurso":%s,"hora":"%s","dia_semana":%s,' % (
+                _js(COLOR_ESTADO.get(estado, "#94a3b8")), _js(self.estados.get(estado, "")),
+                _js(servicio), _js(self._recurso(recurso_id)), f"{hora:%H:%M}", _js(self.dias.get(dia, "")),
+            ),
+        )
+        return f
+
+    def evento(self, fila) -> str:
+        """Un evento como objeto JSON (texto)."""
+        pk, fecha, hora, hora_fin, estado, dia, servicio_id, recurso_id, nombre, rut, celular = fila
+        clave = (servicio_id, recurso_id, estado, dia, hora, hora_fin)
+        titulo, inicio, fin, fijo = self._fijos.get(clave) or self._fijo(clave)
+        dia_iso = self._fechas.get(fecha)
+        if dia_iso is None:
+            dia_iso = self._fechas[fecha] = fecha.isoformat()
+        return (
+            f'{{"id":{pk},"title":{_js(f"{nombre}{titulo}")},"start":"{dia_iso}{inicio}","end":"{dia_iso}{fin}",'
+            f'{fijo}"rut":{_js_o_null(rut)},"celular":{_js_o_null(celular)}}}}}'
+        )
+
+    def arreglo_json(self, filas, lote=EVENTOS_LOTE):
+        """Arreglo JSON de los eventos de `filas`, en trozos de `lote` eventos."""
+        yield "["
+        sep = ""
+        buf = []
+        for fila in filas:
+            buf.append(self.evento(fila))
+            if len(buf) >= lote:
+                yield sep + ",".join(buf)
+                sep, buf = ",", []
+        if buf:
+            yield sep + ",".join(buf)
+        yield "]"
+
+
+def delta_json(eventos, removidos, cursor) -> str:
+    """Respuesta del modo delta; `eventos` ya viene como textos de SerializadorEventos.evento()."""
+    return '{"events":[%s],"removed":%s,"cursor":%s}' % (
+        ",".join(eventos), json.dumps(removidos), _js(cursor),
+    )
+
+
+@receiver(post_save, sender=Usuario, dispatch_uid="eventos_usuario_guardado")
+def _usuario_guardado(sender, instance, created, raw=False, **kwargs):
+    # El título y los datos del evento muestran al cliente: sus citas cambian de versión
+    if not (created or raw):
+        Horario.objects.filter(usuario_horario=instance).update(modified_at=timezone.now())
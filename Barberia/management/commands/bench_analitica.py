@@ -0,0 +1,106 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, Max, OuterRef
+
+from Barberia import analitica, sucursales
+from Barberia.models import EstadisticaDiaria, Horario
+
+SEMANA = lambda f: f - timedelta(days=f.weekday())  # noqa: E731
+
+
+def _ingresos_filas(sucursal_id, start, end):
+    """Agrupación anterior: todas las filas del rollup y suma por semana en Python."""
+    por_semana = {}
+    filas = (
+        EstadisticaDiaria.objects
+        .filter(sucursal_id=sucursal_id, fecha__gte=start, fecha__lt=end)
+        .exclude(estado="C")
+        .values_list("fecha", "ingresos")
+    )
+    for fecha, monto in filas:
+        k = SEMANA(fecha)
+        por_semana[k] = por_semana.get(k, 0) + monto
+    return [por_semana[k] for k in sorted(por_semana)]
+
+
+def _tasas_filas(sucursal_id, start, end):
+    """Agrupación anterior: estado + "tiene agregado" de cada cita, contados en Python."""
+    Agregado = Horario.agregados.through
+    filas = (
+        Horario.objects.filter(sucursal_id=sucursal_id, fecha__gte=start, fecha__lt=end)
+        .annotate(con_agregado=Exists(Agregado.objects.filter(horario_id=OuterRef("pk"))))
+        .values_list("estado", "con_agregado")
+    )
+    total = canceladas = con_agregado = 0
+    for estado, con in filas:
+        total += 1
+        if estado == "C":
+            canceladas += 1
+        elif con:
+            con_agregado += 1
+    return total, canceladas, con_agregado
+
+
+def _ocupacion_filas(sucursal_id, start, end):
+    """Agrupación anterior: (día, hora) de cada cita activa, contados en Python."""
+    conteo = {}
+    filas = (
+        Horario.objects
+        .filter(sucursal_id=sucursal_id, fecha__gte=start, fecha__lt=end, estado__in=["P", "A"])
+        .values_list("dia_semana", "hora_inicio", "hora_fin")
+    )
+    for celda in filas:
+        conteo[celda] = conteo.get(celda, 0) + 1
+    return conteo
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark de la analítica del panel: agrupar en SQL (values().annotate()) "
+        "vs traer una fila por cita y agrupar en Python."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=365, help="Rango hacia atrás desde la última cita")
+        parser.add_argument("--repeticiones", type=int, default=5)
+        parser.add_argument("--sucursal", help="slug (por defecto, la principal)")
+
+    def handle(self, *args, **options):
+        sucursal = sucursales.actual().buscar(options["sucursal"])
+        if sucursal is None:
+            raise CommandError("Sucursal no encontrada.")
+        ultima = Horario.objects.filter(sucursal=sucursal).aggregate(m=Max("fecha"))["m"]
+        if ultima is None:
+            raise CommandError("No hay citas: usa `manage.py bench_indices --seed N` primero.")
+        end = ultima + timedelta(days=1)
+        start = end - timedelta(days=options["dias"])
+        sid = sucursal.id
+        n = Horario.objects.filter(sucursal=sucursal, fecha__gte=start, fecha__lt=end).count()
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"== {n} citas ({start} → {end}) =="))
+        for nombre, filas, sql in [
+            ("ingresos por semana",
+             lambda: _ingresos_filas(sid, start, end),
+             lambda: analitica.ingresos(sid, start, end, "semana")),
+            ("tasas",
+             lambda: _tasas_filas(sid, start, end),
+             lambda: analitica.tasas(sid, start, end)),
+            ("ocupación",
+             lambda: _ocupacion_filas(sid, start, end),
+             lambda: analitica.ocupacion(sid, start, end)),
+        ]:
+            ms_filas, ms_sql = self._medir(filas, options["repeticiones"]), self._medir(sql, options["repeticiones"])
+            self.stdout.write(
+                f"{nombre:<22} filas+Python: {ms_filas:8.2f} ms   SQL: {ms_sql:8.2f} ms   x{ms_filas / ms_sql:5.1f}"
+            )
+
+    def _medir(self, fn, repeticiones):
+        mejor = None
+        for _ in range(max(1, repeticiones)):
+            t0 = time.perf_counter()
+            fn()
+            ms = (time.perf_counter() - t0) * 1000
+            mejor = ms if mejor is None else min(mejor, ms)
+        return mejor
@@ -0,0 +1,123 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.http import JsonResponse
+from django.utils.dateparse import parse_date
+from django.utils.text import compress_sequence
+
+from Barberia import agenda, catalogo, sucursales
+from Barberia.eventos import CAMPOS_EVENTO, COLOR_ESTADO, EVENTOS_LOTE, SerializadorEventos
+from Barberia.models import Horario
+
+
+def _evento_instancia(h):
+    """Serialización anterior del feed (instancias + select_related), como referencia."""
+    return {
+        "id": h.id,
+        "title": f"{h.usuario_horario.nombre} · {h.Tipo_servicio.nombre}",
+        "start": datetime.combine(h.fecha, h.hora_inicio).isoformat(),
+        "end": datetime.combine(h.fecha, h.hora_fin).isoformat(),
+        "color": COLOR_ESTADO.get(h.estado, "#94a3b8"),
+        "extendedProps": {
+            "estado": h.get_estado_display(),
+            "servicio": h.Tipo_servicio.nombre,
+            "recurso": h.recurso.nombre,
+            "hora": f"{h.hora_inicio:%H:%M}",
+            "dia_semana": h.get_dia_semana_display(),
+            "rut": h.usuario_horario.rut,
+            "celular": h.usuario_horario.celular,
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark del feed del calendario (panel_api_events): serialización "
+        "por instancias + JsonResponse vs proyección values_list + JSON en streaming."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="YYYY-MM-DD (inclusive; por defecto 31 días antes de --hasta)")
+        parser.add_argument("--hasta", help="YYYY-MM-DD (exclusivo; por defecto la última cita + 1)")
+        parser.add_argument("--repeticiones", type=int, default=5)
+        parser.add_argument("--sucursal", help="slug (por defecto, la principal)")
+
+    def handle(self, *args, **options):
+        sucursal = sucursales.actual().buscar(options["sucursal"])
+        if sucursal is None:
+            raise CommandError("Sucursal no encontrada.")
+        citas = Horario.objects.filter(sucursal=sucursal)
+        ultima = citas.aggregate(m=Max("fecha"))["m"]
+        if ultima is None:
+            raise CommandError("No hay citas: usa `manage.py bench_indices --seed N` primero.")
+        hasta = parse_date(options["hasta"]) if options["hasta"] else ultima + timedelta(days=1)
+        desde = parse_date(options["desde"]) if options["desde"] else hasta - timedelta(days=31)
+
+        qs = (
+            citas.filter(fecha__gte=desde, fecha__lt=hasta)
+            .exclude(estado="C")
+            .order_by("fecha", "hora_inicio")
+        )
+        cat = catalogo.actual(sucursal.id)
+        recursos = agenda.actual(sucursal.id).nombres_recurso
+
+        def instancias():
+            eventos = [_evento_instancia(h) for h in qs.select_related("usuario_horario", "Tipo_servicio", "recurso")]
+            return JsonResponse(eventos, safe=False).content
+
+        def proyeccion():
+            filas = qs.values_list(*CAMPOS_EVENTO).iterator(chunk_size=EVENTOS_LOTE)
+            return "".join(SerializadorEventos(cat, recursos).arreglo_json(filas)).encode("utf-8")
+
+        def proyeccion_gzip():
+            filas = qs.values_list(*CAMPOS_EVENTO).iterator(chunk_size=EVENTOS_LOTE)
+            partes = (p.encode("utf-8") for p in SerializadorEventos(cat, recursos).arreglo_json(filas))
+            return b"".join(compress_sequence(partes))
+
+        # Mismos eventos por ambos caminos antes de medir
+        antes, despues = json.loads(instancias()), json.loads(proyeccion())
+        if antes != despues:
+            raise CommandError("La proyección no produce los mismos eventos que la serialización anterior.")
+        n = len(antes)
+        if not n:
+            raise CommandError(f"No hay citas activas entre {desde} y {hasta}.")
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"== {n} eventos ({desde} → {hasta}) =="))
+        self._tabla(n, options["repeticiones"], [
+            ("instancias + JsonResponse", instancias),
+            ("proyección + streaming", proyeccion),
+            ("proyección + gzip", proyeccion_gzip),
+        ])
+
+        # Solo serialización (filas ya leídas): aísla el costo del driver de la BD
+        objetos = list(qs.select_related("usuario_horario", "Tipo_servicio", "recurso"))
+        filas = list(qs.values_list(*CAMPOS_EVENTO))
+        self.stdout.write(self.style.MIGRATE_HEADING("== Solo serialización (filas en memoria) =="))
+        self._tabla(n, options["repeticiones"], [
+            ("instancias + JsonResponse",
+             lambda: JsonResponse([_evento_instancia(h) for h in objetos], safe=False).content),
+            ("proyección",
+             lambda: "".join(SerializadorEventos(cat, recursos).arreglo_json(filas)).encode("utf-8")),
+        ])
+
+    def _tabla(self, n, repeticiones, caminos):
+        base = None
+        for nombre, fn in caminos:
+            ms, tam = self._medir(fn, repeticiones)
+            base = base or ms
+            self.stdout.write(
+                f"{nombre:<26} {ms:9.2f} ms  {n / ms:8.1f} eventos/ms  "
+                f"x{base / ms:5.1f}  {tam / 1024:8.1f} KiB"
+            )
+
+    def _medir(self, fn, repeticiones):
+        mejor = None
+        for _ in range(max(1, repeticiones)):
+            t0 = time.perf_counter()
+            cuerpo = fn()
+            ms = (time.perf_counter() - t0) * 1000
+            mejor = ms if mejor is None else min(mejor, ms)
+        return mejor, len(cuerpo)
@@ -0,0 +1,150 @@
+import random
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from Barberia import sucursales
+from Barberia.models import Horario, Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de índices de Horario: EXPLAIN + tiempo de las consultas típicas "
+        "de una sucursal con y sin los índices de Horario (que parten por la sucursal). "
+        "Usar SOLO en una BD de pruebas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sucursal", help="slug (por defecto, la principal)")
+        parser.add_argument("--seed", type=int, default=0,
+                            help="Inserta N citas sintéticas antes de medir (ej: 300000)")
+        parser.add_argument("--repeticiones", type=int, default=20)
+        parser.add_argument("--si-borrar", action="store_true",
+                            help="Correr aunque la BD no sea de pruebas (borra y recrea índices, siembra filas)")
+
+    def handle(self, *args, **options):
+        nombre = str(connection.settings_dict["NAME"])
+        if not (options["si_borrar"] or Path(nombre).name.startswith("test")):
+            raise CommandError(
+                f"La BD {nombre!r} no parece de pruebas (nombre 'test...'): este comando quita "
+                "los índices de Horario y puede sembrar miles de citas. Usa --si-borrar para forzar."
+            )
+        sucursal = sucursales.actual().buscar(options["sucursal"])
+        if sucursal is None:
+            raise CommandError("Sucursal no encontrada (ver `manage.py seed --sucursal`).")
+        if options["seed"]:
+            self._sembrar(sucursal, options["seed"])
+
+        citas = Horario.objects.filter(sucursal=sucursal)
+        if not citas.exists():
+            raise CommandError("No hay citas: usa --seed N (y antes `manage.py seed`).")
+
+        consultas = self._consultas(citas)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"== Con índices ({citas.count()} citas en {sucursal.slug}, "
+            f"{Horario.objects.count()} en total, {connection.vendor}) =="
+        ))
+        con = self._medir(consultas, options["repeticiones"])
+
+        indices = list(Horario._meta.indexes)
+        restricciones = list(Horario._meta.constraints)
+        with connection.schema_editor() as editor:
+            for r in restricciones:
+                editor.remove_constraint(Horario, r)
+            for i in indices:
+                editor.remove_index(Horario, i)
+        try:
+            self.stdout.write(self.style.MIGRATE_HEADING("== Sin índices =="))
+            sin = self._medir(consultas, options["repeticiones"])
+        finally:
+            with connection.schema_editor() as editor:
+                for i in indices:
+                    editor.add_index(Horario, i)
+                for r in restricciones:
+                    editor.add_constraint(Horario, r)
+
+        self.stdout.write(self.style.MIGRATE_HEADING("== Resumen (ms promedio) =="))
+        for nombre in consultas:
+            self.stdout.write(f"{nombre:<28} sin: {sin[nombre]:8.2f}   con: {con[nombre]:8.2f}")
+
+    def _consultas(self, citas):
+        ref = citas.order_by("-fecha").values_list("fecha", "hora_horario_id").first()
+        fecha, hora_id = ref
+        servicio_id = citas.values_list("Tipo_servicio_id", flat=True).first()
+        mes = fecha - timedelta(days=30)
+        return {
+            "slots del día": citas
+                .filter(fecha=fecha, estado__in=["P", "A"])
+                .values_list("hora_horario_id", flat=True),
+            "conflicto fecha+hora": citas
+                .filter(fecha=fecha, hora_horario_id=hora_id, estado__in=["P", "A"]),
+            "calendario (mes)": citas
+                .filter(fecha__gte=mes, fecha__lt=fecha)
+                .exclude(estado="C")
+                .order_by("fecha", "hora_inicio"),
+            "stats por servicio (mes)": citas
+                .filter(fecha__gte=mes, fecha__lt=fecha, Tipo_servicio_id=servicio_id)
+                .exclude(estado="C"),
+            "canceladas (mes)": citas
+                .filter(fecha__gte=mes, fecha__lt=fecha, estado="C")
+                .order_by("fecha", "hora_inicio"),
+        }
+
+    def _medir(self, consultas, repeticiones):
+        tiempos = {}
+        for nombre, qs in consultas.items():
+            self.stdout.write(self.style.SUCCESS(f"-- {nombre}"))
+            self.stdout.write(qs.explain())
+            t0 = time.perf_counter()
+            for _ in range(repeticiones):
+                list(qs[:500])
+            tiempos[nombre] = (time.perf_counter() - t0) * 1000 / repeticiones
+        return tiempos
+
+    def _sembrar(self, sucursal, n):
+        horas = list(sucursal.horas.order_by("hora_Horas").values_list("id", "hora_Horas"))
+        servicios = list(sucursal.servicios.filter(tipo="BASE").values_list("id", "duracion_minutos"))
+        recurso = sucursal.recursos.filter(activo=True).order_by("id").first()
+        if not (horas and servicios and recurso):
+            raise CommandError("Falta catálogo: corre primero `manage.py seed`.")
+
+        rnd = random.Random(42)
+        with transaction.atomic():
+            Usuario.objects.bulk_create([
+                Usuario(nombre=f"Cliente {i}", celular="+56912345678", rut="11.111.111-1")
+                for i in range(2000)
+            ])
+            # (MySQL no devuelve pks en bulk_create)
+            usuarios = list(Usuario.objects.order_by("-id").values_list("id", flat=True)[:2000])
+            # Un bloque por cita: días consecutivos (sin domingos) hacia atrás desde hoy
+            fecha = date.today()
+            lote = []
+            for i in range(n):
+                if i % len(horas) == 0:
+                    fecha -= timedelta(days=1)
+                    if fecha.weekday() == 6:
+                        fecha -= timedelta(days=1)
+                hora_id, hora = horas[i % len(horas)]
+                servicio_id, minutos = rnd.choice(servicios)
+                lote.append(Horario(
+                    sucursal=sucursal,
+                    usuario_horario_id=rnd.choice(usuarios),
+                    hora_horario_id=hora_id,
+                    hora_inicio=hora,
+                    duracion_minutos=minutos,
+                    hora_fin=Horario.calcular_fin(hora, minutos),
+                    Tipo_servicio_id=servicio_id,
+                    recurso=recurso,
+                    dia_semana=fecha.weekday(),
+                    fecha=fecha,
+                    estado="C" if rnd.random() < 0.1 else "A",
+                ))
+                if len(lote) >= 5000:
+                    Horario.objects.bulk_create(lote)
+                    lote = []
+            if lote:
+                Horario.objects.bulk_create(lote)
+        self.stdout.write(self.style.SUCCESS(f"Sembradas {n} citas en {sucursal.slug}."))
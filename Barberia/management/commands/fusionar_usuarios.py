@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from Barberia.clientes import fusionar_duplicados
+from Barberia.models import Horario, Usuario
+
+
+class Command(BaseCommand):
+    help = "Fusiona clientes duplicados por RUT y repunta sus citas (por lotes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=500, help="RUTs por transacción")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Solo cuenta el primer lote, no modifica nada")
+
+    def handle(self, *args, **options):
+        ruts, borrados = fusionar_duplicados(
+            Usuario, Horario, lote=options["lote"], dry_run=options["dry_run"]
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"(dry-run) Primer lote: {ruts} RUTs, {borrados} duplicados.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Fusionados {ruts} RUTs; {borrados} usuarios duplicados eliminados."
+        ))
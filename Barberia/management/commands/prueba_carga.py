@@ -0,0 +1,72 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga HTTP (stdlib asyncio): N clientes concurrentes pidiendo "
+        "una URL durante S segundos. Sirve para comparar el despliegue WSGI "
+        "(gunicorn sync) con ASGI (uvicorn) con la misma cantidad de workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Ej: http://127.0.0.1:8000/api/slots?fecha=2030-01-07&servicio=1")
+        parser.add_argument("--concurrencia", type=int, default=50)
+        parser.add_argument("--segundos", type=float, default=10.0)
+        parser.add_argument("--timeout", type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        partes = urlsplit(options["url"])
+        if partes.scheme != "http" or not partes.hostname:
+            raise CommandError("Solo URLs http://host[:puerto]/ruta")
+
+        latencias, errores = asyncio.run(self._correr(
+            partes.hostname, partes.port or 80,
+            (partes.path or "/") + (f"?{partes.query}" if partes.query else ""),
+            options["concurrencia"], options["segundos"], options["timeout"],
+        ))
+
+        total = len(latencias)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"== {options['url']}  ({options['concurrencia']} clientes, {options['segundos']:.0f} s) =="
+        ))
+        self.stdout.write(f"OK: {total}   errores: {errores}   req/s: {total / options['segundos']:.1f}")
+        if total:
+            q = statistics.quantiles(latencias, n=100) if total > 1 else latencias * 99
+            self.stdout.write(
+                f"latencia ms  p50: {q[49]:.1f}  p95: {q[94]:.1f}  p99: {q[98]:.1f}  máx: {max(latencias):.1f}"
+            )
+
+    async def _correr(self, host, puerto, ruta, concurrencia, segundos, timeout):
+        latencias, errores = [], 0
+        fin = time.monotonic() + segundos
+        pedido = (
+            f"GET {ruta} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n"
+        ).encode()
+
+        async def cliente():
+            nonlocal errores
+            while time.monotonic() < fin:
+                t0 = time.perf_counter()
+                try:
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection(host, puerto), timeout
+                    )
+                    writer.write(pedido)
+                    await writer.drain()
+                    respuesta = await asyncio.wait_for(reader.read(), timeout)
+                    writer.close()
+                except (OSError, asyncio.TimeoutError):
+                    errores += 1
+                    continue
+                if respuesta.startswith((b"HTTP/1.1 200", b"HTTP/1.0 200")):
+                    latencias.append((time.perf_counter() - t0) * 1000)
+                else:
+                    errores += 1
+
+        await asyncio.gather(*(cliente() for _ in range(concurrencia)))
+        return latencias, errores
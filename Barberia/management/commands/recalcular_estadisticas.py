@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils.dateparse import parse_date
+
+from Barberia.estadisticas import recalcular_rango
+from Barberia.models import Horario, Sucursal
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el rollup EstadisticaDiaria (por defecto, toda la historia de cada sucursal)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sucursal", help="slug (por defecto, todas las sucursales)")
+        parser.add_argument("--desde", help="YYYY-MM-DD (inclusive)")
+        parser.add_argument("--hasta", help="YYYY-MM-DD (exclusivo)")
+        parser.add_argument("--dias-por-lote", type=int, default=31)
+
+    def handle(self, *args, **options):
+        sucursales = Sucursal.objects.order_by("id")
+        if options["sucursal"]:
+            sucursales = sucursales.filter(slug=options["sucursal"])
+            if not sucursales.exists():
+                raise CommandError(f"No existe la sucursal {options['sucursal']!r}.")
+        for sucursal in sucursales:
+            self._recalcular(sucursal, options)
+
+    def _recalcular(self, sucursal, options):
+        limites = Horario.objects.filter(sucursal=sucursal).aggregate(min=Min("fecha"), max=Max("fecha"))
+        desde = parse_date(options["desde"]) if options["desde"] else limites["min"]
+        hasta = (
+            parse_date(options["hasta"]) if options["hasta"]
+            else (limites["max"] + timedelta(days=1) if limites["max"] else None)
+        )
+        if not (desde and hasta):
+            self.stdout.write(f"[{sucursal.slug}] No hay citas con fecha: nada que recalcular.")
+            return
+        if desde >= hasta:
+            raise CommandError("--desde debe ser anterior a --hasta.")
+
+        paso = timedelta(days=max(1, options["dias_por_lote"]))
+        total = 0
+        inicio = desde
+        while inicio < hasta:
+            fin = min(inicio + paso, hasta)
+            total += recalcular_rango(sucursal.id, inicio, fin)
+            inicio = fin
+        self.stdout.write(self.style.SUCCESS(
+            f"[{sucursal.slug}] Rollup recalculado {desde} → {hasta}: {total} filas."
+        ))
@@ -1,50 +1,68 @@
 from django.core.management.base import BaseCommand
-from Barberia.models import Dias, Horas, Tipo_servicio, Horario
+from Barberia.agenda import NOMBRES_DIA, REGLAS_POR_DEFECTO, bloques_entre
+from Barberia.models import (
+    ConfiguracionAgenda, Dias, ExcepcionAgenda, Horas, Horario, Recurso, ReglaAgenda, Sucursal,
+    Tipo_servicio,
+)
 
 class Command(BaseCommand):
-    help = "Seed completo: días, horas, servicios BASE/ADDON + migración segura"
+    help = (
+        "Seed completo de una sucursal (la principal por defecto): días, reglas de atención, "
+        "horas, servicios BASE/ADDON + migración segura"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sucursal", default="principal",
+                            help="slug de la sucursal (se crea si no existe)")
+        parser.add_argument("--nombre", help="nombre de la sucursal al crearla")
+        parser.add_argument("--dominio", help="dominio propio de la sucursal (opcional)")
 
     def handle(self, *args, **options):
+        slug = options["sucursal"]
+        sucursal, _ = Sucursal.objects.get_or_create(
+            slug=slug, defaults={"nombre": options["nombre"] or slug.replace("-", " ").title()}
+        )
+        if options["dominio"] and sucursal.dominio != options["dominio"]:
+            sucursal.dominio = options["dominio"]
+            sucursal.save(update_fields=["dominio"])
 
-        # 1) DÍAS
-        dias = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado"]
-        for d in dias:
+        # 1) DÍAS (compartidos por todas las sucursales)
+        for d in NOMBRES_DIA:
             Dias.objects.get_or_create(dia_Dias=d)
 
-        # 2) HORAS
-        horas = set()
-
-        def agregar_rango(h_inicio, h_fin, incluye_media_hora_final=True):
-            h = h_inicio
-            m = 0
-            while True:
-                horas.add(f"{h:02d}:{m:02d}")
-                if h == h_fin and ((m == 30 and incluye_media_hora_final) or (m == 0 and not incluye_media_hora_final)):
-                    break
-                m += 30
-                if m >= 60:
-                    m = 0
-                    h += 1
+        # 2) REGLAS DE ATENCIÓN + HORAS (la grilla cubre todos los horarios)
+        if not sucursal.reglas.exists():
+            for dia, (abre, cierra) in REGLAS_POR_DEFECTO.items():
+                ReglaAgenda.objects.create(sucursal=sucursal, dia_semana=dia, abre=abre, cierra=cierra)
+        ConfiguracionAgenda.objects.get_or_create(sucursal=sucursal)
 
-        agregar_rango(12, 19, True)   # Lun–Vie
-        agregar_rango(12, 15, False)  # Sábado
+        horas = set()
+        for modelo in (ReglaAgenda, ExcepcionAgenda):
+            for abre, cierra in modelo.objects.filter(sucursal=sucursal).values_list("abre", "cierra"):
+                horas.update(bloques_entre(abre, cierra))
 
         for h in sorted(horas):
-            Horas.objects.get_or_create(hora_Horas=h)
+            Horas.objects.get_or_create(sucursal=sucursal, hora_Horas=h)
+
+        # Al menos una silla (sin jornadas: atiende todo el horario del local)
+        if not sucursal.recursos.exists():
+            Recurso.objects.create(sucursal=sucursal, nombre="Silla 1")
 
         # 3) SERVICIOS NUEVOS
+        # (nombre, precio, tipo, minutos): los agregados no suman tiempo por defecto
         servicios = [
-            ("Corte de pelo", 8000, "BASE"),
-            ("Limpieza facial", 10000, "BASE"),
-            ("Perfilado de barba", 3000, "ADDON"),
-            ("Perfilado de cejas", 2000, "ADDON"),
-            ("Líneas", 1000, "ADDON"),
+            ("Corte de pelo", 8000, "BASE", 30),
+            ("Limpieza facial", 10000, "BASE", 30),
+            ("Perfilado de barba", 3000, "ADDON", 0),
+            ("Perfilado de cejas", 2000, "ADDON", 0),
+            ("Líneas", 1000, "ADDON", 0),
         ]
 
-        for nombre, precio, tipo in servicios:
+        for nombre, precio, tipo, minutos in servicios:
             Tipo_servicio.objects.update_or_create(
+                sucursal=sucursal,
                 nombre=nombre,
-                defaults={"precio_servicio": precio, "tipo": tipo},
+                defaults={"precio_servicio": precio, "tipo": tipo, "duracion_minutos": minutos},
             )
 
         # 4) MIGRACIÓN SEGURA (clave)
@@ -56,14 +74,16 @@ class Command(BaseCommand):
 
         for viejo, nuevo in mapa.items():
             try:
-                s_viejo = Tipo_servicio.objects.get(nombre=viejo)
-                s_nuevo = Tipo_servicio.objects.get(nombre=nuevo)
+                s_viejo = sucursal.servicios.get(nombre=viejo)
+                s_nuevo = sucursal.servicios.get(nombre=nuevo)
             except Tipo_servicio.DoesNotExist:
                 continue
 
             Horario.objects.filter(Tipo_servicio=s_viejo).update(Tipo_servicio=s_nuevo)
 
         # 5) LIMPIEZA FINAL
-        Tipo_servicio.objects.filter(nombre__in=mapa.keys()).delete()
+        sucursal.servicios.filter(nombre__in=mapa.keys()).delete()
 
-        self.stdout.write(self.style.SUCCESS("Seed completo ejecutado correctamente."))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(
+            f"Seed completo ejecutado correctamente (sucursal {sucursal.slug})."
+        ))
\ No newline at end of file
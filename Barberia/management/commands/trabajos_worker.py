@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from Barberia import trabajos
+
+
+def _correr(trabajo):
+    # Cada hilo/proceso abre su propia conexión: se cierra al terminar
+    try:
+        return trabajos.ejecutar(trabajo)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de trabajos (Excel / PDF) en un pool de hilos o procesos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=2,
+                            help="Trabajos en paralelo (default 2)")
+        parser.add_argument("--procesos", action="store_true",
+                            help="Usar un pool de procesos en vez de hilos")
+        parser.add_argument("--intervalo", type=float, default=1.0,
+                            help="Segundos entre revisiones de la cola")
+        parser.add_argument("--una-vez", action="store_true",
+                            help="Procesa lo pendiente y termina (útil para cron)")
+        parser.add_argument("--retencion-horas", type=int, default=24,
+                            help="Borra trabajos terminados hace más de N horas")
+
+    def handle(self, *args, **options):
+        n = max(1, options["hilos"])
+        if options["procesos"]:
+            # Las conexiones no deben heredarse a los procesos hijos
+            connections.close_all()
+            Pool = ProcessPoolExecutor
+        else:
+            Pool = ThreadPoolExecutor
+
+        self.stdout.write(f"Worker iniciado ({n} {'procesos' if options['procesos'] else 'hilos'})")
+        ultima_purga = ultima_revision = 0.0
+        en_curso = set()
+
+        with Pool(max_workers=n) as pool:
+            try:
+                while True:
+                    en_curso = {f for f in en_curso if not f.done()}
+                    if time.monotonic() - ultima_revision > 60:
+                        reencolados = trabajos.reencolar_vencidos()
+                        if reencolados:
+                            self.stdout.write(f"Reencolados {reencolados} trabajos con el plazo vencido")
+                        ultima_revision = time.monotonic()
+                    while len(en_curso) < n:
+                        t = trabajos.reclamar()
+                        if t is None:
+                            break
+                        self.stdout.write(f"-> {t}")
+                        en_curso.add(pool.submit(_correr, t))
+
+                    if time.monotonic() - ultima_purga > 3600:
+                        borrados = trabajos.purgar(options["retencion_horas"])
+                        if borrados:
+                            self.stdout.write(f"Purgados {borrados} trabajos antiguos")
+                        ultima_purga = time.monotonic()
+
+                    if options["una_vez"] and not en_curso:
+                        break
+                    time.sleep(options["intervalo"])
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING("Deteniendo worker..."))
+
+        self.stdout.write(self.style.SUCCESS("Worker detenido."))
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.23 on 2026-10-18 15:41
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0010_horario_agregados_tipo_servicio_tipo_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trabajo',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('EXCEL', 'Export Excel'), ('PDF', 'Comprobante PDF')], max_length=10)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('P', 'Pendiente'), ('E', 'En curso'), ('L', 'Listo'), ('F', 'Fallido')], default='P', max_length=1)),
+                ('archivo', models.CharField(blank=True, max_length=255)),
+                ('nombre_archivo', models.CharField(blank=True, max_length=100)),
+                ('error', models.TextField(blank=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('terminado', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'creado'], name='Barberia_tr_estado_2af506_idx')],
+            },
+        ),
+    ]
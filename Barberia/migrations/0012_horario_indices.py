@@ -0,0 +1,75 @@
+# Generated by Django 4.2.23 on 2026-10-18 15:42
+
+import os
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def revisar_duplicadas(apps, schema_editor):
+    """
+    La restricción única exige una sola cita activa por (fecha, hora).
+    Si hay duplicadas (carreras previas al lock) la migración se detiene y
+    lista los ids, para que se resuelvan a mano. Con
+    BARBERIA_CANCELAR_DUPLICADAS=1 se conserva la más antigua de cada bloque
+    y las demás quedan Canceladas, imprimiendo sus ids.
+    """
+    Horario = apps.get_model('Barberia', 'Horario')
+    dups = (
+        Horario.objects.filter(estado__in=['P', 'A'])
+        .values('fecha', 'hora_horario')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+    )
+    conflictos = []
+    for d in dups:
+        ids = list(
+            Horario.objects
+            .filter(fecha=d['fecha'], hora_horario=d['hora_horario'], estado__in=['P', 'A'])
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        conflictos.append((d['fecha'], d['hora_horario'], ids))
+    if not conflictos:
+        return
+
+    detalle = "\n".join(
+        f"  {fecha} hora_horario={hora}: citas {', '.join(map(str, ids))}"
+        for fecha, hora, ids in conflictos
+    )
+    if os.environ.get('BARBERIA_CANCELAR_DUPLICADAS') != '1':
+        raise RuntimeError(
+            "Hay citas activas duplicadas en el mismo bloque:\n" + detalle +
+            "\nCancela o mueve las sobrantes y vuelve a migrar, o usa "
+            "BARBERIA_CANCELAR_DUPLICADAS=1 para dejar solo la más antigua de cada bloque."
+        )
+    for fecha, hora, ids in conflictos:
+        Horario.objects.filter(id__in=ids[1:]).update(estado='C')
+        print(f"Cita(s) {', '.join(map(str, ids[1:]))} canceladas: duplicaban a la {ids[0]} ({fecha}).")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0011_trabajo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='horario',
+            index=models.Index(fields=['fecha', 'estado'], name='horario_fecha_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='horario',
+            index=models.Index(fields=['fecha', 'hora_horario', 'estado'], name='horario_fecha_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='horario',
+            index=models.Index(fields=['Tipo_servicio', 'fecha'], name='horario_servicio_fecha_idx'),
+        ),
+        migrations.RunPython(revisar_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='horario',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['P', 'A'])), fields=('fecha', 'hora_horario'), name='horario_unico_activo'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+def poblar_rut_normalizado(apps, schema_editor):
+    from Barberia.utils import normalizar_rut
+
+    Usuario = apps.get_model('Barberia', 'Usuario')
+    lote = []
+    for u in Usuario.objects.only('id', 'rut').iterator(chunk_size=2000):
+        u.rut_normalizado = normalizar_rut(u.rut)
+        lote.append(u)
+        if len(lote) >= 2000:
+            Usuario.objects.bulk_update(lote, ['rut_normalizado'])
+            lote = []
+    if lote:
+        Usuario.objects.bulk_update(lote, ['rut_normalizado'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0012_horario_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='rut_normalizado',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(poblar_rut_normalizado, migrations.RunPython.noop),
+    ]
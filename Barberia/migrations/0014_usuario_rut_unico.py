@@ -0,0 +1,35 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+def fusionar(apps, schema_editor):
+    """
+    El índice único exige un Usuario por RUT. En BDs grandes conviene correr
+    antes `manage.py fusionar_usuarios` (por lotes); aquí se fusiona lo que quede.
+    """
+    from Barberia.clientes import fusionar_duplicados
+
+    fusionar_duplicados(
+        apps.get_model('Barberia', 'Usuario'),
+        apps.get_model('Barberia', 'Horario'),
+    )
+
+
+class Migration(migrations.Migration):
+    # Cada lote de la fusión hace commit propio, y en Postgres el ALTER no puede
+    # ir en la misma transacción que los UPDATE sobre FKs diferidas.
+    atomic = False
+
+    dependencies = [
+        ('Barberia', '0013_usuario_rut_normalizado'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='usuario',
+            name='rut_normalizado',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def poblar_terminos(apps, schema_editor):
+    from Barberia.utils import terminos_busqueda
+
+    Usuario = apps.get_model('Barberia', 'Usuario')
+    TerminoBusqueda = apps.get_model('Barberia', 'TerminoBusqueda')
+    lote = []
+    for u in Usuario.objects.only('id', 'nombre', 'rut').iterator(chunk_size=2000):
+        lote.extend(
+            TerminoBusqueda(usuario_id=u.id, termino=t) for t in terminos_busqueda(u.nombre, u.rut)
+        )
+        if len(lote) >= 5000:
+            TerminoBusqueda.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        TerminoBusqueda.objects.bulk_create(lote)
+
+
+def indice_trigramas(apps, schema_editor):
+    # Solo Postgres: búsqueda a mitad de palabra (LIKE '%x%') con GIN.
+    # CREATE EXTENSION requiere permisos; en hosting administrado suele estar habilitado.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS termino_busqueda_trgm '
+        'ON "Barberia_terminobusqueda" USING gin (termino gin_trgm_ops)'
+    )
+
+
+def quitar_indice_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS termino_busqueda_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0014_usuario_rut_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TerminoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termino', models.CharField(max_length=50)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terminos', to='Barberia.usuario')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['termino', 'usuario'], name='termino_busqueda_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_terminos, migrations.RunPython.noop),
+        migrations.RunPython(indice_trigramas, quitar_indice_trigramas),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.23 on 2026-10-18 18:20
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def poblar_rollup(apps, schema_editor):
+    """Carga inicial: base y agregados en dos GROUP BY, unidos en Python."""
+    Horario = apps.get_model('Barberia', 'Horario')
+    EstadisticaDiaria = apps.get_model('Barberia', 'EstadisticaDiaria')
+    Agregado = Horario.agregados.through
+
+    filas = defaultdict(lambda: [0, 0])
+    base = (
+        Horario.objects.exclude(fecha=None)
+        .values_list('fecha', 'Tipo_servicio_id', 'estado')
+        .annotate(n=Count('id'), monto=Sum('Tipo_servicio__precio_servicio'))
+        .order_by()
+    )
+    for fecha, servicio, estado, n, monto in base:
+        filas[(fecha, servicio, estado)] = [n, monto or 0]
+
+    extras = (
+        Agregado.objects.exclude(horario__fecha=None)
+        .values_list('horario__fecha', 'horario__Tipo_servicio_id', 'horario__estado')
+        .annotate(monto=Sum('tipo_servicio__precio_servicio'))
+        .order_by()
+    )
+    for fecha, servicio, estado, monto in extras:
+        filas[(fecha, servicio, estado)][1] += monto or 0
+
+    EstadisticaDiaria.objects.bulk_create([
+        EstadisticaDiaria(fecha=f, servicio_id=s, estado=e, citas=n, ingresos=m)
+        for (f, s, e), (n, m) in filas.items()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0015_terminobusqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('estado', models.CharField(choices=[('P', 'Pendiente'), ('A', 'Atendida'), ('C', 'Cancelada')], max_length=1)),
+                ('citas', models.PositiveIntegerField(default=0)),
+                ('ingresos', models.PositiveIntegerField(default=0)),
+                ('servicio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas', to='Barberia.tipo_servicio')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['servicio', 'fecha'], name='estadistica_servicio_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='estadisticadiaria',
+            constraint=models.UniqueConstraint(fields=('fecha', 'servicio', 'estado'), name='estadistica_dia_unica'),
+        ),
+        migrations.RunPython(poblar_rollup, migrations.RunPython.noop),
+    ]
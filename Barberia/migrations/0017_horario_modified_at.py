@@ -0,0 +1,22 @@
+# Generated by Django 4.2.23 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0016_estadisticadiaria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='horario',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='horario',
+            index=models.Index(fields=['fecha', 'modified_at'], name='horario_fecha_modif_idx'),
+        ),
+    ]
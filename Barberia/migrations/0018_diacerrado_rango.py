@@ -0,0 +1,27 @@
+# Generated by Django 4.2.23 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0017_horario_modified_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diacerrado',
+            name='desde_hora',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='diacerrado',
+            name='hasta',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='diacerrado',
+            constraint=models.CheckConstraint(check=models.Q(('hasta__isnull', True), ('hasta__gte', models.F('fecha')), _connector='OR'), name='cierre_rango_valido'),
+        ),
+    ]
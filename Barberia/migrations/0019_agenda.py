@@ -0,0 +1,74 @@
+# Generated by Django 4.2.23 on 2026-10-18 19:45
+
+import datetime
+
+from django.db import migrations, models
+
+
+def reglas_actuales(apps, schema_editor):
+    # El horario que antes estaba fijo en seed.py: Lun–Vie 12:00–20:00
+    # (último bloque 19:30) y sábado 12:00–15:30 (último bloque 15:00)
+    ReglaAgenda = apps.get_model("Barberia", "ReglaAgenda")
+    ConfiguracionAgenda = apps.get_model("Barberia", "ConfiguracionAgenda")
+    for dia in range(6):
+        ReglaAgenda.objects.get_or_create(
+            dia_semana=dia,
+            defaults={
+                "abre": datetime.time(12, 0),
+                "cierra": datetime.time(15, 30) if dia == 5 else datetime.time(20, 0),
+            },
+        )
+    if not ConfiguracionAgenda.objects.exists():
+        ConfiguracionAgenda.objects.create(granularidad_minutos=30, horizonte_dias=7)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0018_diacerrado_rango'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfiguracionAgenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularidad_minutos', models.PositiveSmallIntegerField(default=30)),
+                ('horizonte_dias', models.PositiveSmallIntegerField(default=7)),
+            ],
+            options={
+                'verbose_name': 'Configuración de agenda',
+            },
+        ),
+        migrations.CreateModel(
+            name='ExcepcionAgenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('abre', models.TimeField()),
+                ('cierra', models.TimeField()),
+                ('motivo', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReglaAgenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')], unique=True)),
+                ('abre', models.TimeField()),
+                ('cierra', models.TimeField()),
+            ],
+            options={
+                'ordering': ['dia_semana'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reglaagenda',
+            constraint=models.CheckConstraint(check=models.Q(('cierra__gt', models.F('abre'))), name='regla_agenda_rango'),
+        ),
+        migrations.AddConstraint(
+            model_name='excepcionagenda',
+            constraint=models.CheckConstraint(check=models.Q(('cierra__gt', models.F('abre'))), name='excepcion_agenda_rango'),
+        ),
+        migrations.RunPython(reglas_actuales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.23 on 2026-10-18 20:10
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models.functions import ExtractIsoWeekDay
+
+NOMBRES_DIA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+
+
+def _a_time(texto):
+    try:
+        hh, mm = map(int, (texto or "").strip().split(":")[:2])
+        return datetime.time(hh, mm)
+    except ValueError:
+        return None
+
+
+def convertir(apps, schema_editor):
+    Horas = apps.get_model("Barberia", "Horas")
+    Horario = apps.get_model("Barberia", "Horario")
+    Dias = apps.get_model("Barberia", "Dias")
+
+    # "12:30" -> time(12, 30); las citas copian la hora de su bloque
+    invalidas = []
+    for h in Horas.objects.all():
+        h.hora_nueva = _a_time(h.hora_Horas)
+        if h.hora_nueva is None:
+            invalidas.append(f"{h.id}={h.hora_Horas!r}")
+            continue
+        h.save(update_fields=["hora_nueva"])
+        Horario.objects.filter(hora_horario_id=h.id).update(hora_inicio=h.hora_nueva)
+    if invalidas:
+        raise RuntimeError(f"Horas con formato inválido (corregir a HH:MM): {', '.join(invalidas)}")
+
+    # Día de semana 0=lunes desde la fecha; sin fecha, desde el nombre en Dias
+    Horario.objects.filter(fecha__isnull=False).update(dia_semana=ExtractIsoWeekDay("fecha") - 1)
+    for d in Dias.objects.filter(dia_Dias__in=NOMBRES_DIA):
+        Horario.objects.filter(fecha__isnull=True, dia_horario=d).update(
+            dia_semana=NOMBRES_DIA.index(d.dia_Dias)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0019_agenda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='horas',
+            name='hora_nueva',
+            field=models.TimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='horario',
+            name='dia_semana',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')], editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='horario',
+            name='hora_inicio',
+            field=models.TimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(convertir, migrations.RunPython.noop),
+    ]
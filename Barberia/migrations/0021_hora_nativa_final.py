@@ -0,0 +1,42 @@
+# Generated by Django 4.2.23 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separada de 0020: en Postgres no se altera una tabla con
+    # actualizaciones pendientes en la misma transacción
+
+    dependencies = [
+        ('Barberia', '0020_hora_nativa'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='horas',
+            name='hora_Horas',
+        ),
+        migrations.RenameField(
+            model_name='horas',
+            old_name='hora_nueva',
+            new_name='hora_Horas',
+        ),
+        migrations.AlterField(
+            model_name='horas',
+            name='hora_Horas',
+            field=models.TimeField(),
+        ),
+        migrations.AlterField(
+            model_name='horario',
+            name='hora_inicio',
+            field=models.TimeField(editable=False),
+        ),
+        migrations.RemoveField(
+            model_name='horario',
+            name='dia_horario',
+        ),
+        migrations.AddIndex(
+            model_name='horario',
+            index=models.Index(fields=['fecha', 'hora_inicio'], name='horario_fecha_inicio_idx'),
+        ),
+    ]
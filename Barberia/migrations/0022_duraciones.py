@@ -0,0 +1,66 @@
+# Generated by Django 4.2.23 on 2026-10-18 21:05
+
+from datetime import time
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+
+
+def _fin(inicio, minutos):
+    fin = min(inicio.hour * 60 + inicio.minute + minutos, 24 * 60 - 1)
+    return time(fin // 60, fin % 60)
+
+
+def duraciones(apps, schema_editor):
+    Tipo_servicio = apps.get_model("Barberia", "Tipo_servicio")
+    Horario = apps.get_model("Barberia", "Horario")
+
+    # La regla que había en el código: "perfil" en el nombre del servicio base = 60'.
+    # Los agregados no sumaban tiempo.
+    for s in Tipo_servicio.objects.all():
+        if s.tipo == "ADDON":
+            s.duracion_minutos = 0
+        elif "perfil" in (s.nombre or "").lower():
+            s.duracion_minutos = 60
+        else:
+            continue
+        s.save(update_fields=["duracion_minutos"])
+
+    citas = Horario.objects.annotate(
+        total=F("Tipo_servicio__duracion_minutos") + Coalesce(Sum("agregados__duracion_minutos"), 0)
+    ).values_list("id", "hora_inicio", "total")
+    lote = []
+    for pk, inicio, total in citas.iterator(chunk_size=2000):
+        lote.append(Horario(id=pk, duracion_minutos=total, hora_fin=_fin(inicio, total)))
+        if len(lote) >= 2000:
+            Horario.objects.bulk_update(lote, ["duracion_minutos", "hora_fin"])
+            lote = []
+    if lote:
+        Horario.objects.bulk_update(lote, ["duracion_minutos", "hora_fin"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0021_hora_nativa_final'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tipo_servicio',
+            name='duracion_minutos',
+            field=models.PositiveSmallIntegerField(default=30),
+        ),
+        migrations.AddField(
+            model_name='horario',
+            name='duracion_minutos',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='horario',
+            name='hora_fin',
+            field=models.TimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(duraciones, migrations.RunPython.noop),
+    ]
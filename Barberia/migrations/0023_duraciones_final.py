@@ -0,0 +1,24 @@
+# Generated by Django 4.2.23 on 2026-10-18 21:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separada de 0022 por lo mismo que 0021 (Postgres)
+
+    dependencies = [
+        ('Barberia', '0022_duraciones'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='horario',
+            name='duracion_minutos',
+            field=models.PositiveSmallIntegerField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='horario',
+            name='hora_fin',
+            field=models.TimeField(editable=False),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.23 on 2026-10-18 22:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def silla_inicial(apps, schema_editor):
+    # Hasta ahora había una sola silla: todas las citas quedan en ella
+    Recurso = apps.get_model("Barberia", "Recurso")
+    Horario = apps.get_model("Barberia", "Horario")
+    silla = Recurso.objects.order_by("id").first() or Recurso.objects.create(nombre="Silla 1")
+    Horario.objects.filter(recurso__isnull=True).update(recurso=silla)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0023_duraciones_final'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recurso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50)),
+                ('activo', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='JornadaRecurso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')])),
+                ('abre', models.TimeField()),
+                ('cierra', models.TimeField()),
+                ('recurso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jornadas', to='Barberia.recurso')),
+            ],
+            options={
+                'ordering': ['recurso', 'dia_semana'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='jornadarecurso',
+            constraint=models.UniqueConstraint(fields=('recurso', 'dia_semana'), name='jornada_recurso_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='jornadarecurso',
+            constraint=models.CheckConstraint(check=models.Q(('cierra__gt', models.F('abre'))), name='jornada_recurso_rango'),
+        ),
+        migrations.AddField(
+            model_name='horario',
+            name='recurso',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='citas', to='Barberia.recurso'),
+        ),
+        migrations.RunPython(silla_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 22:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separada de 0024 por lo mismo que 0021 (Postgres)
+
+    dependencies = [
+        ('Barberia', '0024_recursos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='horario',
+            name='recurso',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='citas', to='Barberia.recurso'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='horario',
+            name='horario_unico_activo',
+        ),
+        migrations.AddConstraint(
+            model_name='horario',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['P', 'A'])), fields=('recurso', 'fecha', 'hora_horario'), name='horario_unico_activo'),
+        ),
+    ]
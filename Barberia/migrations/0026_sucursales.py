@@ -0,0 +1,100 @@
+# Generated by Django 4.2.23 on 2026-10-18 23:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Modelos que pasan a ser de una sucursal (el resto de sus filas queda en la principal)
+POR_SUCURSAL = (
+    "Horas", "Tipo_servicio", "Recurso", "ReglaAgenda", "ExcepcionAgenda",
+    "DiaCerrado", "Horario", "EstadisticaDiaria",
+)
+
+
+def sucursal_principal(apps, schema_editor):
+    # Hasta ahora había un solo local: todo queda en él
+    Sucursal = apps.get_model("Barberia", "Sucursal")
+    principal = (
+        Sucursal.objects.order_by("id").first()
+        or Sucursal.objects.create(nombre="Principal", slug="principal")
+    )
+    for nombre in POR_SUCURSAL:
+        apps.get_model("Barberia", nombre).objects.filter(sucursal__isnull=True).update(sucursal=principal)
+
+    # Una configuración por sucursal: la agenda solo leía la primera fila
+    ConfiguracionAgenda = apps.get_model("Barberia", "ConfiguracionAgenda")
+    config = ConfiguracionAgenda.objects.order_by("id").first()
+    if config is not None:
+        ConfiguracionAgenda.objects.exclude(pk=config.pk).delete()
+        config.sucursal = principal
+        config.save(update_fields=["sucursal"])
+    else:
+        ConfiguracionAgenda.objects.create(sucursal=principal, granularidad_minutos=30, horizonte_dias=7)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0025_recursos_final'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sucursal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50)),
+                ('slug', models.SlugField(unique=True)),
+                ('dominio', models.CharField(blank=True, max_length=255, null=True, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Sucursales',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='configuracionagenda',
+            name='sucursal',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='configuracion_agenda', to='Barberia.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='diacerrado',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cierres', to='Barberia.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='estadisticadiaria',
+            name='sucursal',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas', to='Barberia.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='excepcionagenda',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='excepciones', to='Barberia.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='horario',
+            name='sucursal',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='citas', to='Barberia.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='horas',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='horas', to='Barberia.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='recurso',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recursos', to='Barberia.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='reglaagenda',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reglas', to='Barberia.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='tipo_servicio',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='servicios', to='Barberia.sucursal'),
+        ),
+        migrations.RunPython(sucursal_principal, migrations.RunPython.noop),
+    ]
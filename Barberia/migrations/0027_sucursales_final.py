@@ -0,0 +1,151 @@
+# Generated by Django 4.2.23 on 2026-10-18 23:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separada de 0026 por lo mismo que 0021 (Postgres)
+
+    dependencies = [
+        ('Barberia', '0026_sucursales'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='configuracionagenda',
+            name='sucursal',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='configuracion_agenda', to='Barberia.sucursal'),
+        ),
+        migrations.AlterField(
+            model_name='diacerrado',
+            name='sucursal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cierres', to='Barberia.sucursal'),
+        ),
+        migrations.AlterField(
+            model_name='estadisticadiaria',
+            name='sucursal',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas', to='Barberia.sucursal'),
+        ),
+        migrations.AlterField(
+            model_name='excepcionagenda',
+            name='sucursal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='excepciones', to='Barberia.sucursal'),
+        ),
+        migrations.AlterField(
+            model_name='horario',
+            name='sucursal',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='citas', to='Barberia.sucursal'),
+        ),
+        migrations.AlterField(
+            model_name='horas',
+            name='sucursal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='horas', to='Barberia.sucursal'),
+        ),
+        migrations.AlterField(
+            model_name='recurso',
+            name='sucursal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recursos', to='Barberia.sucursal'),
+        ),
+        migrations.AlterField(
+            model_name='reglaagenda',
+            name='sucursal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reglas', to='Barberia.sucursal'),
+        ),
+        migrations.AlterField(
+            model_name='tipo_servicio',
+            name='sucursal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='servicios', to='Barberia.sucursal'),
+        ),
+
+        # Únicos por sucursal
+        migrations.AlterField(
+            model_name='diacerrado',
+            name='fecha',
+            field=models.DateField(),
+        ),
+        migrations.AddConstraint(
+            model_name='diacerrado',
+            constraint=models.UniqueConstraint(fields=('sucursal', 'fecha'), name='cierre_sucursal_fecha_unico'),
+        ),
+        migrations.AlterField(
+            model_name='excepcionagenda',
+            name='fecha',
+            field=models.DateField(),
+        ),
+        migrations.AddConstraint(
+            model_name='excepcionagenda',
+            constraint=models.UniqueConstraint(fields=('sucursal', 'fecha'), name='excepcion_agenda_unica'),
+        ),
+        migrations.AlterField(
+            model_name='reglaagenda',
+            name='dia_semana',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')]),
+        ),
+        migrations.AddConstraint(
+            model_name='reglaagenda',
+            constraint=models.UniqueConstraint(fields=('sucursal', 'dia_semana'), name='regla_agenda_unica'),
+        ),
+        migrations.AlterModelOptions(
+            name='reglaagenda',
+            options={'ordering': ['sucursal', 'dia_semana']},
+        ),
+        migrations.RemoveConstraint(
+            model_name='estadisticadiaria',
+            name='estadistica_dia_unica',
+        ),
+        migrations.AddConstraint(
+            model_name='estadisticadiaria',
+            constraint=models.UniqueConstraint(fields=('sucursal', 'fecha', 'servicio', 'estado'), name='estadistica_dia_unica'),
+        ),
+
+        # Índices que empiezan por la sucursal
+        migrations.RemoveIndex(
+            model_name='estadisticadiaria',
+            name='estadistica_servicio_idx',
+        ),
+        migrations.AddIndex(
+            model_name='estadisticadiaria',
+            index=models.Index(fields=['sucursal', 'servicio', 'fecha'], name='estadistica_suc_servicio_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='horario',
+            name='horario_fecha_estado_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='horario',
+            name='horario_fecha_hora_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='horario',
+            name='horario_servicio_fecha_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='horario',
+            name='horario_fecha_modif_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='horario',
+            name='horario_fecha_inicio_idx',
+        ),
+        migrations.AddIndex(
+            model_name='horario',
+            index=models.Index(fields=['sucursal', 'fecha', 'estado'], name='horario_suc_fecha_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='horario',
+            index=models.Index(fields=['sucursal', 'fecha', 'hora_horario', 'estado'], name='horario_suc_fecha_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='horario',
+            index=models.Index(fields=['sucursal', 'Tipo_servicio', 'fecha'], name='horario_suc_servicio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='horario',
+            index=models.Index(fields=['sucursal', 'fecha', 'modified_at'], name='horario_suc_fecha_modif_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='horario',
+            index=models.Index(fields=['sucursal', 'fecha', 'hora_inicio'], name='horario_suc_fecha_inicio_idx'),
+        ),
+    ]
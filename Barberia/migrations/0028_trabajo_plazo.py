@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Barberia', '0027_sucursales_final'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajo',
+            name='intentos',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajo',
+            name='reclamado',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def staff_a_la_principal(apps, schema_editor):
+    # Hasta ahora todo el staff veía el único panel: queda en la principal
+    Sucursal = apps.get_model("Barberia", "Sucursal")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    principal = Sucursal.objects.order_by("id").first()
+    if principal is not None:
+        principal.staff.add(*User.objects.filter(is_staff=True).values_list("id", flat=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('Barberia', '0028_trabajo_plazo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sucursal',
+            name='staff',
+            field=models.ManyToManyField(blank=True, related_name='sucursales', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(staff_a_la_principal, migrations.RunPython.noop),
+    ]
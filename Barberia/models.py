@@ -1,11 +1,19 @@
+import uuid
+from datetime import time
+
+from django.conf import settings
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError  # NUEVO
-from .utils import validar_rut, formatear_rut       # NUEVO
+from .utils import validar_rut, formatear_rut, normalizar_rut  # NUEVO
 
 class Usuario(models.Model):
     nombre = models.CharField(max_length=50)
     celular = models.CharField(max_length=12)
     rut = models.CharField(max_length=12)
+    # Un cliente = un RUT: clave de upsert en cada reserva
+    rut_normalizado = models.CharField(max_length=12, unique=True, null=True, blank=True, editable=False)
 
     def clean(self):
         # Validar RUT real
@@ -14,6 +22,7 @@ class Usuario(models.Model):
 
         # Formatear RUT con puntos y guion
         self.rut = formatear_rut(self.rut)
+        self.rut_normalizado = normalizar_rut(self.rut)
 
         # Normalizar celular a +569*******
         tel = self.celular.replace(" ", "")
@@ -45,11 +54,55 @@ class Usuario(models.Model):
 
 
 # Create your models here.
+class Sucursal(models.Model):
+    """
+    Local de la barbería. La grilla de horas, los servicios, las reglas de
+    atención, los recursos, los cierres, las citas y el rollup son de una
+    sucursal; los clientes (Usuario) son comunes. sucursales.py la resuelve
+    en cada request por host (`dominio`) o por ruta (/sucursal/<slug>/...).
+    `staff`: usuarios is_staff con acceso a su panel (los superusuarios, a todos).
+    """
+    nombre = models.CharField(max_length=50)
+    slug = models.SlugField(max_length=50, unique=True)
+    dominio = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    staff = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, related_name="sucursales")
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name_plural = "Sucursales"
+
+    def __str__(self):
+        return self.nombre
+
+
+class TerminoBusqueda(models.Model):
+    """
+    Índice de búsqueda de clientes para el panel: una fila por palabra del
+    nombre (sin tildes, minúsculas) y por el RUT en dígitos. Lo mantiene
+    `busqueda.py`; en Postgres lleva además un índice GIN de trigramas.
+    """
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="terminos")
+    termino = models.CharField(max_length=50)
+
+    class Meta:
+        indexes = [models.Index(fields=["termino", "usuario"], name="termino_busqueda_idx")]
+
+    def __str__(self):
+        return self.termino
+
+
+DIAS_SEMANA = (
+    (0, "Lunes"), (1, "Martes"), (2, "Miércoles"), (3, "Jueves"),
+    (4, "Viernes"), (5, "Sábado"), (6, "Domingo"),
+)
+
+
 class Horas(models.Model):
-    hora_Horas=models.CharField(max_length=10)
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name="horas")
+    hora_Horas=models.TimeField()
 
     def __str__(self):
-        return str(self.hora_Horas)
+        return f"{self.hora_Horas:%H:%M}"
     
 
 class Dias(models.Model):
@@ -63,16 +116,54 @@ class Tipo_servicio(models.Model):
         ("ADDON",'Agregado'),
     )
 
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name="servicios")
     nombre=models.CharField(max_length=50)
     precio_servicio=models.PositiveIntegerField()
     tipo = models.CharField(max_length=10,choices=TIPOS,default="BASE")
+    # Una cita dura lo del servicio base más lo de sus agregados (0 = no suma tiempo)
+    duracion_minutos = models.PositiveSmallIntegerField(default=30)
+
+    def clean(self):
+        if self.tipo == "BASE" and not self.duracion_minutos:
+            raise ValidationError({"duracion_minutos": "Un servicio base debe durar al menos 1 minuto."})
+
     def __str__(self):
         return f"{self.nombre}"
     
+class HorarioQuerySet(models.QuerySet):
+    def solapadas(self, sucursal_id, fecha, inicio, fin):
+        """Citas activas de la sucursal en `fecha` (de cualquier recurso) cuyo intervalo [hora_inicio, hora_fin) cruza [inicio, fin)."""
+        return self.filter(
+            sucursal_id=sucursal_id, fecha=fecha, estado__in=["P", "A"],
+            hora_inicio__lt=fin, hora_fin__gt=inicio,
+        )
+
+    def with_totals(self):
+        """
+        Anota `monto_total` = precio base + suma de precios de agregados,
+        calculado en SQL (subconsulta correlacionada, sin GROUP BY externo).
+        """
+        Agregado = self.model.agregados.through
+        suma_agregados = (
+            Agregado.objects
+            .filter(horario_id=OuterRef("pk"))
+            .values("horario_id")
+            .annotate(s=Sum("tipo_servicio__precio_servicio"))
+            .values("s")
+        )
+        return self.annotate(
+            monto_total=F("Tipo_servicio__precio_servicio")
+            + Coalesce(Subquery(suma_agregados), Value(0), output_field=models.IntegerField())
+        )
+
+
 class Horario(models.Model):
+    # Sin índice propio: todos los de Meta.indexes empiezan por la sucursal
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.PROTECT, related_name="citas", db_index=False)
     usuario_horario=models.ForeignKey(Usuario, on_delete=models.CASCADE)
     hora_horario=models.ForeignKey(Horas, on_delete=models.CASCADE)
     Tipo_servicio=models.ForeignKey(Tipo_servicio,on_delete=models.CASCADE)
+    recurso = models.ForeignKey("Recurso", on_delete=models.PROTECT, related_name="citas")
 
     agregados = models.ManyToManyField(
         "Tipo_servicio",
@@ -81,16 +172,83 @@ class Horario(models.Model):
         limit_choices_to={"tipo": "ADDON"},
     )
 
-    dia_horario=models.ForeignKey(Dias, on_delete=models.CASCADE)
     fecha=models.DateField(null=True,blank=True)
+    # Copias de fecha.weekday() y hora_horario.hora_Horas (las fija save()):
+    # listar, ordenar y agrupar por día u hora no necesita joins
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS_SEMANA, null=True, editable=False)
+    hora_inicio = models.TimeField(editable=False)
+    # Servicio base + agregados al reservar; si no se indica, la del servicio base.
+    # hora_fin = hora_inicio + duración (la fija save()): intervalo [inicio, fin)
+    duracion_minutos = models.PositiveSmallIntegerField(editable=False)
+    hora_fin = models.TimeField(editable=False)
     ESTADOS=[
         ('P','Pendiente'),
         ('A','Atendida'),
         ('C','Cancelada')
     ]
     estado=models.CharField(max_length=1,choices=ESTADOS,default='P')
+    # Última escritura: versión del rango y modo delta del feed del calendario
+    modified_at = models.DateTimeField(auto_now=True)
+
+    objects = HorarioQuerySet.as_manager()
+
+    class Meta:
+        # Todos empiezan por la sucursal: cada local recorre solo sus citas,
+        # por muchas que tenga otro
+        indexes = [
+            # Día / rango de fechas + estado (listados, calendario, stats, slots)
+            models.Index(fields=["sucursal", "fecha", "estado"], name="horario_suc_fecha_estado_idx"),
+            # Conflicto (fecha, hora, estado) y orden por hora dentro del día
+            models.Index(fields=["sucursal", "fecha", "hora_horario", "estado"], name="horario_suc_fecha_hora_idx"),
+            # Filtro por servicio dentro de un rango
+            models.Index(fields=["sucursal", "Tipo_servicio", "fecha"], name="horario_suc_servicio_idx"),
+            # Feed incremental: cambios de un rango desde un instante
+            models.Index(fields=["sucursal", "fecha", "modified_at"], name="horario_suc_fecha_modif_idx"),
+            # Orden de listados, paginación por cursor (fecha, hora, id) y
+            # solapamiento de intervalos en el día (reservas.py)
+            models.Index(fields=["sucursal", "fecha", "hora_inicio"], name="horario_suc_fecha_inicio_idx"),
+        ]
+        constraints = [
+            # Una sola cita activa por recurso y hora de inicio. Parcial: las
+            # canceladas no cuentan. (MySQL no soporta índices parciales: ahí
+            # Django la omite.) El solapamiento de intervalos lo revisa reservas.py.
+            models.UniqueConstraint(
+                fields=["recurso", "fecha", "hora_horario"],
+                condition=models.Q(estado__in=["P", "A"]),
+                name="horario_unico_activo",
+            ),
+        ]
+
+    @staticmethod
+    def calcular_fin(inicio, minutos):
+        """inicio + minutos, tope 23:59 (una cita no pasa al día siguiente)."""
+        fin = min(inicio.hour * 60 + inicio.minute + minutos, 24 * 60 - 1)
+        return time(fin // 60, fin % 60)
+
+    def save(self, *args, **kwargs):
+        # Un guardado parcial (update_fields=["estado"]) también marca modified_at
+        update_fields = kwargs.get("update_fields")
+        if self.sucursal_id is None:
+            self.sucursal_id = self.recurso.sucursal_id
+        if self.duracion_minutos is None:
+            self.duracion_minutos = self.Tipo_servicio.duracion_minutos
+        if update_fields is None or {"fecha", "hora_horario", "duracion_minutos"} & set(update_fields):
+            if self.fecha is not None:
+                self.dia_semana = self.fecha.weekday()
+            # Con la instancia de Horas ya asignada no hay consulta
+            self.hora_inicio = self.hora_horario.hora_Horas
+            self.hora_fin = self.calcular_fin(self.hora_inicio, self.duracion_minutos)
+            if update_fields is not None:
+                update_fields = {*update_fields, "dia_semana", "hora_inicio", "hora_fin"}
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "modified_at"}
+        super().save(*args, **kwargs)
+
     @property
     def total(self):
+        # Si viene de .with_totals() no se toca la BD
+        if hasattr(self, "monto_total"):
+            return self.monto_total
         base = self.Tipo_servicio.precio_servicio
         return base + sum(a.precio_servicio for a in self.agregados.all())
     
@@ -100,13 +258,197 @@ class Horario(models.Model):
     
 
 
+class EstadisticaDiaria(models.Model):
+    """
+    Rollup por (sucursal, fecha, servicio base, estado): cantidad de citas e
+    ingresos (base + agregados). Lo mantiene `estadisticas.py` recalculando
+    el día tocado de esa sucursal; los ingresos van con el precio actual de
+    cada servicio (un cambio de precio recalcula los días con sus citas).
+    """
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name="estadisticas", db_index=False)
+    fecha = models.DateField()
+    servicio = models.ForeignKey(Tipo_servicio, on_delete=models.CASCADE, related_name="estadisticas")
+    estado = models.CharField(max_length=1, choices=Horario.ESTADOS)
+    citas = models.PositiveIntegerField(default=0)
+    ingresos = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sucursal", "fecha", "servicio", "estado"], name="estadistica_dia_unica"),
+        ]
+        indexes = [models.Index(fields=["sucursal", "servicio", "fecha"], name="estadistica_suc_servicio_idx")]
+
+    def __str__(self):
+        return f"{self.fecha} {self.servicio} {self.estado}: {self.citas}"
+
+
 class DiaCerrado(models.Model):
-    fecha = models.DateField(unique=True)
+    """
+    Cierre desde `fecha` hasta `hasta` (inclusive; vacío = solo ese día).
+    Con `desde_hora` el cierre es parcial: cada día del rango se atiende
+    solo hasta esa hora. Lo lee cierres.py desde memoria, por sucursal.
+    """
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name="cierres")
+    fecha = models.DateField()
+    hasta = models.DateField(blank=True, null=True)
+    desde_hora = models.TimeField(blank=True, null=True)
     motivo = models.CharField(max_length=255, blank=True, null=True)
 
     class Meta:
         verbose_name = 'Día Cerrado'
         verbose_name_plural = 'Días Cerrados'
+        constraints = [
+            models.UniqueConstraint(fields=["sucursal", "fecha"], name="cierre_sucursal_fecha_unico"),
+            models.CheckConstraint(
+                check=models.Q(hasta__isnull=True) | models.Q(hasta__gte=models.F("fecha")),
+                name="cierre_rango_valido",
+            ),
+        ]
+
+    def __str__(self):
+        rango = f"{self.fecha} a {self.hasta}" if self.hasta else f"{self.fecha}"
+        if self.desde_hora:
+            rango += f" desde {self.desde_hora:%H:%M}"
+        return f"{rango} - {self.motivo or 'CERRADO'}"
+
+
+class ReglaAgenda(models.Model):
+    """
+    Horario de atención de un día de semana: se puede empezar un bloque
+    desde `abre` y debe terminar a más tardar en `cierra`. Un día sin
+    regla no se atiende. Lo compila agenda.py, por sucursal.
+    """
+    DIAS = DIAS_SEMANA
+
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name="reglas")
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS)
+    abre = models.TimeField()
+    cierra = models.TimeField()
+
+    class Meta:
+        ordering = ["sucursal", "dia_semana"]
+        constraints = [
+            models.UniqueConstraint(fields=["sucursal", "dia_semana"], name="regla_agenda_unica"),
+            models.CheckConstraint(check=models.Q(cierra__gt=models.F("abre")), name="regla_agenda_rango"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_dia_semana_display()} {self.abre:%H:%M}–{self.cierra:%H:%M}"
+
+
+class ExcepcionAgenda(models.Model):
+    """
+    Horario distinto para UNA fecha (ej. feriado que abre media jornada o
+    un domingo especial); reemplaza la regla de ese día de semana. Para
+    cerrar días completos o desde una hora está DiaCerrado.
+    """
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name="excepciones")
+    fecha = models.DateField()
+    abre = models.TimeField()
+    cierra = models.TimeField()
+    motivo = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sucursal", "fecha"], name="excepcion_agenda_unica"),
+            models.CheckConstraint(check=models.Q(cierra__gt=models.F("abre")), name="excepcion_agenda_rango"),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.abre:%H:%M}–{self.cierra:%H:%M} {self.motivo}".rstrip()
+
+
+class ConfiguracionAgenda(models.Model):
+    """
+    Parámetros de la agenda de una sucursal (una fila por sucursal). La
+    granularidad es cada cuántos minutos puede empezar una cita y debe ser
+    múltiplo del bloque de 30'; el horizonte es cuántos días hacia adelante
+    se reserva.
+    """
+    sucursal = models.OneToOneField(Sucursal, on_delete=models.CASCADE, related_name="configuracion_agenda")
+    granularidad_minutos = models.PositiveSmallIntegerField(default=30)
+    horizonte_dias = models.PositiveSmallIntegerField(default=7)
+
+    class Meta:
+        verbose_name = "Configuración de agenda"
+
+    def clean(self):
+        if not self.granularidad_minutos or self.granularidad_minutos % 30:
+            raise ValidationError({"granularidad_minutos": "Debe ser múltiplo de 30 minutos."})
+        if not self.horizonte_dias:
+            raise ValidationError({"horizonte_dias": "Debe ser al menos 1 día."})
+
+    def __str__(self):
+        return f"Cada {self.granularidad_minutos}' · {self.horizonte_dias} días"
+
+
+class Trabajo(models.Model):
+    """
+    Trabajo en segundo plano (export Excel, comprobante PDF).
+    Lo procesa `manage.py trabajos_worker`; el cliente consulta su estado por id.
+    Un trabajo 'En curso' tiene un plazo (TRABAJOS_PLAZO_MINUTOS) desde
+    `reclamado`: si el worker muere, otro lo vuelve a tomar.
+    """
+    TIPOS = (
+        ("EXCEL", "Export Excel"),
+        ("PDF", "Comprobante PDF"),
+    )
+    ESTADOS = [
+        ('P', 'Pendiente'),
+        ('E', 'En curso'),
+        ('L', 'Listo'),
+        ('F', 'Fallido'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    parametros = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=1, choices=ESTADOS, default='P')
+    archivo = models.CharField(max_length=255, blank=True)  # relativo a TRABAJOS_DIR
+    nombre_archivo = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    reclamado = models.DateTimeField(null=True, blank=True)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["estado", "creado"])]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.id} ({self.get_estado_display()})"
+
+
+class Recurso(models.Model):
+    """
+    Silla / barbero: cada cita ocupa un recurso. Sin jornadas propias
+    (JornadaRecurso) trabaja todo el horario del local; con jornadas, solo
+    esos días y horas (siempre dentro del horario del local).
+    """
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name="recursos")
+    nombre = models.CharField(max_length=50)
+    activo = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return self.nombre
+
+
+class JornadaRecurso(models.Model):
+    """Horario de trabajo de un recurso en un día de semana; lo compila agenda.py."""
+    recurso = models.ForeignKey(Recurso, on_delete=models.CASCADE, related_name="jornadas")
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS_SEMANA)
+    abre = models.TimeField()
+    cierra = models.TimeField()
+
+    class Meta:
+        ordering = ["recurso", "dia_semana"]
+        constraints = [
+            models.UniqueConstraint(fields=["recurso", "dia_semana"], name="jornada_recurso_unica"),
+            models.CheckConstraint(check=models.Q(cierra__gt=models.F("abre")), name="jornada_recurso_rango"),
+        ]
 
     def __str__(self):
-        return f"{self.fecha} - {self.motivo or 'CERRADO'}"
+        return f"{self.recurso} {self.get_dia_semana_display()} {self.abre:%H:%M}–{self.cierra:%H:%M}"
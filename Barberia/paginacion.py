@@ -0,0 +1,110 @@
+# Barberia/paginacion.py
+"""
+Paginación por cursor (keyset) para las tablas del panel.
+
+En vez de COUNT(*) + OFFSET, cada página pide `por_pagina + 1` filas
+"después de" (o "antes de") la última clave vista (fecha, hora, id), así la
+página 500 cuesta lo mismo que la primera. El total es opcional y, en
+Postgres, sale de la estimación del planner (EXPLAIN) sin recorrer filas.
+"""
+import json
+from datetime import date, time
+from functools import cached_property
+from operator import attrgetter
+
+from django.db import connection
+from django.db.models import Q
+
+ORDEN_CITAS = ("fecha", "hora_inicio", "id")
+SEP = "~"
+
+
+def _condicion(campos, valores, op):
+    # (a, b, c) > (x, y, z)  ==  a > x OR (a = x AND (b > y OR (b = y AND c > z)))
+    campo, valor = campos[0], valores[0]
+    q = Q(**{f"{campo}__{op}": valor})
+    if len(campos) > 1:
+        q |= Q(**{campo: valor}) & _condicion(campos[1:], valores[1:], op)
+    return q
+
+
+def leer_cursor(texto):
+    """'2030-01-07~12:30:00~15' -> (date, time, 15); None si no es válido."""
+    try:
+        fecha, hora, pk = (texto or "").split(SEP)
+        return date.fromisoformat(fecha), time.fromisoformat(hora), int(pk)
+    except ValueError:
+        return None
+
+
+class PaginaKeyset:
+    """
+    Página de `qs` ordenada por ORDEN_CITAS. Se evalúa recién al iterarla,
+    así una tabla que la plantilla no muestra no cuesta consultas.
+    Expone has_next / has_previous y los cursores para armar los enlaces.
+    """
+
+    def __init__(self, qs, por_pagina, despues=None, antes=None, campos=ORDEN_CITAS):
+        self.qs = qs
+        self.por_pagina = por_pagina
+        self.campos = campos
+        self.despues = leer_cursor(despues)
+        self.antes = None if self.despues else leer_cursor(antes)
+
+    @cached_property
+    def _filas(self):
+        n = self.por_pagina
+        if self.antes:
+            inverso = [f"-{c}" for c in self.campos]
+            filas = list(
+                self.qs.filter(_condicion(self.campos, self.antes, "lt")).order_by(*inverso)[:n + 1]
+            )
+            hay_mas = len(filas) > n
+            return filas[:n][::-1], hay_mas, True
+
+        qs = self.qs.order_by(*self.campos)
+        if self.despues:
+            qs = qs.filter(_condicion(self.campos, self.despues, "gt"))
+        filas = list(qs[:n + 1])
+        return filas[:n], bool(self.despues), len(filas) > n
+
+    @property
+    def object_list(self):
+        return self._filas[0]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_previous(self):
+        return self._filas[1]
+
+    @property
+    def has_next(self):
+        return self._filas[2]
+
+    def _cursor(self, obj):
+        fecha, hora, pk = (attrgetter(c)(obj) for c in self.campos)
+        return SEP.join([fecha.isoformat(), hora.isoformat(), str(pk)])
+
+    @property
+    def cursor_anterior(self):
+        return self._cursor(self.object_list[0]) if self.object_list else ""
+
+    @property
+    def cursor_siguiente(self):
+        return self._cursor(self.object_list[-1]) if self.object_list else ""
+
+
+def estimar_total(qs):
+    """
+    Total aproximado de `qs`. En Postgres usa las filas estimadas por el
+    planner (no lee la tabla); en MySQL/SQLite cae a un COUNT exacto.
+    """
+    if connection.vendor == "postgresql":
+        plan = json.loads(qs.order_by().explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"])
+    return qs.count()
@@ -0,0 +1,286 @@
+# Barberia/reportes.py
+"""
+Generación de archivos pesados (Excel del rango, PDF del comprobante).
+Lo usan tanto las vistas (descarga directa) como el worker de `trabajos`.
+
+Los PDF de comprobante quedan en disco, direccionados por contenido:
+`<horario_id>-<sha256 del contexto>.pdf`. El contexto incluye cliente,
+servicio y agregados, así que renombrar cualquiera cambia la clave (y el
+ETag); además, si cambia el Horario, sus agregados, su Usuario o un
+Tipo_servicio, las señales borran las versiones viejas de esas citas.
+"""
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.db.models.functions import Length
+from django.template.loader import render_to_string
+from xhtml2pdf import pisa
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.table import Table, TableStyleInfo
+
+from .models import DIAS_SEMANA, Horario, Tipo_servicio, Usuario
+
+EXPORT_CHUNK = 500  # filas por lote en exports (iterator + prefetch por lote)
+
+HEADERS_RANGO = [
+    'ID', 'Fecha', 'Hora', 'Cliente', 'RUT', 'Teléfono', 'Servicio', 'Día', 'Estado',
+    'Agregados', 'Total'  # MOD
+]
+
+
+def citas_rango(sucursal_id, start, end, servicio=None, estado=None):
+    """
+    Citas de la sucursal en el rango [start, end) con agregados prefetch y
+    total anotado. Opcional: servicio=ID (str), estado=P/A/C
+    """
+    qs = (
+        Horario.objects
+        .select_related('usuario_horario', 'Tipo_servicio')
+        .prefetch_related('agregados')  # MOD
+        .with_totals()
+        .filter(sucursal_id=sucursal_id, fecha__gte=start, fecha__lt=end)
+        .order_by('fecha', 'hora_inicio')
+    )
+
+    if servicio and servicio.isdigit():
+        qs = qs.filter(Tipo_servicio_id=int(servicio))
+    if estado in dict(Horario.ESTADOS).keys():
+        qs = qs.filter(estado=estado)
+    return qs
+
+
+def _anchos_excel(qs, headers):
+    """
+    Anchos de columna del export Excel (mismo criterio de antes:
+    largo máximo + 3, tope 40) calculados en SQL: un aggregate para las
+    columnas de la cita y otro para la lista unida de agregados
+    ("a, b": suma de nombres + 2 por separador).
+    """
+    m = qs.order_by().aggregate(
+        id=Max("id"),
+        cliente=Max(Length("usuario_horario__nombre")),
+        rut=Max(Length("usuario_horario__rut")),
+        celular=Max(Length("usuario_horario__celular")),
+        servicio=Max(Length("Tipo_servicio__nombre")),
+        total=Max("monto_total"),
+    )
+    agregados = (
+        Horario.agregados.through.objects
+        .filter(horario__in=qs.order_by().values("pk"))
+        .values("horario_id")
+        .annotate(largo=Sum(Length("tipo_servicio__nombre")) + 2 * Count("id") - 2)
+        .aggregate(m=Max("largo"))["m"]
+    )
+    largos = [
+        len(str(m["id"] or "")),
+        len("dd-mm-aaaa"),
+        len("HH:MM"),
+        m["cliente"] or 0,
+        m["rut"] or 0,
+        m["celular"] or 0,
+        m["servicio"] or 0,
+        max(len(label) for _, label in DIAS_SEMANA),
+        max(len(label) for _, label in Horario.ESTADOS),
+        agregados or 0,
+        len(str(m["total"] or "")),
+    ]
+    return [min(max(len(h), largo) + 3, 40) for h, largo in zip(headers, largos)]
+
+
+def escribir_excel_rango(qs, destino):
+    """
+    Escribe el .xlsx de `qs` en `destino` (archivo binario con seek).
+    Modo write_only: las filas van directo a un archivo temporal. Los anchos
+    deben fijarse ANTES de la primera fila, así que salen de un solo aggregate.
+    """
+    headers = HEADERS_RANGO
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Citas")
+    for col, ancho in enumerate(_anchos_excel(qs, headers), start=1):
+        ws.column_dimensions[get_column_letter(col)].width = ancho
+
+    header_fill = PatternFill("solid", fgColor="111111")
+    header_font = Font(color="FFFFFF", bold=True)
+    header_align = Alignment(horizontal="center", vertical="center")
+    fila_headers = []
+    for h in headers:
+        cell = WriteOnlyCell(ws, value=h)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = header_align
+        fila_headers.append(cell)
+    ws.append(fila_headers)
+
+    estado_label = dict(Horario.ESTADOS)
+    n_filas = 1
+    for c in qs.iterator(chunk_size=EXPORT_CHUNK):
+        agregados_txt = ", ".join([a.nombre for a in c.agregados.all()])
+        ws.append([
+            c.id,
+            (c.fecha.strftime("%d-%m-%Y") if c.fecha else ""),
+            f"{c.hora_inicio:%H:%M}",
+            c.usuario_horario.nombre,
+            c.usuario_horario.rut,
+            c.usuario_horario.celular,
+            c.Tipo_servicio.nombre,
+            c.get_dia_semana_display(),
+            estado_label.get(c.estado, ""),
+            agregados_txt,           # MOD
+            c.total,                 # MOD (anotado en SQL)
+        ])
+        n_filas += 1
+
+    last_col = get_column_letter(len(headers))
+    tab = Table(displayName="TablaCitas", ref=f"A1:{last_col}{n_filas}")
+    # En write_only no se puede releer la fila 1: nombres de columna explícitos
+    tab._initialise_columns()
+    for columna, h in zip(tab.tableColumns, headers):
+        columna.name = h
+    tab.tableStyleInfo = TableStyleInfo(
+        name="TableStyleMedium9",
+        showFirstColumn=False,
+        showLastColumn=False,
+        showRowStripes=True,
+        showColumnStripes=False
+    )
+    ws.add_table(tab)
+
+    wb.save(destino)
+
+
+VERSION_COMPROBANTE = 2  # subir si cambia comprobante.html
+
+
+def contexto_comprobante(horario):
+    """Datos del comprobante (con usuario_horario, Tipo_servicio y agregados ya cargados)."""
+    return {
+        'nombre': horario.usuario_horario.nombre,
+        'rut': horario.usuario_horario.rut,
+        'fecha': (horario.fecha.strftime("%d-%m-%Y") if horario.fecha else ""),
+        'hora': f"{horario.hora_inicio:%H:%M}",
+        'servicio': horario.Tipo_servicio.nombre,
+        'agregados': ", ".join(a.nombre for a in horario.agregados.all()),
+        'total': horario.total,
+    }
+
+
+def escribir_pdf_comprobante(contexto, destino):
+    """Renderiza comprobante.html a PDF en `destino`. Retorna False si falla."""
+    html = render_to_string('comprobante.html', contexto)
+    pisa_status = pisa.CreatePDF(html, dest=destino)
+    return not pisa_status.err
+
+
+def clave_comprobante(horario_id, contexto) -> str:
+    datos = json.dumps(
+        {"v": VERSION_COMPROBANTE, "horario_id": horario_id, **contexto},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(datos.encode("utf-8")).hexdigest()
+
+
+def _dir_comprobantes(horario_id) -> Path:
+    """Carpeta de los PDF de una cita: invalidarla no recorre el cache entero."""
+    base = Path(getattr(settings, "COMPROBANTES_DIR", Path(settings.BASE_DIR) / "cache" / "comprobantes"))
+    return base / str(horario_id)
+
+
+def _borrar_pdfs(d: Path, excepto=None):
+    try:
+        viejos = [p for p in d.iterdir() if p.suffix == ".pdf" and p != excepto]
+    except FileNotFoundError:
+        return
+    for viejo in viejos:
+        viejo.unlink(missing_ok=True)
+
+
+def comprobante_pdf(horario_id, contexto):
+    """
+    Ruta del PDF cacheado del comprobante; lo renderiza solo si no existe.
+    Retorna None si xhtml2pdf falla.
+    """
+    d = _dir_comprobantes(horario_id)
+    ruta = d / f"{clave_comprobante(horario_id, contexto)}.pdf"
+    if ruta.exists():
+        return ruta
+
+    d.mkdir(parents=True, exist_ok=True)
+    tmp = d / f"{ruta.name}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "wb") as f:
+        ok = escribir_pdf_comprobante(contexto, f)
+    if not ok:
+        tmp.unlink(missing_ok=True)
+        return None
+
+    os.replace(tmp, ruta)  # atómico: nunca se sirve un PDF a medio escribir
+    _borrar_pdfs(d, excepto=ruta)
+    return ruta
+
+
+def invalidar_comprobantes(*horario_ids):
+    """Borra los PDF cacheados de esas citas (y su carpeta, si queda vacía)."""
+    for hid in horario_ids:
+        d = _dir_comprobantes(hid)
+        _borrar_pdfs(d)
+        try:
+            d.rmdir()
+        except OSError:  # no existe, o hay un PDF renderizándose
+            pass
+
+
+def _invalidar_al_confirmar(*horario_ids):
+    # Si la transacción se revierte, los PDF siguen valiendo
+    if horario_ids:
+        transaction.on_commit(lambda: invalidar_comprobantes(*horario_ids))
+
+
+# =========================
+# Señales: invalidación del cache de comprobantes
+# =========================
+
+@receiver(post_save, sender=Horario, dispatch_uid="comprobante_horario_guardado")
+@receiver(post_delete, sender=Horario, dispatch_uid="comprobante_horario_borrado")
+def _horario_cambiado(sender, instance, created=False, **kwargs):
+    if not created:
+        _invalidar_al_confirmar(instance.pk)
+
+
+@receiver(m2m_changed, sender=Horario.agregados.through, dispatch_uid="comprobante_agregados")
+def _agregados_cambiados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        _invalidar_al_confirmar(instance.pk)
+    elif pk_set:
+        _invalidar_al_confirmar(*pk_set)
+
+
+@receiver(post_save, sender=Usuario, dispatch_uid="comprobante_usuario_guardado")
+def _usuario_cambiado(sender, instance, created, **kwargs):
+    if not created:
+        _invalidar_al_confirmar(
+            *Horario.objects.filter(usuario_horario=instance).values_list("id", flat=True)
+        )
+
+
+@receiver(post_save, sender=Tipo_servicio, dispatch_uid="comprobante_servicio_guardado")
+def _servicio_cambiado(sender, instance, created, **kwargs):
+    # Como servicio base o como agregado
+    if not created:
+        _invalidar_al_confirmar(*(
+            Horario.objects.filter(Q(Tipo_servicio=instance) | Q(agregados=instance))
+            .values_list("id", flat=True).distinct()
+        ))
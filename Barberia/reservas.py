@@ -0,0 +1,127 @@
+# Barberia/reservas.py
+"""
+Servicio de reserva: upsert del Usuario (por RUT normalizado) + Horario +
+agregados en UNA transacción.
+
+Una cita ocupa el intervalo [hora_inicio, hora_fin) de UN recurso (silla /
+barbero) de su sucursal: la duración del servicio base más la de sus
+agregados (catálogo en memoria de la sucursal). Si no se pide un recurso se
+asigna el primero libre (disponibilidad.recursos_libres). Dentro de la
+transacción:
+
+1. Se bloquean (SELECT ... FOR UPDATE, en orden de id) las filas de Recurso
+   candidatas de la sucursal. Dos reservas que pueden caer en el mismo recurso comparten
+   ese bloqueo, así que la segunda espera a que la primera confirme.
+2. Con UNA consulta se ven cuáles de esos recursos tienen una cita activa
+   que se solape (Horario.objects.solapadas()); gana el primero libre.
+
+La restricción parcial `horario_unico_activo` (recurso, fecha, hora) WHERE
+estado IN (P, A) sigue como red de seguridad para dos reservas a la misma
+hora en motores sin SELECT ... FOR UPDATE (SQLite).
+"""
+from django.db import IntegrityError, transaction
+
+from . import catalogo, disponibilidad
+from .models import Horario, Recurso, Usuario
+
+ESTADOS_ACTIVOS = ["P", "A"]
+
+
+class HoraOcupada(Exception):
+    """Ningún recurso pedido está libre en el intervalo (fecha, inicio, fin)."""
+
+
+def reservar(*, sucursal_id, nombre, rut, celular, fecha, hora, servicio_id, addons_ids=(), recurso_id=None):
+    """
+    Retorna (usuario, horario). `recurso_id` None = cualquier recurso libre
+    de la sucursal. Lanza HoraOcupada si el intervalo ya está tomado, o
+    ValidationError si el RUT no es válido (Usuario.clean). Si algo falla no
+    queda nada a medias.
+    """
+    addons = _addons_validos(sucursal_id, addons_ids)
+    duracion = catalogo.actual(sucursal_id).duracion(servicio_id, addons)
+    inicio = hora.hora_Horas
+    fin = Horario.calcular_fin(inicio, duracion)
+
+    if recurso_id is None:
+        candidatos = disponibilidad.recursos_libres(
+            sucursal_id, fecha, inicio, disponibilidad.bloques_de(duracion)
+        )
+    else:
+        candidatos = [recurso_id]
+    if not candidatos:
+        raise HoraOcupada()
+
+    try:
+        with transaction.atomic():
+            recurso_id = _primer_recurso_libre(sucursal_id, candidatos, fecha, inicio, fin)
+            if recurso_id is None:
+                raise HoraOcupada()
+
+            usuario = _upsert_usuario(nombre=nombre, rut=rut, celular=celular)
+            horario = Horario.objects.create(
+                sucursal_id=sucursal_id,
+                usuario_horario=usuario,
+                hora_horario=hora,
+                Tipo_servicio_id=servicio_id,
+                recurso_id=recurso_id,
+                fecha=fecha,
+                duracion_minutos=duracion,
+                estado='P',
+            )
+            if addons:
+                Agregado = Horario.agregados.through
+                Agregado.objects.bulk_create([
+                    Agregado(horario_id=horario.id, tipo_servicio_id=a) for a in addons
+                ])
+    except IntegrityError:
+        raise HoraOcupada()
+
+    return usuario, horario
+
+
+def _primer_recurso_libre(sucursal_id, candidatos, fecha, inicio, fin):
+    """Bloquea los recursos `candidatos` activos de la sucursal y retorna el primero (en el orden dado) sin cruce, o None."""
+    # Mismo orden en todas las reservas: sin deadlocks entre bloqueos cruzados
+    activos = set(
+        Recurso.objects.select_for_update()
+        .filter(pk__in=candidatos, sucursal_id=sucursal_id, activo=True)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    ocupados = set(
+        Horario.objects.solapadas(sucursal_id, fecha, inicio, fin)
+        .filter(recurso_id__in=activos)
+        .values_list("recurso_id", flat=True)
+    )
+    return next((r for r in candidatos if r in activos and r not in ocupados), None)
+
+
+def _upsert_usuario(*, nombre, rut, celular):
+    """
+    Un cliente por RUT: si ya existe se actualizan nombre y celular con los
+    datos de esta reserva (solo si cambiaron, así no se reescribe la fila ni
+    se invalidan sus citas en el feed). get_or_create bloquea la fila y, si
+    dos primeras reservas del mismo RUT chocan en el índice único, relee la
+    ganadora.
+    """
+    datos = Usuario(nombre=nombre, celular=celular, rut=rut)
+    datos.clean()  # valida el RUT y normaliza RUT / celular
+    usuario, creado = Usuario.objects.select_for_update().get_or_create(
+        rut_normalizado=datos.rut_normalizado,
+        defaults={"nombre": datos.nombre, "celular": datos.celular, "rut": datos.rut},
+    )
+    cambios = [c for c in ("nombre", "celular", "rut") if getattr(usuario, c) != getattr(datos, c)]
+    if cambios:
+        for c in cambios:
+            setattr(usuario, c, getattr(datos, c))
+        usuario.save(update_fields=cambios)
+    return usuario
+
+
+def _addons_validos(sucursal_id, addons_ids):
+    ids = {int(a) for a in addons_ids if str(a).isdigit()}
+    if not ids:
+        return []
+    addons = catalogo.actual(sucursal_id).servicio_por_id
+    return sorted(i for i in ids if i in addons and addons[i].tipo == "ADDON")
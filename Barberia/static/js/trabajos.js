@@ -0,0 +1,26 @@
+// Descarga vía cola de trabajos (manage.py trabajos_worker).
+// Encola con POST, consulta el estado cada segundo y al terminar descarga.
+// Si falla o no hay worker activo (~30 s), cae a la descarga directa `fallback`.
+async function descargarEnSegundoPlano(btn, urlEncolar, fallback, csrf){
+  const texto = btn.textContent;
+  btn.classList.add('disabled');
+  btn.textContent = 'Generando...';
+  try{
+    const res = await fetch(urlEncolar, { method: 'POST', headers: { 'X-CSRFToken': csrf } });
+    if(!res.ok) throw new Error('encolar');
+    let t = await res.json();
+
+    for(let i = 0; i < 30; i++){
+      await new Promise(r => setTimeout(r, 1000));
+      t = await (await fetch(t.estado_url)).json();
+      if(t.estado === 'L'){ window.location = t.descarga; return; }
+      if(t.estado === 'F') break;
+    }
+    throw new Error('timeout');
+  }catch(e){
+    window.location = fallback;
+  }finally{
+    btn.classList.remove('disabled');
+    btn.textContent = texto;
+  }
+}
@@ -0,0 +1,122 @@
+# Barberia/sucursales.py
+"""
+Sucursales (locales) y su resolución por request.
+
+SucursalMiddleware fija `request.sucursal` antes de resolver la URL:
+
+1. por host: Sucursal.dominio == host del request (sin puerto),
+2. por ruta: /sucursal/<slug>/... — se quita el prefijo de path_info y se
+   suma al script prefix, así reverse() y {% url %} lo conservan en los
+   enlaces de esa página; un slug desconocido es 404,
+3. si no, la sucursal principal (la de menor id): una instalación de un
+   solo local no cambia sus URLs.
+
+La tabla es chica y se lee en cada request: va en memoria como foto
+versionada (igual que el catálogo). Sirve a vistas sync y async sin saltar
+de hilo mientras la foto esté vigente. La foto lleva también el staff de
+cada sucursal (Sucursal.staff): es_staff() autoriza el panel sin consultas.
+"""
+from asgiref.sync import iscoroutinefunction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404
+from django.http.request import split_domain_port
+from django.urls import get_script_prefix, set_script_prefix
+from django.utils.decorators import sync_and_async_middleware
+
+from .catalogo import FotoVersionada
+from .models import Sucursal
+
+CLAVE_VERSION = "barberia:sucursales:version"
+PREFIJO_RUTA = "/sucursal/"
+
+
+class Sucursales:
+    def __init__(self, version, filas, staff=()):
+        self.version = version
+        self.todas = list(filas)                        # por id
+        self.staff = {}                                 # {sucursal_id: {user_id}}
+        for sid, uid in staff:
+            self.staff.setdefault(sid, set()).add(uid)
+        self.por_id = {s.id: s for s in self.todas}
+        self.por_slug = {s.slug: s for s in self.todas}
+        self.por_dominio = {s.dominio.lower(): s for s in self.todas if s.dominio}
+        self.principal = self.todas[0] if self.todas else None
+
+    def buscar(self, slug=None):
+        """La sucursal `slug` (o la principal si no se indica); None si no existe."""
+        return self.por_slug.get(slug) if slug else self.principal
+
+    def es_staff(self, sucursal, user):
+        """¿`user` entra al panel de `sucursal`? Staff de ella o superusuario."""
+        if not (user.is_authenticated and user.is_staff):
+            return False
+        return user.is_superuser or user.id in self.staff.get(sucursal.id, ())
+
+    def resolver(self, request):
+        """(sucursal, prefijo de ruta o "") del request. Sucursal None = slug desconocido."""
+        host, _ = split_domain_port(request.get_host())
+        s = self.por_dominio.get(host)
+        if s is not None:
+            return s, ""
+        ruta = request.path_info
+        if ruta.startswith(PREFIJO_RUTA):
+            slug = ruta[len(PREFIJO_RUTA):].split("/", 1)[0]
+            return self.por_slug.get(slug), PREFIJO_RUTA + slug
+        return self.principal, ""
+
+
+def _cargar(version):
+    return Sucursales(
+        version,
+        Sucursal.objects.order_by("id"),
+        Sucursal.staff.through.objects.values_list("sucursal_id", "user_id"),
+    )
+
+
+_foto = FotoVersionada(CLAVE_VERSION, _cargar)
+
+actual = _foto.actual      # -> Sucursales vigentes
+aactual = _foto.aactual
+limpiar = _foto.limpiar
+
+
+def _entrar(request, sucs):
+    """Fija request.sucursal (y el prefijo de ruta); retorna el script prefix a restaurar."""
+    sucursal, prefijo = sucs.resolver(request)
+    if sucursal is None:
+        raise Http404("Sucursal no encontrada.")
+    request.sucursal = sucursal
+    anterior = get_script_prefix()
+    if prefijo:
+        request.path_info = request.path_info[len(prefijo):] or "/"
+        set_script_prefix(anterior + prefijo.lstrip("/") + "/")
+    return anterior
+
+
+@sync_and_async_middleware
+def SucursalMiddleware(get_response):
+    # El script prefix vive en un Local de la petición; igual se restaura
+    # al salir (el cliente de tests no lo reinicia entre requests)
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            anterior = _entrar(request, await aactual())
+            try:
+                return await get_response(request)
+            finally:
+                set_script_prefix(anterior)
+    else:
+        def middleware(request):
+            anterior = _entrar(request, actual())
+            try:
+                return get_response(request)
+            finally:
+                set_script_prefix(anterior)
+    return middleware
+
+
+@receiver(post_save, sender=Sucursal, dispatch_uid="sucursales_guardada")
+@receiver(post_delete, sender=Sucursal, dispatch_uid="sucursales_borrada")
+@receiver(m2m_changed, sender=Sucursal.staff.through, dispatch_uid="sucursales_staff")
+def _sucursal_cambiada(sender, **kwargs):
+    _foto.invalidar()
@@ -1,3 +1,1145 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import tempfile
+import threading
+from datetime import date, time, timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+from . import agenda, catalogo, cierres, difusion, disponibilidad, sucursales, trabajos
+from .clientes import fusionar_duplicados
+from .models import (
+    ConfiguracionAgenda, DiaCerrado, EstadisticaDiaria, ExcepcionAgenda, Horario, Horas,
+    JornadaRecurso, Recurso, ReglaAgenda, Sucursal, Tipo_servicio, Trabajo, Usuario,
+)
+from .paginacion import ORDEN_CITAS
+from .reportes import HEADERS_RANGO
+from .reservas import HoraOcupada, reservar
+
+
+def _principal():
+    # La crea la migración 0026; el flush de TransactionTestCase la borra
+    return Sucursal.objects.get_or_create(slug="principal", defaults={"nombre": "Principal"})[0]
+
+
+def _staff(nombre="staff", locales=None):
+    """Usuario staff con acceso al panel de `locales` (por defecto, la principal)."""
+    u = get_user_model().objects.create_user(nombre, password="x", is_staff=True)
+    u.sucursales.add(*(locales or [_principal()]))
+    return u
+
+
+def _crear_citas(n, fecha=date(2030, 1, 7), desde=0, sucursal=None):
+    sucursal = sucursal or _principal()
+    base, _ = sucursal.servicios.get_or_create(nombre="Corte de pelo", precio_servicio=8000)
+    addon1, _ = sucursal.servicios.get_or_create(nombre="Líneas", precio_servicio=1000, tipo="ADDON")
+    addon2, _ = sucursal.servicios.get_or_create(nombre="Perfilado de cejas", precio_servicio=2000, tipo="ADDON")
+    u, _ = Usuario.objects.get_or_create(
+        rut_normalizado="111111111",
+        defaults={"nombre": "Cliente", "celular": "912345678", "rut": "11.111.111-1"},
+    )
+    silla, _ = sucursal.recursos.get_or_create(nombre="Silla 1")
+    citas = []
+    for i in range(desde, desde + n):
+        hora, _ = sucursal.horas.get_or_create(hora_Horas=time(12 + i // 2, 30 * (i % 2)))
+        h = Horario.objects.create(
+            usuario_horario=u, hora_horario=hora, Tipo_servicio=base, recurso=silla,
+            fecha=fecha,
+        )
+        h.agregados.set([addon1, addon2][: i % 3])
+        citas.append(h)
+    return citas
+
+
+class TotalesTests(TestCase):
+    def test_with_totals_suma_base_y_agregados(self):
+        citas = _crear_citas(3)
+        totales = dict(Horario.objects.with_totals().values_list("id", "monto_total"))
+        self.assertEqual([totales[c.id] for c in citas], [8000, 9000, 11000])
+        self.assertEqual([c.total for c in citas], [8000, 9000, 11000])
+
+
+class EstadisticasTests(TestCase):
+    def setUp(self):
+        self.client.force_login(_staff())
+
+    def _stats(self, **extra):
+        return self.client.get(
+            reverse("panel_api_stats"), {"start": "2030-01-01", "end": "2030-02-01", **extra}
+        ).json()
+
+    def test_rollup_se_mantiene_al_crear_y_cancelar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            citas = _crear_citas(3)
+        self.assertEqual(
+            list(EstadisticaDiaria.objects.values_list("estado", "citas", "ingresos")),
+            [("P", 3, 28000)],
+        )
+        self.assertEqual(self._stats(), {"labels": ["Corte de pelo"], "values": [3], "ingresos": [28000]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            citas[2].estado = "C"
+            citas[2].save(update_fields=["estado"])
+        self.assertEqual(
+            sorted(EstadisticaDiaria.objects.values_list("estado", "citas", "ingresos")),
+            [("C", 1, 11000), ("P", 2, 17000)],
+        )
+        self.assertEqual(self._stats()["values"], [2])
+        self.assertEqual(self._stats(estado="C"), {"labels": [], "values": []})
+
+    def test_cambio_de_precio_recalcula_los_dias(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            citas = _crear_citas(3)                      # 8000, 8000+1000, 8000+1000+2000
+            _crear_citas(1, fecha=date(2030, 1, 20))
+        self.assertEqual(self._stats()["ingresos"], [36000])
+
+        linea = citas[1].agregados.get()
+        linea.precio_servicio = 1500
+        with self.captureOnCommitCallbacks(execute=True):
+            linea.save()
+        self.assertEqual(self._stats()["ingresos"], [37000])
+        base = citas[0].Tipo_servicio
+        base.precio_servicio = 10000
+        with self.captureOnCommitCallbacks(execute=True):
+            base.save()
+        self.assertEqual(self._stats()["ingresos"], [45000])  # también el día 20
+        # Renombrar no recalcula
+        base.nombre = "Corte clásico"
+        with patch("Barberia.estadisticas.recalcular_rango") as recalcular:
+            with self.captureOnCommitCallbacks(execute=True):
+                base.save()
+        recalcular.assert_not_called()
+
+    def test_recalcular_estadisticas_reconstruye_el_rango(self):
+        _crear_citas(4)  # sin on_commit: el rollup queda vacío
+        self.assertFalse(EstadisticaDiaria.objects.exists())
+        call_command("recalcular_estadisticas", stdout=StringIO())
+        self.assertEqual(self._stats()["ingresos"], [8000 + 9000 + 11000 + 8000])
+
+
+class AnaliticaTests(TestCase):
+    def setUp(self):
+        self.client.force_login(_staff())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.citas = _crear_citas(4)                       # lunes 2030-01-07
+            _crear_citas(1, fecha=date(2030, 1, 15))           # martes siguiente
+            self.citas[3].estado = "C"
+            self.citas[3].save(update_fields=["estado"])
+
+    def _get(self, nombre, **params):
+        return self.client.get(
+            reverse(nombre), {"start": "2030-01-01", "end": "2030-02-01", **params}
+        ).json()
+
+    def test_ingresos_por_semana_y_mes(self):
+        r = self._get("panel_api_ingresos", periodo="semana")
+        self.assertEqual(r["labels"], ["2030-01-07", "2030-01-14"])
+        self.assertEqual(r["ingresos"], [8000 + 9000 + 11000, 8000])
+        r = self._get("panel_api_ingresos", periodo="mes")
+        self.assertEqual((r["labels"], r["ingresos"], r["citas"]), (["2030-01-01"], [36000], [4]))
+
+    def test_ocupacion_por_bloque_y_dia(self):
+        r = self._get("panel_api_ocupacion")
+        self.assertEqual(r["dias_abiertos"], [4, 5, 5, 5, 4, 4])  # enero 2030 sin domingos
+        self.assertEqual(r["citas"][0][:3], [1, 1, 1])
+        self.assertEqual(r["ocupacion"][0][0], 0.25)
+        self.assertEqual(r["citas"][1][0], 1)
+
+    def test_ocupacion_cuenta_todos_los_bloques_de_la_cita(self):
+        suc, miercoles = _principal(), date(2030, 1, 9)
+        horas = [suc.horas.get_or_create(hora_Horas=h)[0] for h in (time(14), time(14, 30), time(15))]
+        color = Tipo_servicio.objects.create(sucursal=suc, nombre="Color", precio_servicio=20000, duracion_minutos=60)
+        with self.captureOnCommitCallbacks(execute=True):
+            Horario.objects.create(
+                usuario_horario=self.citas[0].usuario_horario, hora_horario=horas[0], Tipo_servicio=color,
+                recurso=self.citas[0].recurso, fecha=miercoles,
+            )
+        r = self._get("panel_api_ocupacion")
+        i = r["horas"].index("14:00")
+        self.assertEqual(r["citas"][2][i:i + 3], [1, 1, 0])  # 14:00–15:00 tapa dos bloques
+        self.assertEqual(r["ocupacion"][2][i + 1], 0.2)
+
+    def test_ocupacion_sobre_los_recursos_que_trabajan_el_bloque(self):
+        self.addCleanup(agenda.limpiar)
+        lunes, cita = date(2030, 1, 7), self.citas[0]  # 12:00 en Silla 1
+        with self.captureOnCommitCallbacks(execute=True):
+            silla2 = Recurso.objects.create(sucursal=_principal(), nombre="Silla 2")
+            JornadaRecurso.objects.create(recurso=silla2, dia_semana=0, abre="12:00", cierra="12:30")
+            Horario.objects.create(
+                usuario_horario=cita.usuario_horario, hora_horario=cita.hora_horario, Tipo_servicio=cita.Tipo_servicio,
+                recurso=silla2, fecha=lunes,
+            )
+        r = self._get("panel_api_ocupacion", start="2030-01-07", end="2030-01-08")
+        self.assertEqual(r["dias"], ["Lunes"])
+        self.assertEqual(r["capacidad"][0][:2], [2, 1])  # Silla 2 solo trabaja 12:00–12:30
+        self.assertEqual(r["citas"][0][:2], [2, 1])
+        self.assertEqual(r["ocupacion"][0][:2], [1.0, 1.0])
+
+    def test_ocupacion_incluye_domingo_si_la_agenda_abre(self):
+        self.addCleanup(agenda.limpiar)
+        domingo = date(2030, 1, 13)
+        with self.captureOnCommitCallbacks(execute=True):
+            ExcepcionAgenda.objects.create(sucursal=_principal(), fecha=domingo, abre="12:00", cierra="16:00")
+            _crear_citas(1, fecha=domingo)
+        r = self._get("panel_api_ocupacion")
+        self.assertEqual(r["dias"][-1], "Domingo")
+        self.assertEqual(r["dias_abiertos"], [4, 5, 5, 5, 4, 4, 1])
+        self.assertEqual((r["citas"][-1][0], r["ocupacion"][-1][0]), (1, 1.0))
+
+    def test_tasas_de_cancelacion_y_agregados(self):
+        r = self._get("panel_api_tasas")
+        self.assertEqual(r["tasa_cancelacion"], 0.2)
+        self.assertEqual((r["con_agregados"], r["tasa_agregados"]), (2, 0.5))
+
+
+class EventosFeedTests(TestCase):
+    def setUp(self):
+        self.client.force_login(_staff())
+        self.url = reverse("panel_api_events")
+        self.rango = {"start": "2030-01-06", "end": "2030-01-13"}
+
+    def _eventos(self, r):
+        return json.loads(b"".join(r.streaming_content))
+
+    def test_etag_responde_304_si_el_rango_no_cambio(self):
+        citas = _crear_citas(3)
+        r = self.client.get(self.url, self.rango)
+        self.assertEqual(len(self._eventos(r)), 3)
+        with self.assertNumQueries(3):  # sesión + usuario + versión del rango
+            r304 = self.client.get(self.url, self.rango, HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(r304.status_code, 304)
+
+        citas[0].estado = "C"
+        citas[0].save(update_fields=["estado"])
+        r2 = self.client.get(self.url, self.rango, HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(r2.status_code, 200)
+        self.assertEqual(len(self._eventos(r2)), 2)
+
+    def test_proyeccion_en_streaming_y_gzip(self):
+        _crear_citas(2)
+        Usuario.objects.update(nombre='Ana "La" Ñuñez')
+        sid = sucursales.actual().principal.id
+        catalogo.actual(sid)
+        agenda.actual(sid)
+        with self.assertNumQueries(4):  # sesión + usuario + versión + una consulta de eventos
+            data = self._eventos(self.client.get(self.url, self.rango))
+        self.assertEqual(data[1]["title"], 'Ana "La" Ñuñez · Corte de pelo')
+        self.assertEqual((data[1]["start"], data[1]["end"]), ("2030-01-07T12:30:00", "2030-01-07T13:00:00"))
+        self.assertEqual(data[1]["extendedProps"], {
+            "estado": "Pendiente", "servicio": "Corte de pelo", "recurso": "Silla 1", "hora": "12:30",
+            "dia_semana": "Lunes", "rut": "11.111.111-1", "celular": "+56912345678",
+        })
+
+        r = self.client.get(self.url, self.rango, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(r["Content-Encoding"], "gzip")
+        self.assertTrue(r["ETag"].startswith("W/"))
+        self.assertEqual(json.loads(gzip.decompress(b"".join(r.streaming_content))), data)
+        r304 = self.client.get(self.url, self.rango, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(r304.status_code, 304)
+
+    def test_updated_since_solo_trae_lo_cambiado(self):
+        citas = _crear_citas(3)
+        Horario.objects.update(modified_at=timezone.now() - timedelta(minutes=5))
+        cursor = (timezone.now() - timedelta(minutes=1)).isoformat()
+
+        citas[1].estado = "C"
+        citas[1].save(update_fields=["estado"])
+        citas[2].estado = "A"
+        citas[2].save(update_fields=["estado"])
+
+        data = self.client.get(self.url, {**self.rango, "updated_since": cursor}).json()
+        self.assertEqual([e["id"] for e in data["events"]], [citas[2].id])
+        self.assertEqual(data["removed"], [citas[1].id])
+
+        # Sin cambios nuevos el cursor no avanza: misma URL -> 304
+        siguiente = {**self.rango, "updated_since": data["cursor"]}
+        r = self.client.get(self.url, siguiente)
+        self.assertEqual(self.client.get(self.url, siguiente, HTTP_IF_NONE_MATCH=r["ETag"]).status_code, 304)
+
+
+    def test_renombrar_servicio_o_cliente_cambia_la_version(self):
+        citas = _crear_citas(2)
+        Horario.objects.update(modified_at=timezone.now() - timedelta(minutes=5))
+        r = self.client.get(self.url, self.rango)
+        etag, nombres = r["ETag"], r["X-Nombres-Version"]
+        cursor = (timezone.now() - timedelta(minutes=1)).isoformat()
+
+        servicio = citas[0].Tipo_servicio
+        servicio.nombre = "Corte clásico"
+        with self.captureOnCommitCallbacks(execute=True):
+            servicio.save()  # no toca Horario.modified_at
+        r = self.client.get(self.url, self.rango, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r["X-Nombres-Version"], nombres)
+
+        # Un delta con la versión vieja de nombres reenvía todo el rango
+        delta = {**self.rango, "updated_since": cursor, "nombres": nombres}
+        data = self.client.get(self.url, delta).json()
+        self.assertEqual([e["title"] for e in data["events"]], ["Cliente · Corte clásico"] * 2)
+        delta["nombres"] = r["X-Nombres-Version"]
+        self.assertEqual(self.client.get(self.url, delta).json()["events"], [])
+
+        u = citas[0].usuario_horario
+        u.nombre = "Ana"
+        u.save()
+        self.assertNotEqual(self.client.get(self.url, self.rango)["ETag"], r["ETag"])
+
+
+class StreamCitasTests(TestCase):
+    def test_sin_asgi_responde_204(self):
+        r = self.client.get(reverse("api_stream_citas"), {"desde": "2030-01-07", "hasta": "2030-01-14"})
+        self.assertEqual((r.status_code, r.content), (204, b""))
+        self.assertEqual(len(difusion.broker), 0)  # no quedó suscrito
+
+    async def test_rango_hasta_el_horizonte_de_reserva(self):
+        await ConfiguracionAgenda.objects.aupdate(horizonte_dias=90)
+        await sync_to_async(agenda.limpiar)()
+        self.addCleanup(agenda.limpiar)
+        url = reverse("api_stream_citas")
+
+        r = await self.async_client.get(url, {"desde": "2030-01-01", "hasta": "2030-04-01"})  # 90 días
+        self.assertEqual(r["Content-Type"], "text/event-stream")
+        flujo = aiter(r.streaming_content)
+        self.assertEqual(await anext(flujo), b"retry: 5000\n\n")
+        await flujo.aclose()
+
+        r = await self.async_client.get(url, {"desde": "2030-01-01", "hasta": "2030-04-02"})
+        self.assertEqual(r.status_code, 400)
+
+    async def test_aviso_publicado_desde_otro_hilo_llega_al_stream(self):
+        sid = (await sucursales.aactual()).principal.id
+        r = await self.async_client.get(
+            reverse("api_stream_citas"), {"desde": "2030-01-07", "hasta": "2030-01-14"}
+        )
+        self.assertEqual(r["Content-Type"], "text/event-stream")
+        flujo = aiter(r.streaming_content)
+        self.assertEqual(await anext(flujo), b"retry: 5000\n\n")
+
+        siguiente = asyncio.ensure_future(anext(flujo))
+        await asyncio.sleep(0)  # el generador ya está esperando en la cola
+        for fecha in (date(2030, 1, 20), date(2030, 1, 8)):  # fuera / dentro del rango
+            hilo = threading.Thread(target=difusion.broker.publicar, args=(
+                sid, {"tipo": "reserva", "fecha": fecha, "hora": "12:00", "estado": "P"},
+            ))
+            hilo.start()
+            hilo.join()
+        chunk = await asyncio.wait_for(siguiente, timeout=2)
+        self.assertEqual(
+            chunk,
+            b'event: cita\ndata: {"tipo": "reserva", "fecha": "2030-01-08", "hora": "12:00", "estado": "P"}\n\n',
+        )
+        await flujo.aclose()
+
+
+class VistasAsyncTests(TestCase):
+    def setUp(self):
+        _crear_citas(1)  # 2030-01-07 12:00 ocupada
+        self.servicio = Tipo_servicio.objects.get(nombre="Corte de pelo")
+        Horas.objects.create(sucursal=self.servicio.sucursal, hora_Horas="12:30")
+        disponibilidad.limpiar()
+        ventana = patch("Barberia.views._ventana_reservable",
+                        return_value=(date(2030, 1, 7), date(2030, 1, 12)))
+        ventana.start()
+        self.addCleanup(ventana.stop)
+
+    async def test_slots_y_ocupadas(self):
+        r = await self.async_client.get(
+            reverse("api_slots"), {"fecha": "2030-01-07", "servicio": self.servicio.id}
+        )
+        self.assertEqual(r.json(), {"slots": ["12:30"]})
+        r = await self.async_client.get(reverse("api_ocupadas"), {"fecha": "2030-01-07"})
+        self.assertEqual(r.json(), {"rows": [{"dia": "Lunes", "fecha": "07-01-2030", "hora": "12:00"}]})
+
+    async def test_fecha_en_memoria_no_salta_de_hilo(self):
+        slots = {"fecha": "2030-01-07", "servicio": self.servicio.id}
+        await self.async_client.get(reverse("api_slots"), slots)
+        with patch("Barberia.views.sync_to_async") as hilo, \
+                patch("Barberia.catalogo.sync_to_async") as hilo_fotos:
+            r = await self.async_client.get(reverse("api_slots"), slots)
+        self.assertEqual(r.json(), {"slots": ["12:30"]})
+        hilo.assert_not_called()
+        hilo_fotos.assert_not_called()
+
+    def test_cancelar_y_reactivar_en_el_panel_actualiza_los_slots(self):
+        self.client.force_login(_staff())
+        cita, slots = Horario.objects.get(), {"fecha": "2030-01-07", "servicio": self.servicio.id}
+        self.assertEqual(self.client.get(reverse("api_slots"), slots).json(), {"slots": ["12:30"]})
+        # Cancelar descarta el día (otra cita pudo tapar el bloque): una consulta
+        # para rehacerlo. Reactivar marca el bitmap en su lugar, sin consultas.
+        for estado, libres, consultas in (("C", ["12:00", "12:30"], 1), ("P", ["12:30"], 0)):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse("panel_set_estado", args=[cita.pk]), {"estado": estado})
+            with self.assertNumQueries(consultas):
+                r = self.client.get(reverse("api_slots"), slots)
+            self.assertEqual(r.json(), {"slots": libres})
+
+    async def test_registrar_horario_async(self):
+        datos = {
+            "name": "Ana", "rut": "12.345.678-5", "telefono": "912345678",
+            "servicio_base_id": self.servicio.id, "hora": "12:30", "fecha": "2030-01-07",
+        }
+        r = await self.async_client.post("/RegistrarAgendamiento", datos)
+        self.assertContains(r, "Ana")
+        self.assertEqual(await Horario.objects.filter(hora_inicio=time(12, 30)).acount(), 1)
+
+        r = await self.async_client.post("/RegistrarAgendamiento", datos)
+        self.assertEqual(r.status_code, 400)
+
+
+class CatalogoTests(TestCase):
+    def setUp(self):
+        self.sid = _crear_citas(1)[0].sucursal_id
+        sucursales.actual()
+        catalogo.actual(self.sid)
+        agenda.actual(self.sid)
+        cierres.actual(self.sid)
+
+    def test_vistas_publicas_sin_consultar_catalogo(self):
+        with self.assertNumQueries(0):
+            r = self.client.get("/Agendamiento/")
+        self.assertEqual([s.nombre for s in r.context["tipos_base"]], ["Corte de pelo"])
+        with self.assertNumQueries(0):
+            self.client.get(reverse("consultas"))
+
+    @override_settings(CATALOGO_REVISION=0)
+    def test_cambio_invalida_por_senal_y_por_version(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            s = Tipo_servicio.objects.create(sucursal_id=self.sid, nombre="Barba", precio_servicio=5000)
+        self.assertEqual(catalogo.actual(self.sid).precios[s.id], 5000)
+
+        # Otro proceso cambió el catálogo (update no manda señales): se
+        # recarga solo cuando cambia la versión compartida
+        Tipo_servicio.objects.filter(id=s.id).update(precio_servicio=6000)
+        self.assertEqual(catalogo.actual(self.sid).precios[s.id], 5000)
+        catalogo.cache.set(catalogo.clave_version(self.sid), "otra")
+        self.assertEqual(catalogo.actual(self.sid).precios[s.id], 6000)
+
+
+class CierresTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cierres.limpiar)  # lo creado aquí se revierte al final
+
+    def test_rangos_y_cierre_parcial(self):
+        lunes, suc = date(2030, 1, 7), _principal()
+        DiaCerrado.objects.create(sucursal=suc, fecha=lunes, hasta=lunes + timedelta(days=2))
+        DiaCerrado.objects.create(sucursal=suc, fecha=lunes + timedelta(days=4), desde_hora="16:00")
+        c = cierres.actual(suc.id)
+        self.assertTrue(c.cerrado(lunes + timedelta(days=1)))
+        self.assertFalse(c.cerrado(lunes + timedelta(days=4)))
+        self.assertEqual(c.cierre_desde(lunes + timedelta(days=4)), 16 * 60)
+        self.assertEqual(
+            c.cerrados(lunes + timedelta(days=1), lunes + timedelta(days=5)),
+            {lunes + timedelta(days=1), lunes + timedelta(days=2)},
+        )
+        self.assertEqual(len(c.en_rango(lunes, lunes + timedelta(days=6))), 4)
+
+    def test_cierre_parcial_recorta_slots(self):
+        cita = _crear_citas(1, fecha=date(2030, 1, 11))[0]  # viernes 12:00
+        sid = cita.sucursal_id
+        for h in ["15:30", "16:00", "16:30"]:
+            Horas.objects.create(sucursal_id=sid, hora_Horas=h)
+        disponibilidad.limpiar()
+        servicio = cita.Tipo_servicio_id
+        self.assertEqual(disponibilidad.slots_libres(sid, date(2030, 1, 11), servicio), ["15:30", "16:00", "16:30"])
+
+        DiaCerrado.objects.create(sucursal_id=sid, fecha=date(2030, 1, 11), desde_hora="16:00")
+        self.assertEqual(disponibilidad.slots_libres(sid, date(2030, 1, 11), servicio), ["15:30"])
+
+    def test_abrir_hoy_parte_el_rango(self):
+        hoy, suc = timezone.localdate(), _principal()
+        dias = lambda n: hoy + timedelta(days=n)  # noqa: E731
+        DiaCerrado.objects.create(sucursal=suc, fecha=dias(-2), hasta=dias(3), desde_hora="16:00", motivo="Vacaciones")
+        DiaCerrado.objects.create(sucursal=suc, fecha=dias(-10), hasta=dias(-5))  # no toca HOY
+        self.client.force_login(_staff())
+
+        r = self.client.post(reverse("panel_calendario"), {"abrir_hoy": "1"})
+        self.assertEqual(r.status_code, 302)
+        self.assertEqual(
+            list(DiaCerrado.objects.filter(sucursal=suc).order_by("fecha").values_list("fecha", "hasta", "motivo")),
+            [(dias(-10), dias(-5), None), (dias(-2), dias(-1), "Vacaciones"), (dias(1), dias(3), "Vacaciones")],
+        )
+        c = cierres.actual(suc.id)
+        self.assertIsNone(c.cierre_desde(hoy))
+        self.assertEqual(c.cierre_desde(dias(2)), 16 * 60)
+
+        # Cierre que empieza hoy y termina mañana: queda solo mañana, de un día
+        DiaCerrado.objects.filter(sucursal=suc).delete()
+        DiaCerrado.objects.create(sucursal=suc, fecha=hoy, hasta=dias(1))
+        self.client.post(reverse("panel_calendario"), {"abrir_hoy": "1"})
+        self.assertEqual(list(DiaCerrado.objects.filter(sucursal=suc).values_list("fecha", "hasta")), [(dias(1), None)])
+
+    def test_abrir_hoy_con_cierres_solapados(self):
+        hoy, suc = timezone.localdate(), _principal()
+        dias = lambda n: hoy + timedelta(days=n)  # noqa: E731
+        DiaCerrado.objects.create(sucursal=suc, fecha=dias(-1), hasta=dias(5), motivo="Vacaciones")
+        DiaCerrado.objects.create(sucursal=suc, fecha=dias(1), motivo="Feriado")  # ya empieza mañana
+        self.client.force_login(_staff())
+
+        self.client.post(reverse("panel_calendario"), {"abrir_hoy": "1"})
+        # El resto del rango no se pierde: el cierre de mañana se alarga
+        self.assertEqual(
+            list(DiaCerrado.objects.filter(sucursal=suc).order_by("fecha").values_list("fecha", "hasta", "motivo")),
+            [(dias(-1), None, "Vacaciones"), (dias(1), dias(5), "Feriado")],
+        )
+        c = cierres.actual(suc.id)
+        self.assertFalse(c.cerrado(hoy))
+        self.assertEqual(c.cerrados(dias(1), dias(6)), {dias(n) for n in range(1, 6)})
+
+
+class AgendaTests(TestCase):
+    def setUp(self):
+        self.addCleanup(agenda.limpiar)
+        self.addCleanup(disponibilidad.limpiar)
+        cita = _crear_citas(1, fecha=date(2030, 1, 5))[0]  # sábado 12:00
+        self.servicio, self.sid = cita.Tipo_servicio_id, cita.sucursal_id
+        for h in ["12:30", "13:00", "13:30", "15:00", "15:30"]:
+            Horas.objects.create(sucursal_id=self.sid, hora_Horas=h)
+
+    def test_horario_excepcion_y_granularidad(self):
+        sabado, domingo = date(2030, 1, 5), date(2030, 1, 6)
+        # Sábado 12:00–15:30: 15:30 queda fuera; domingo sin regla
+        self.assertEqual(disponibilidad.slots_libres(self.sid, sabado, self.servicio), ["12:30", "13:00", "13:30", "15:00"])
+        self.assertEqual(disponibilidad.slots_libres(self.sid, domingo, self.servicio), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ExcepcionAgenda.objects.create(sucursal_id=self.sid, fecha=domingo, abre="13:00", cierra="16:00")
+            config = ConfiguracionAgenda.objects.get()
+            config.granularidad_minutos = 60
+            config.save()
+        self.assertEqual(disponibilidad.slots_libres(self.sid, domingo, self.servicio), ["13:00", "15:00"])
+        self.assertEqual(agenda.actual(self.sid).horario_semana()[6], ("Domingo", "Cerrado"))
+
+    def test_horizonte_no_suma_consultas(self):
+        hoy = timezone.localdate()
+        for horizonte in (7, 28):
+            ConfiguracionAgenda.objects.update(horizonte_dias=horizonte)
+            agenda.limpiar()
+            disponibilidad.limpiar()
+            sucursales.actual()
+            agenda.actual(self.sid)
+            cierres.actual(self.sid)
+            with self.assertNumQueries(1):  # citas activas del rango, agrupadas
+                r = self.client.get(reverse("api_slots_semana"))
+            datos = r.json()
+            self.assertEqual(datos["hasta"], (hoy + timedelta(days=horizonte - 1)).isoformat())
+            self.assertEqual(len(datos["dias"]), horizonte)
+
+
+class DuracionesTests(TestCase):
+    def setUp(self):
+        self.addCleanup(disponibilidad.limpiar)
+        self.lunes, self.sid = date(2030, 1, 7), _principal().id
+        for h in ["12:00", "12:30", "13:00", "13:30", "14:00"]:
+            Horas.objects.create(sucursal_id=self.sid, hora_Horas=h)
+        self.corte = Tipo_servicio.objects.create(sucursal_id=self.sid, nombre="Corte", precio_servicio=8000)
+        self.color = Tipo_servicio.objects.create(
+            sucursal_id=self.sid, nombre="Color", precio_servicio=20000, duracion_minutos=60,
+        )
+        self.lineas = Tipo_servicio.objects.create(
+            sucursal_id=self.sid, nombre="Líneas", precio_servicio=1000, tipo="ADDON", duracion_minutos=15,
+        )
+
+    def _reservar(self, hora, servicio, addons=()):
+        with self.captureOnCommitCallbacks(execute=True):
+            return reservar(
+                sucursal_id=self.sid, nombre="Cliente", rut="11.111.111-1", celular="912345678", fecha=self.lunes,
+                hora=Horas.objects.get(hora_Horas=hora), servicio_id=servicio.id, addons_ids=addons,
+            )[1]
+
+    def test_cita_larga_bloquea_todo_su_intervalo(self):
+        h = self._reservar("12:30", self.color)
+        self.assertEqual((h.duracion_minutos, h.hora_fin), (60, time(13, 30)))
+        self.assertEqual(disponibilidad.horas_ocupadas(self.sid, self.lunes), ["12:30", "13:00"])
+        self.assertEqual(disponibilidad.slots_libres(self.sid, self.lunes, self.corte.id), ["12:00", "13:30", "14:00"])
+        # Corte + Líneas = 45': dos bloques seguidos (14:30 no existe en la grilla)
+        self.assertEqual(disponibilidad.slots_libres(self.sid, self.lunes, self.corte.id, [self.lineas.id]), ["13:30"])
+
+        with self.assertRaises(HoraOcupada):
+            self._reservar("13:00", self.corte)         # empieza dentro de la otra
+        with self.assertRaises(HoraOcupada):
+            self._reservar("12:00", self.color)         # terminaría dentro de la otra
+
+        h = self._reservar("13:30", self.corte, [self.lineas.id])
+        self.assertEqual((h.duracion_minutos, h.hora_fin), (45, time(14, 15)))
+        self.assertEqual(disponibilidad.horas_ocupadas(self.sid, self.lunes), ["12:30", "13:00", "13:30", "14:00"])
+        self.assertEqual(disponibilidad.slots_libres(self.sid, self.lunes, self.corte.id), ["12:00"])
+
+    def test_semana_por_largo_de_cita(self):
+        self._reservar("12:30", self.color)
+        with patch("Barberia.views._ventana_reservable", return_value=(self.lunes, self.lunes)):
+            datos = self.client.get(reverse("api_slots_semana")).json()
+        self.assertEqual(datos["duraciones"][str(self.lineas.id)], 15)
+        self.assertEqual(datos["dias"]["2030-01-07"]["slots"], {
+            "1": ["12:00", "13:30", "14:00"], "2": ["13:30"], "3": [],
+        })
+
+
+class RecursosTests(TestCase):
+    def setUp(self):
+        self.addCleanup(agenda.limpiar)
+        self.addCleanup(disponibilidad.limpiar)
+        self.lunes, self.sid = date(2030, 1, 7), _principal().id
+        for h in ["12:00", "12:30", "13:00", "13:30"]:
+            Horas.objects.create(sucursal_id=self.sid, hora_Horas=h)
+        self.corte = Tipo_servicio.objects.create(sucursal_id=self.sid, nombre="Corte", precio_servicio=8000)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.s1 = Recurso.objects.get()  # "Silla 1" de la migración
+            self.s2 = Recurso.objects.create(sucursal_id=self.sid, nombre="Silla 2")
+            # La silla 2 solo trabaja los lunes desde las 13:00
+            JornadaRecurso.objects.create(recurso=self.s2, dia_semana=0, abre="13:00", cierra="14:00")
+
+    def _reservar(self, hora, recurso=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return reservar(
+                sucursal_id=self.sid, nombre="Cliente", rut="11.111.111-1", celular="912345678", fecha=self.lunes,
+                hora=Horas.objects.get(hora_Horas=hora), servicio_id=self.corte.id,
+                recurso_id=recurso and recurso.id,
+            )[1]
+
+    def test_cualquier_barbero_toma_el_siguiente_libre(self):
+        self.assertEqual(self._reservar("13:00").recurso_id, self.s1.id)
+        self.assertEqual(self._reservar("13:00").recurso_id, self.s2.id)
+        with self.assertRaises(HoraOcupada):
+            self._reservar("13:00")
+        # 12:00: la silla 2 aún no trabaja
+        self.assertEqual(self._reservar("12:00").recurso_id, self.s1.id)
+        with self.assertRaises(HoraOcupada):
+            self._reservar("12:00")
+
+        self.assertEqual(disponibilidad.slots_libres(self.sid, self.lunes, self.corte.id), ["12:30", "13:30"])
+        self.assertEqual(disponibilidad.slots_libres(self.sid, self.lunes, self.corte.id, recurso_id=self.s2.id), ["13:30"])
+        self.assertEqual(disponibilidad.horas_ocupadas(self.sid, self.lunes), ["12:00", "13:00"])
+
+    def test_semana_por_recurso_en_una_consulta(self):
+        self._reservar("12:30")
+        sucursales.actual()
+        agenda.actual(self.sid)
+        cierres.actual(self.sid)
+        with patch("Barberia.views._ventana_reservable", return_value=(self.lunes, self.lunes + timedelta(days=6))):
+            with self.assertNumQueries(1):  # citas activas del rango, de todos los recursos
+                datos = self.client.get(reverse("api_slots_semana")).json()
+        self.assertEqual([r["nombre"] for r in datos["recursos"]], ["Silla 1", "Silla 2"])
+        lunes = datos["dias"]["2030-01-07"]
+        self.assertEqual(lunes["slots"]["1"], ["12:00", "13:00", "13:30"])
+        self.assertEqual(lunes["recursos"][str(self.s1.id)]["1"], ["12:00", "13:00", "13:30"])
+        self.assertEqual(lunes["recursos"][str(self.s2.id)]["1"], ["13:00", "13:30"])
+        self.assertEqual(lunes["ocupadas"], ["12:30"])
+        # Martes: la silla 2 no trabaja
+        self.assertEqual(datos["dias"]["2030-01-08"]["recursos"][str(self.s2.id)]["1"], [])
+
+
+class PanelConsultasTests(TestCase):
+    def setUp(self):
+        self.client.force_login(_staff())
+
+    def test_panel_horarios_cantidad_fija_de_consultas(self):
+        # sesión + usuario + página activas (keyset, sin COUNT) + prefetch
+        # agregados; días y servicios salen del catálogo en memoria
+        sid = _crear_citas(1)[0].sucursal_id
+        sucursales.actual()
+        catalogo.actual(sid)
+        with self.assertNumQueries(4):
+            self.client.get(reverse("panel_horarios"))
+        _crear_citas(9, desde=1)
+        catalogo.actual(sid)
+        with self.assertNumQueries(4):
+            self.client.get(reverse("panel_horarios"))
+
+    def test_hora_y_dia_nativos_sin_join(self):
+        cita = _crear_citas(2)[1]
+        cita.refresh_from_db()
+        self.assertEqual((cita.dia_semana, cita.hora_inicio), (0, time(12, 30)))
+        cita.fecha = date(2030, 1, 12)
+        cita.save(update_fields=["fecha"])
+        cita.refresh_from_db()
+        self.assertEqual(cita.get_dia_semana_display(), "Sábado")
+
+        with self.assertNumQueries(1) as ctx:
+            list(Horario.objects.order_by(*ORDEN_CITAS).values_list("fecha", "hora_inicio", "dia_semana"))
+        self.assertNotIn("barberia_horas", ctx.captured_queries[0]["sql"].lower())
+
+    def test_panel_horarios_paginacion_por_cursor(self):
+        citas = _crear_citas(20) + _crear_citas(5, fecha=date(2030, 1, 8))
+        url = reverse("panel_horarios")
+
+        vistas = []
+        pagina = self.client.get(url).context["citas"]
+        while True:
+            vistas.append([c.id for c in pagina])
+            if not pagina.has_next:
+                break
+            pagina = self.client.get(url, {"despues": pagina.cursor_siguiente}).context["citas"]
+        self.assertEqual([len(v) for v in vistas], [10, 10, 5])
+        self.assertEqual(sum(vistas, []), [c.id for c in citas])
+
+        atras = self.client.get(url, {"antes": pagina.cursor_anterior}).context["citas"]
+        self.assertEqual([c.id for c in atras], vistas[1])
+        self.assertTrue(atras.has_previous and atras.has_next)
+
+        r = self.client.get(url, {"contar": "1"})
+        self.assertEqual(r.context["total_citas"], 25)
+
+    def test_busqueda_sin_tildes_y_por_rut(self):
+        cita = _crear_citas(1)[0]
+        u = cita.usuario_horario
+        u.nombre = "José Pérez"
+        u.save()
+        for q, esperado in [("jose", 1), ("PEREZ", 1), ("pér jos", 1), ("11.111", 1),
+                            ("11111111-1", 1), ("gomez", 0), ("--", 0)]:
+            r = self.client.get(reverse("panel_horarios"), {"q": q})
+            self.assertEqual(len(r.context["citas"]), esperado, q)
+
+    def test_listado_publico_cantidad_fija_de_consultas(self):
+        # sesión + usuario + citas del día + prefetch agregados
+        _crear_citas(1)
+        sucursales.actual()
+        with self.assertNumQueries(4):
+            self.client.get("/Agendamiento/ListadoHora?fecha=2030-01-07")
+        _crear_citas(9, desde=1)
+        with self.assertNumQueries(4):
+            self.client.get("/Agendamiento/ListadoHora?fecha=2030-01-07")
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(_staff())
+        self.rango = {"start": "2030-01-01", "end": "2030-02-01"}
+
+    def _csv(self, r):
+        self.assertEqual(r["Content-Type"], "text/csv; charset=utf-8")
+        return list(csv.reader(b"".join(r.streaming_content).decode("utf-8").splitlines()))
+
+    def test_csv_rango_en_streaming_con_agregados_y_total(self):
+        citas = _crear_citas(3)
+        filas = self._csv(self.client.get(reverse("panel_export_rango"), self.rango))
+        self.assertEqual(filas[0], HEADERS_RANGO)
+        self.assertEqual(len(filas), 1 + 3)
+        self.assertEqual(filas[3][0], str(citas[2].id))
+        self.assertEqual(filas[3][9:], ["Líneas, Perfilado de cejas", "11000"])
+        self.assertEqual([f[-1] for f in filas[1:]], ["8000", "9000", "11000"])
+
+    def test_csv_panel_por_lotes_y_con_filtros(self):
+        _crear_citas(5)
+        _crear_citas(1, fecha=date(2030, 1, 8))
+        with patch("Barberia.views.EXPORT_CHUNK", 2):  # varios lotes
+            filas = self._csv(self.client.get(reverse("panel_export")))
+        self.assertEqual(filas[0], ["ID", "Cliente", "RUT", "Día", "Hora", "Servicio", "Estado"])
+        self.assertEqual(len(filas), 1 + 6)
+        self.assertEqual(filas[1][3:], ["Lunes", "12:00", "Corte de pelo", "Pendiente"])
+        filas = self._csv(self.client.get(reverse("panel_export"), {"dia": "1"}))
+        self.assertEqual([f[3] for f in filas[1:]], ["Martes"])
+
+
+class ExcelTests(TestCase):
+    def test_excel_rango_encabezados_filas_y_anchos(self):
+        self.client.force_login(_staff())
+        citas = _crear_citas(3)
+        r = self.client.get(reverse("panel_export_rango_excel"), {"start": "2030-01-01", "end": "2030-02-01"})
+        ws = load_workbook(BytesIO(b"".join(r.streaming_content)))["Citas"]
+
+        filas = list(ws.iter_rows(values_only=True))
+        self.assertEqual(list(filas[0]), HEADERS_RANGO)
+        self.assertEqual([f[0] for f in filas[1:]], [c.id for c in citas])
+        self.assertEqual(filas[3][1:4], ("07-01-2030", "13:00", "Cliente"))
+        self.assertEqual(filas[3][9:], ("Líneas, Perfilado de cejas", 11000))
+
+        anchos = [ws.column_dimensions[get_column_letter(i)].width for i in range(1, 12)]
+        self.assertEqual(anchos[3], len("Cliente") + 3)
+        self.assertEqual(anchos[6], len("Corte de pelo") + 3)
+        self.assertEqual(anchos[9], len("Líneas, Perfilado de cejas") + 3)  # lista unida más larga
+        self.assertEqual(anchos[10], len("Total") + 3)
+
+
+class TrabajosTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        ajustes = override_settings(TRABAJOS_DIR=Path(tmp.name))
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.staff, self.otro = _staff(), _staff("otro")
+        _crear_citas(2)
+
+    def _encolar(self):
+        self.client.force_login(self.staff)
+        r = self.client.post(reverse("panel_trabajo_excel") + "?start=2030-01-01&end=2030-02-01")
+        self.assertEqual((r.status_code, r.json()["estado"]), (202, "P"))
+        return r.json()
+
+    def test_encolar_reclamar_y_descargar(self):
+        datos = self._encolar()
+        t = trabajos.reclamar()
+        self.assertEqual((str(t.id), t.estado, t.intentos), (datos["id"], "E", 1))
+        self.assertIsNotNone(t.reclamado)
+        self.assertIsNone(trabajos.reclamar())  # ya no queda pendiente
+        self.assertEqual(self.client.get(datos["estado_url"]).json()["descarga"], None)
+
+        self.assertTrue(trabajos.ejecutar(t))
+        estado = self.client.get(datos["estado_url"]).json()
+        self.assertEqual(estado["estado"], "L")
+        r = self.client.get(estado["descarga"])
+        self.assertEqual(r["Content-Disposition"], 'attachment; filename="citas_20300101_20300201.xlsx"')
+        ws = load_workbook(BytesIO(b"".join(r.streaming_content)))["Citas"]
+        self.assertEqual(ws.max_row, 1 + 2)
+
+        # Otro staff, un cliente anónimo: el Excel no existe para ellos
+        self.client.force_login(self.otro)
+        self.assertEqual(self.client.get(datos["estado_url"]).status_code, 404)
+        self.assertEqual(self.client.get(estado["descarga"]).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(estado["descarga"]).status_code, 404)
+
+    def test_fallido_guarda_el_error(self):
+        t = trabajos.encolar("EXCEL", start="2030-01-01")  # sin end
+        reclamo = trabajos.reclamar()
+        self.assertEqual(reclamo.id, t.id)
+        with self.assertLogs("Barberia.trabajos", "ERROR"):
+            self.assertFalse(trabajos.ejecutar(reclamo))
+        t.refresh_from_db()
+        self.assertEqual(t.estado, "F")
+        self.assertTrue(t.error and t.terminado)
+
+    @override_settings(TRABAJOS_PLAZO_MINUTOS=15, TRABAJOS_MAX_INTENTOS=2)
+    def test_plazo_vencido_reencola_y_luego_falla(self):
+        t = trabajos.encolar("EXCEL", start="2030-01-01", end="2030-02-01")
+        vencer = lambda: Trabajo.objects.update(reclamado=timezone.now() - timedelta(minutes=16))  # noqa: E731
+
+        trabajos.reclamar()
+        self.assertEqual(trabajos.reencolar_vencidos(), 0)  # aún dentro del plazo
+        vencer()
+        self.assertEqual(trabajos.reencolar_vencidos(), 1)
+        t.refresh_from_db()
+        self.assertEqual((t.estado, t.reclamado), ("P", None))
+
+        self.assertEqual(trabajos.reclamar().intentos, 2)
+        vencer()
+        trabajos.reencolar_vencidos()
+        t.refresh_from_db()
+        self.assertEqual(t.estado, "F")
+        self.assertIsNone(trabajos.reclamar())
+        # Terminado: purgar() ya lo puede borrar
+        self.assertEqual(trabajos.purgar(0), 1)
+
+    def test_reclamo_vencido_no_pisa_al_nuevo(self):
+        trabajos.encolar("EXCEL", sucursal=_principal().id, start="2030-01-01", end="2030-02-01")
+        lento = trabajos.reclamar()
+        Trabajo.objects.update(reclamado=timezone.now() - timedelta(minutes=60))
+        trabajos.reencolar_vencidos()
+        rapido = trabajos.reclamar()
+
+        self.assertTrue(trabajos.ejecutar(rapido))
+        with self.assertLogs("Barberia.trabajos", "WARNING"):
+            self.assertFalse(trabajos.ejecutar(lento))  # termina después: se descarta
+        t = Trabajo.objects.get()
+        self.assertEqual((t.estado, t.archivo), ("L", f"{t.id}-2.xlsx"))
+        self.assertEqual([p.name for p in trabajos.directorio().iterdir()], [t.archivo])
+
+
+class ComprobanteTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        ajustes = override_settings(COMPROBANTES_DIR=self.dir)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        silencio = patch.object(logging.getLogger("xhtml2pdf"), "disabled", True)  # CSS/imágenes externas
+        silencio.start()
+        self.addCleanup(silencio.stop)
+        self.cita = _crear_citas(2)[1]  # con el agregado "Líneas"
+        self.url = reverse("generar_comprobante", args=[self.cita.id])
+
+    def _pdfs(self):
+        return sorted(p.relative_to(self.dir).as_posix() for p in self.dir.glob("*/*.pdf"))
+
+    def test_cache_en_disco_y_etag(self):
+        r = self.client.get(self.url)
+        self.assertEqual(r["Content-Type"], "application/pdf")
+        pdf, etag = b"".join(r.streaming_content), r["ETag"]
+        self.assertEqual(self._pdfs(), [f"{self.cita.id}/{etag.strip(chr(34))}.pdf"])
+
+        with patch("Barberia.reportes.escribir_pdf_comprobante") as render:
+            r = self.client.get(self.url)
+            self.assertEqual(b"".join(r.streaming_content), pdf)
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        render.assert_not_called()
+
+    def test_editar_invalida_cache_y_etag(self):
+        etags = [self.client.get(self.url)["ETag"]]
+        u = self.cita.usuario_horario
+        u.nombre = "Ana"
+        with self.captureOnCommitCallbacks(execute=True):
+            u.save()
+        self.assertEqual(self._pdfs(), [])
+        etags.append(self.client.get(self.url)["ETag"])
+
+        base = self.cita.Tipo_servicio
+        base.nombre = "Corte clásico"
+        with self.captureOnCommitCallbacks(execute=True):
+            base.save()
+        self.assertEqual(self._pdfs(), [])
+        etags.append(self.client.get(self.url)["ETag"])
+
+        addon = self.cita.agregados.get()
+        addon.nombre = "Líneas dobles"
+        with self.captureOnCommitCallbacks(execute=True):
+            addon.save()
+        self.assertEqual(self._pdfs(), [])
+        r = self.client.get(self.url)
+        etags.append(r["ETag"])
+        self.assertEqual(len(set(etags)), 4)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etags[0]).status_code, 200)
+
+        self.cita.estado = "A"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cita.save(update_fields=["estado"])
+        self.assertEqual(self._pdfs(), [])
+
+    def test_invalida_solo_al_confirmar(self):
+        self.client.get(self.url)
+        otra = _crear_citas(1, desde=2)[0]
+        self.client.get(reverse("generar_comprobante", args=[otra.id]))
+        self.assertEqual(len(self._pdfs()), 2)
+
+        self.cita.estado = "A"
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.cita.save(update_fields=["estado"])
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(len(self._pdfs()), 2)  # revertido: el PDF sigue valiendo
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cita.save(update_fields=["estado"])
+        self.assertEqual([p.split("/")[0] for p in self._pdfs()], [str(otra.id)])  # solo la carpeta de esa cita
+        self.assertFalse((self.dir / str(self.cita.id)).exists())
+
+
+class SucursalesTests(TestCase):
+    def setUp(self):
+        self.addCleanup(sucursales.limpiar)
+        self.addCleanup(agenda.limpiar)
+        self.addCleanup(disponibilidad.limpiar)
+        with self.captureOnCommitCallbacks(execute=True):
+            _crear_citas(2)  # principal: lunes 12:00 y 12:30 ocupadas
+            self.centro = Sucursal.objects.create(nombre="Centro", slug="centro", dominio="centro.example.com")
+            ReglaAgenda.objects.create(sucursal=self.centro, dia_semana=0, abre="12:00", cierra="13:00")
+            for h in ["12:00", "12:30"]:
+                self.centro.horas.create(hora_Horas=h)
+            self.corte = self.centro.servicios.create(nombre="Corte de pelo", precio_servicio=9000)
+            self.centro.recursos.create(nombre="Silla 1")
+        ventana = patch("Barberia.views._ventana_reservable",
+                        return_value=(date(2030, 1, 7), date(2030, 1, 12)))
+        ventana.start()
+        self.addCleanup(ventana.stop)
+
+    def test_por_ruta_cada_sucursal_ve_solo_lo_suyo(self):
+        slots = {"fecha": "2030-01-07", "servicio": self.corte.id}
+        r = self.client.get("/sucursal/centro/api/slots", slots)
+        self.assertEqual(r.json(), {"slots": ["12:00", "12:30"]})
+        r = self.client.get("/sucursal/centro/api/ocupadas", {"fecha": "2030-01-07"})
+        self.assertEqual(r.json(), {"rows": []})
+        # El servicio de otra sucursal no existe en la principal
+        self.assertEqual(self.client.get("/api/slots", slots).status_code, 404)
+        self.assertEqual(len(self.client.get("/api/ocupadas", {"fecha": "2030-01-07"}).json()["rows"]), 2)
+
+        # Los enlaces de la página conservan el prefijo de la sucursal
+        self.assertContains(self.client.get("/sucursal/centro/Agendamiento/"),
+                            'action="/sucursal/centro/RegistrarAgendamiento"')
+        self.assertEqual(self.client.get("/sucursal/otra/Agendamiento/").status_code, 404)
+
+    @override_settings(ALLOWED_HOSTS=["centro.example.com", "testserver"])
+    def test_por_dominio_y_panel_aislado(self):
+        datos = {
+            "name": "Ana", "rut": "12.345.678-5", "telefono": "912345678",
+            "servicio_base_id": self.corte.id, "hora": "12:00", "fecha": "2030-01-07",
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post("/RegistrarAgendamiento", datos, HTTP_HOST="centro.example.com")
+        self.assertContains(r, "Ana")
+        self.assertEqual(self.centro.citas.get().hora_inicio, time(12, 0))
+
+        self.client.force_login(_staff(locales=[_principal(), self.centro]))
+        rango = {"start": "2030-01-01", "end": "2030-02-01"}
+        r = self.client.get(reverse("panel_api_stats"), rango, HTTP_HOST="centro.example.com")
+        self.assertEqual(r.json()["ingresos"], [9000])
+        self.assertEqual(self.client.get(reverse("panel_api_stats"), rango).json()["ingresos"], [17000])
+        r = self.client.get(reverse("panel_horarios"), HTTP_HOST="centro.example.com")
+        self.assertEqual([c.usuario_horario.nombre for c in r.context["citas"]], ["Ana"])
+
+    @override_settings(ALLOWED_HOSTS=["centro.example.com", "testserver"])
+    def test_staff_de_otra_sucursal_no_entra_al_panel(self):
+        self.client.force_login(_staff(locales=[self.centro]))
+        rango = {"start": "2030-01-01", "end": "2030-02-01"}
+        self.assertEqual(self.client.get(reverse("panel_api_stats"), rango, HTTP_HOST="centro.example.com").status_code, 200)
+        self.assertEqual(self.client.get("/sucursal/centro" + reverse("panel_horarios")).status_code, 200)
+        # La principal: ni por ruta ni por sus vistas de escritura
+        self.assertEqual(self.client.get(reverse("panel_api_stats"), rango).status_code, 403)
+        self.assertEqual(self.client.get(reverse("panel_horarios")).status_code, 403)
+        cita = Horario.objects.filter(sucursal=_principal()).first()
+        r = self.client.post(reverse("panel_set_estado", args=[cita.pk]), {"estado": "C"})
+        self.assertEqual(r.status_code, 403)
+        cita.refresh_from_db()
+        self.assertEqual(cita.estado, "P")
+
+        # Un superusuario entra a todas
+        self.client.force_login(get_user_model().objects.create_superuser("admin", password="x"))
+        self.assertEqual(self.client.get(reverse("panel_api_stats"), rango).status_code, 200)
+
+
+class ReclamarConcurrenteTests(TransactionTestCase):
+    """Varios workers reclaman a la vez el único pendiente: solo uno lo obtiene."""
+
+    N = 8
+
+    def test_un_solo_worker_reclama(self):
+        t = trabajos.encolar("PDF", horario_id=0)
+        barrera = threading.Barrier(self.N)
+        reclamados = []
+
+        def intento():
+            try:
+                barrera.wait()
+                reclamados.append(trabajos.reclamar())
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=intento) for _ in range(self.N)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        self.assertEqual([r.id for r in reclamados if r is not None], [t.id])
+        self.assertEqual(Trabajo.objects.get().intentos, 1)
+
+
+class ReservaConcurrenteTests(TransactionTestCase):
+    """Varias reservas simultáneas al mismo bloque: exactamente una gana."""
+
+    N = 8
+
+    def setUp(self):
+        self.sid = _principal().id
+        self.hora = Horas.objects.create(sucursal_id=self.sid, hora_Horas=time(12, 0))
+        self.servicio = Tipo_servicio.objects.create(sucursal_id=self.sid, nombre="Corte de pelo", precio_servicio=8000)
+        self.addon = Tipo_servicio.objects.create(
+            sucursal_id=self.sid, nombre="Líneas", precio_servicio=1000, tipo="ADDON", duracion_minutos=0,
+        )
+        # El flush de TransactionTestCase borra la silla de la migración
+        self.silla = Recurso.objects.create(sucursal_id=self.sid, nombre="Silla 1")
+
+    def _reservar(self, i):
+        return reservar(
+            sucursal_id=self.sid, nombre=f"Cliente {i}", rut="11.111.111-1", celular="912345678",
+            fecha=date(2030, 1, 7), hora=self.hora,
+            servicio_id=self.servicio.id, addons_ids=[str(self.addon.id)], recurso_id=self.silla.id,
+        )
+
+    def test_una_sola_reserva_gana(self):
+        barrera = threading.Barrier(self.N)
+        resultados = []
+
+        def intento(i):
+            try:
+                barrera.wait()
+                self._reservar(i)
+                resultados.append("ok")
+            except HoraOcupada:
+                resultados.append("ocupada")
+            except OperationalError:
+                # SQLite serializa escrituras con "database is locked"
+                resultados.append("bloqueada")
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=intento, args=(i,)) for i in range(self.N)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        self.assertEqual(resultados.count("ok"), 1, resultados)
+        self.assertEqual(
+            Horario.objects.filter(fecha=date(2030, 1, 7), hora_horario=self.hora).count(), 1
+        )
+        # Las reservas perdedoras no dejan usuarios ni agregados huérfanos
+        self.assertEqual(Usuario.objects.count(), 1)
+        self.assertEqual(Horario.agregados.through.objects.count(), 1)
+
+    def test_reserva_secuencial_sobre_bloque_tomado(self):
+        self._reservar(1)
+        with self.assertRaises(HoraOcupada):
+            self._reservar(2)
+        self.assertEqual(Usuario.objects.count(), 1)
+
+    def test_mismo_rut_reutiliza_usuario(self):
+        otra = Horas.objects.create(sucursal_id=self.sid, hora_Horas=time(12, 30))
+        u1, _ = self._reservar(1)
+        u2, _ = reservar(
+            sucursal_id=self.sid, nombre="Cliente nuevo", rut="11111111-1", celular="987654321",
+            fecha=date(2030, 1, 7), hora=otra, servicio_id=self.servicio.id, recurso_id=self.silla.id,
+        )
+        self.assertEqual(u1.pk, u2.pk)
+        u = Usuario.objects.get()
+        self.assertEqual((u.nombre, u.rut, u.celular), ("Cliente nuevo", "11.111.111-1", "+56987654321"))
+
+
+class FusionarUsuariosTests(TransactionTestCase):
+    """fusionar_duplicados sobre los modelos de 0013: antes del índice único por RUT."""
+
+    ANTES = [("Barberia", "0013_usuario_rut_normalizado")]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.ANTES)
+        self.apps = executor.loader.project_state(self.ANTES).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_fusiona_por_lotes_y_repunta_citas(self):
+        Usuario_, Horario_ = self.apps.get_model("Barberia", "Usuario"), self.apps.get_model("Barberia", "Horario")
+        dia = self.apps.get_model("Barberia", "Dias").objects.create(dia_Dias="Lunes")
+        hora = self.apps.get_model("Barberia", "Horas").objects.create(hora_Horas="12:00")
+        servicio = self.apps.get_model("Barberia", "Tipo_servicio").objects.create(nombre="Corte", precio_servicio=8000)
+
+        def cliente(rut, nombre):
+            u = Usuario_.objects.create(nombre=nombre, celular=f"+569{len(nombre):08d}", rut=rut, rut_normalizado=rut)
+            Horario_.objects.create(dia_horario=dia, hora_horario=hora, usuario_horario=u, Tipo_servicio=servicio)
+            return u
+
+        # 3 RUTs repetidos con lote=2: dos lotes
+        grupos = {rut: [cliente(rut, f"{rut}-{i}") for i in range(n)] for rut, n in
+                  [("111111111", 2), ("222222222", 3), ("333333333", 2)]}
+        unico = cliente("444444444", "único")
+
+        self.assertEqual(fusionar_duplicados(Usuario_, Horario_, lote=2), (3, 4))
+
+        for rut, usuarios in grupos.items():
+            u = Usuario_.objects.get(rut_normalizado=rut)
+            # Conserva el id más bajo con los datos del más reciente
+            self.assertEqual((u.id, u.nombre, u.celular), (usuarios[0].id, usuarios[-1].nombre, usuarios[-1].celular))
+            self.assertEqual(Horario_.objects.filter(usuario_horario=u).count(), len(usuarios))
+        self.assertEqual(Usuario_.objects.count(), 4)
+        self.assertEqual(Horario_.objects.filter(usuario_horario=unico).count(), 1)
+        self.assertEqual(Horario_.objects.count(), 8)  # ninguna cita se pierde
+        self.assertEqual(fusionar_duplicados(Usuario_, Horario_, lote=2), (0, 0))
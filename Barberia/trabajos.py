@@ -0,0 +1,134 @@
+# Barberia/trabajos.py
+"""
+Cola de trabajos en la BD (tabla Trabajo) para lo que no debe correr en el
+hilo del request: export Excel del rango y comprobante PDF.
+
+- encolar(): lo llaman las vistas, que responden de inmediato con el id.
+- reclamar(): toma un pendiente con un UPDATE condicional, así varios
+  workers no procesan el mismo trabajo (sirve igual en SQLite/MySQL/Postgres).
+  Deja la hora en `reclamado`: el trabajo es del worker por un plazo.
+- ejecutar(): genera el archivo en TRABAJOS_DIR y marca Listo/Fallido, solo
+  si su reclamo sigue vigente (si venció y otro worker lo tomó, descarta).
+- reencolar_vencidos(): los 'En curso' con el plazo vencido (worker caído o
+  redesplegado a mitad) vuelven a Pendiente; tras TRABAJOS_MAX_INTENTOS
+  quedan Fallidos, con `terminado`, para que purgar() los borre.
+"""
+import logging
+import shutil
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Horario, Trabajo
+from .reportes import citas_rango, comprobante_pdf, contexto_comprobante, escribir_excel_rango
+
+logger = logging.getLogger(__name__)
+
+
+def directorio() -> Path:
+    d = Path(getattr(settings, "TRABAJOS_DIR", Path(settings.BASE_DIR) / "trabajos"))
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def ruta(trabajo: Trabajo) -> Path:
+    return directorio() / trabajo.archivo
+
+
+def encolar(tipo: str, **parametros) -> Trabajo:
+    return Trabajo.objects.create(tipo=tipo, parametros=parametros)
+
+
+def _plazo() -> timedelta:
+    return timedelta(minutes=getattr(settings, "TRABAJOS_PLAZO_MINUTOS", 15))
+
+
+def reclamar():
+    """Marca 'En curso' el pendiente más antiguo libre y lo retorna (o None)."""
+    candidatos = list(
+        Trabajo.objects.filter(estado="P").order_by("creado").values_list("id", flat=True)[:10]
+    )
+    for pk in candidatos:
+        if Trabajo.objects.filter(pk=pk, estado="P").update(
+            estado="E", reclamado=timezone.now(), intentos=F("intentos") + 1
+        ):
+            return Trabajo.objects.get(pk=pk)
+    return None
+
+
+def reencolar_vencidos() -> int:
+    """Devuelve a Pendiente (o da por Fallidos) los 'En curso' con el plazo vencido."""
+    ahora = timezone.now()
+    vencidos = Trabajo.objects.filter(
+        Q(reclamado__lt=ahora - _plazo()) | Q(reclamado=None),  # None: reclamado antes de 0028
+        estado="E",
+    )
+    agotados = vencidos.filter(intentos__gte=getattr(settings, "TRABAJOS_MAX_INTENTOS", 3)).update(
+        estado="F", error="El trabajo no terminó a tiempo.", terminado=ahora
+    )
+    return agotados + vencidos.update(estado="P", reclamado=None)
+
+
+def _excel(t: Trabajo):
+    p = t.parametros
+    start, end = parse_date(p["start"]), parse_date(p["end"])
+    qs = citas_rango(p["sucursal"], start, end, p.get("servicio"), p.get("estado"))
+    archivo = f"{t.id}-{t.intentos}.xlsx"  # por reclamo: dos intentos no pisan el mismo archivo
+    with open(directorio() / archivo, "wb") as f:
+        escribir_excel_rango(qs, f)
+    return archivo, f"citas_{start:%Y%m%d}_{end:%Y%m%d}.xlsx"
+
+
+def _pdf(t: Trabajo):
+    horario = (
+        Horario.objects
+        .select_related("usuario_horario", "Tipo_servicio")
+        .prefetch_related("agregados")
+        .get(pk=t.parametros["horario_id"])
+    )
+    cacheado = comprobante_pdf(horario.id, contexto_comprobante(horario))
+    if cacheado is None:
+        raise RuntimeError("Hubo un error al generar el PDF.")
+    archivo = f"{t.id}-{t.intentos}.pdf"
+    shutil.copyfile(cacheado, directorio() / archivo)
+    return archivo, f"comprobante_{horario.id}.pdf"
+
+
+GENERADORES = {
+    "EXCEL": _excel,
+    "PDF": _pdf,
+}
+
+
+def ejecutar(t: Trabajo) -> bool:
+    """
+    Corre `t` tal como lo devolvió reclamar(). El resultado se guarda solo si
+    el reclamo sigue vigente (En curso, mismo `reclamado` e `intentos`): si el
+    plazo venció y otro worker lo reclamó, este resultado se descarta.
+    """
+    vigente = Trabajo.objects.filter(pk=t.pk, estado="E", reclamado=t.reclamado, intentos=t.intentos)
+    try:
+        archivo, nombre = GENERADORES[t.tipo](t)
+    except Exception as e:
+        logger.exception("Falló el trabajo %s", t.pk)
+        vigente.update(estado="F", error=str(e), terminado=timezone.now())
+        return False
+
+    if not vigente.update(estado="L", archivo=archivo, nombre_archivo=nombre, terminado=timezone.now()):
+        logger.warning("Trabajo %s: venció el reclamo %s, se descarta el resultado", t.pk, t.intentos)
+        (directorio() / archivo).unlink(missing_ok=True)
+        return False
+    return True
+
+
+def purgar(horas: int) -> int:
+    """Borra trabajos terminados hace más de `horas` y sus archivos."""
+    viejos = Trabajo.objects.filter(terminado__lt=timezone.now() - timedelta(hours=horas))
+    for t in viejos.exclude(archivo=""):
+        ruta(t).unlink(missing_ok=True)
+    borrados, _ = viejos.delete()
+    return borrados
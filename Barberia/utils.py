@@ -1,4 +1,7 @@
 # Barberia/utils.py
+import re
+import unicodedata
+
 
 def validar_rut(rut: str) -> bool:
     # Eliminar puntos y guion y pasar a mayúsculas
@@ -46,3 +49,26 @@ def formatear_rut(rut: str) -> str:
     cuerpo_formateado = ".".join(g[::-1] for g in grupos[::-1])
 
     return f"{cuerpo_formateado}-{dv}"
+
+
+def normalizar_rut(rut: str) -> str:
+    # RUT canónico para comparar / indexar: sin puntos, guion ni espacios,
+    # DV en mayúscula (ej: "12.345.678-k" -> "12345678K")
+    return (rut or "").replace(".", "").replace("-", "").replace(" ", "").upper().lstrip("0")
+
+
+def plegar_texto(texto: str) -> str:
+    # Minúsculas sin tildes y sin puntuación: "Pérez-Muñoz, 12.345.678-5" -> "perez munoz 123456785"
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    texto = re.sub(r"(?<=\d)[.\-](?=[\dk])", "", texto)   # puntos y guion del RUT
+    return " ".join(re.findall(r"[a-z0-9]+", texto))
+
+
+def terminos_busqueda(nombre: str, rut: str) -> set:
+    # Palabras del nombre + RUT en dígitos (con y sin DV) para el índice de búsqueda
+    terminos = {t[:50] for t in plegar_texto(nombre).split()}
+    rut = normalizar_rut(rut).lower()
+    if rut:
+        terminos.update({rut, rut[:-1]} - {""})
+    return terminos
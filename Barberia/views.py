@@ -1,45 +1,73 @@
 # Barberia/views.py
 from datetime import datetime, timedelta, date
 
+import asyncio
 import csv
+from functools import wraps
+import json
+import re
+import tempfile
+
+from asgiref.sync import sync_to_async
 
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
+from django.http import (
+    HttpResponse, JsonResponse, HttpResponseBadRequest, Http404, StreamingHttpResponse,
+    FileResponse, HttpResponseNotAllowed,
+)
 from django.utils import timezone
-from django.utils.dateparse import parse_date
-from django.db.models import Q, Count
-from django.core.paginator import Paginator
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+from django.db.models import Q, Sum
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.text import compress_sequence
+from django.conf import settings
+from django.db import transaction
 
 from django.contrib import messages
 from django.contrib.auth import authenticate, login as dj_login
 from django.contrib.auth.decorators import login_required, user_passes_test
-
-from django.template.loader import render_to_string
-from xhtml2pdf import pisa
-
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill
-from openpyxl.utils import get_column_letter
-from openpyxl.worksheet.table import Table, TableStyleInfo
-
-from django.core.exceptions import ValidationError
-
-from .models import Horas, Horario, Usuario, Dias, Tipo_servicio, DiaCerrado
-from django.views.decorators.http import require_GET
+from django.core.handlers.asgi import ASGIRequest
+
+from django.core.exceptions import PermissionDenied, SynchronousOnlyOperation, ValidationError
+
+from .models import (
+    DIAS_SEMANA, Horario, DiaCerrado, Trabajo, EstadisticaDiaria,
+)
+from . import (
+    agenda, analitica, busqueda, catalogo, cierres, difusion, disponibilidad, eventos, sucursales, trabajos,
+)
+from .paginacion import PaginaKeyset, estimar_total
+from .reservas import HoraOcupada, reservar
+from .reportes import (
+    EXPORT_CHUNK, HEADERS_RANGO, citas_rango, clave_comprobante, comprobante_pdf,
+    contexto_comprobante, escribir_excel_rango,
+)
+from django.views.decorators.http import require_GET, require_POST
 
 # =========================
 # Constantes / helpers base
 # =========================
 
+_ACEPTA_GZIP = re.compile(r"\bgzip\b")
+
 DIAS_ES = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-ORDEN_DIAS_ATENCION = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado"]
 
 
 def _solo_staff(u):
     return u.is_authenticated and u.is_staff
 
 
+def _staff_de_sucursal(vista):
+    """Va bajo user_passes_test(_solo_staff): staff de otra sucursal -> 403."""
+    @wraps(vista)
+    def envuelta(request, *args, **kwargs):
+        if not sucursales.actual().es_staff(request.sucursal, request.user):
+            raise PermissionDenied
+        return vista(request, *args, **kwargs)
+    return envuelta
+
+
 def semana_actual():
     """
     Chips de semana: lunes..domingo de la semana actual.
@@ -60,32 +88,80 @@ def semana_actual():
     return dias, hoy
 
 
-def _duracion_minutos(servicio: Tipo_servicio) -> int:
-    nombre = (getattr(servicio, "nombre", "") or "").lower()
-    return 60 if "perfil" in nombre else 30
-
-
 def _nombre_dia(fecha: date) -> str:
     return DIAS_ES[fecha.weekday()]
 
 
-def _ventana_reservable():
+def _ventana_reservable(ag):
     """
-    Ventana permitida:
-    - Lun..Sáb: hoy .. sábado de esta semana
-    - Dom:     lunes próximo .. sábado próximo
+    Ventana permitida: hoy .. hoy + horizonte_dias - 1 (ConfiguracionAgenda
+    de la sucursal de `ag`, ya obtenida con agenda.actual() / aactual()).
     """
-    hoy = timezone.localdate()
-    wd = hoy.weekday()  # 0=lun .. 6=dom
-    if wd == 6:  # domingo
-        lunes = hoy + timedelta(days=1)
-        sabado = lunes + timedelta(days=5)
-        fecha_min = lunes
-    else:
-        lunes = hoy - timedelta(days=wd)
-        sabado = lunes + timedelta(days=5)
-        fecha_min = hoy
-    return fecha_min, sabado
+    return ag.ventana(timezone.localdate())
+
+
+class _Eco:
+    """Pseudo-buffer para csv.writer: devuelve la línea en vez de guardarla."""
+    def write(self, value):
+        return value
+
+
+def _csv_streaming(filename, encabezado, filas):
+    """
+    StreamingHttpResponse CSV: el encabezado sale de inmediato y luego
+    las filas en lotes de EXPORT_CHUNK, sin armar el archivo en memoria.
+    """
+    w = csv.writer(_Eco())
+
+    def generar():
+        yield w.writerow(encabezado)
+        lote = []
+        for fila in filas:
+            lote.append(w.writerow(fila))
+            if len(lote) >= EXPORT_CHUNK:
+                yield "".join(lote)
+                lote = []
+        if lote:
+            yield "".join(lote)
+
+    resp = StreamingHttpResponse(generar(), content_type='text/csv; charset=utf-8')
+    resp['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return resp
+
+
+def _json_streaming(request, partes):
+    """
+    StreamingHttpResponse JSON a partir de trozos de texto. Si el cliente
+    acepta gzip (y EVENTOS_GZIP no está apagado) se comprime al vuelo.
+    """
+    resp = StreamingHttpResponse(partes, content_type="application/json")
+    patch_vary_headers(resp, ("Accept-Encoding",))
+    if getattr(settings, "EVENTOS_GZIP", True) and _ACEPTA_GZIP.search(
+        request.META.get("HTTP_ACCEPT_ENCODING", "")
+    ):
+        resp.streaming_content = compress_sequence(resp.streaming_content)
+        resp["Content-Encoding"] = "gzip"
+    return resp
+
+
+def _rango_export(request):
+    """
+    Lee ?start=YYYY-MM-DD&end=YYYY-MM-DD (end exclusivo) y servicio/estado
+    opcionales. Retorna (start, end, servicio, estado) o un HttpResponseBadRequest.
+    """
+    start_str = request.GET.get("start")
+    end_str = request.GET.get("end")  # end exclusivo
+    servicio = request.GET.get("servicio")
+    estado = request.GET.get("estado")
+
+    if not (start_str and end_str):
+        return HttpResponseBadRequest("Faltan start/end")
+
+    start = parse_date(start_str)
+    end = parse_date(end_str)
+    if not (start and end):
+        return HttpResponseBadRequest("Fechas inválidas")
+    return start, end, servicio, estado
 
 
 # =========================
@@ -94,31 +170,102 @@ def _ventana_reservable():
 
 @login_required
 @user_passes_test(_solo_staff)
+@_staff_de_sucursal
 def panel_calendario(request):
-    servicios = Tipo_servicio.objects.all().order_by("nombre")
+    sucursal = request.sucursal
+    servicios = catalogo.actual(sucursal.id).servicios
     hoy = timezone.localdate()
 
     if request.method == 'POST':
         if 'cerrar_hoy' in request.POST:
-            DiaCerrado.objects.get_or_create(fecha=hoy)
+            DiaCerrado.objects.get_or_create(sucursal=sucursal, fecha=hoy)
             messages.success(request, 'Has marcado HOY como día cerrado')
             return redirect('panel_calendario')
 
         if 'abrir_hoy' in request.POST:
-            DiaCerrado.objects.filter(fecha=hoy).delete()
+            _abrir_dia(sucursal, hoy)
             messages.success(request, 'Has quitado el cierre de HOY')
             return redirect('panel_calendario')
 
-    hoy_cerrado = DiaCerrado.objects.filter(fecha=hoy).exists()
+        if 'cerrar_rango' in request.POST:
+            error = _crear_cierre(sucursal, request.POST)
+            if error:
+                messages.error(request, error)
+            else:
+                messages.success(request, 'Cierre registrado')
+            return redirect('panel_calendario')
+
+    cierre_hoy = cierres.actual(sucursal.id).cierre_desde(hoy)
     return render(request, "panel/calendario.html", {
         "servicios": servicios,
         "hoy": hoy,
-        "hoy_cerrado": hoy_cerrado,
+        "hoy_cerrado": cierre_hoy is not None,
+        "hoy_cierra_desde": _etiqueta_minuto(cierre_hoy) if cierre_hoy else "",
     })
 
 
+CIERRE_MAX_DIAS = 366
+
+
+def _etiqueta_minuto(minuto):
+    return f"{minuto // 60:02d}:{minuto % 60:02d}"
+
+
+def _crear_cierre(sucursal, datos):
+    """Cierre de un día o rango de la sucursal, completo o desde una hora. Retorna el error o None."""
+    desde = parse_date(datos.get("cierre_desde") or "")
+    hasta = parse_date(datos.get("cierre_hasta") or "") or None
+    hora = parse_time(datos.get("cierre_hora") or "") or None
+    if desde is None:
+        return "Indica la fecha del cierre."
+    if hasta is not None and not desde <= hasta <= desde + timedelta(days=CIERRE_MAX_DIAS):
+        return "Rango de cierre inválido."
+    if hasta == desde:
+        hasta = None
+    _, creado = DiaCerrado.objects.get_or_create(
+        sucursal=sucursal,
+        fecha=desde,
+        defaults={"hasta": hasta, "desde_hora": hora, "motivo": datos.get("motivo") or None},
+    )
+    return None if creado else "Ya hay un cierre que empieza ese día."
+
+
+@transaction.atomic
+def _abrir_dia(sucursal, dia):
+    """
+    Quita `dia` de los cierres que lo cubren (de un día, de rango o parciales).
+    Un rango se parte en dos: el tramo hasta ayer queda y el resto pasa a una
+    fila nueva desde mañana, con la misma hora y motivo. Si ya había un cierre
+    desde mañana (se solapaban), ese se alarga hasta el fin del rango.
+    """
+    ayer, manana = dia - timedelta(days=1), dia + timedelta(days=1)
+    for cierre in DiaCerrado.objects.select_for_update().filter(
+        Q(fecha=dia) | Q(fecha__lt=dia, hasta__gte=dia), sucursal=sucursal
+    ):
+        hasta = cierre.hasta
+        if cierre.fecha < dia:
+            cierre.hasta = ayer if ayer > cierre.fecha else None
+            cierre.save(update_fields=["hasta"])
+        else:
+            cierre.delete()
+        if hasta and hasta > dia:
+            resto, creado = DiaCerrado.objects.select_for_update().get_or_create(
+                sucursal=sucursal,
+                fecha=manana,
+                defaults={
+                    "hasta": hasta if hasta > manana else None,
+                    "desde_hora": cierre.desde_hora,
+                    "motivo": cierre.motivo,
+                },
+            )
+            if not creado and hasta > (resto.hasta or manana):
+                resto.hasta = hasta
+                resto.save(update_fields=["hasta"])
+
+
 @login_required
 @user_passes_test(_solo_staff)
+@_staff_de_sucursal
 def panel_api_events(request):
     """
     Endpoint FullCalendar.
@@ -128,11 +275,14 @@ def panel_api_events(request):
     MODIFICACIÓN:
     - NO devolvemos eventos cancelados (estado='C') nunca para el calendario.
       Las canceladas se ven en la tabla "Citas canceladas (rango visible)".
+    - El arreglo sale en streaming desde una proyección values_list
+      (eventos.SerializadorEventos), con gzip si el cliente lo acepta.
     """
     start = request.GET.get("start")
     end = request.GET.get("end")
     servicio = request.GET.get("servicio") or ""
     estado = request.GET.get("estado") or ""
+    updated_since = request.GET.get("updated_since") or ""
 
     try:
         start_date = datetime.fromisoformat(start[:10]).date() if start else None
@@ -140,11 +290,8 @@ def panel_api_events(request):
     except Exception:
         start_date = end_date = None
 
-    qs = (
-        Horario.objects
-        .select_related("usuario_horario", "hora_horario", "Tipo_servicio", "dia_horario")
-        .order_by("fecha", "hora_horario__hora_Horas")
-    )
+    sucursal_id = request.sucursal.id
+    qs = Horario.objects.filter(sucursal_id=sucursal_id).exclude(fecha=None)
 
     if start_date and end_date:
         qs = qs.filter(fecha__gte=start_date, fecha__lt=end_date)
@@ -152,57 +299,65 @@ def panel_api_events(request):
     if servicio.isdigit():
         qs = qs.filter(Tipo_servicio_id=int(servicio))
 
-    # --- MOD: el calendario nunca muestra canceladas ---
-    qs = qs.exclude(estado="C")
-
-    # Si igual quieres filtrar por estado, solo permitimos P/A (C ya está excluida)
-    if estado in dict(Horario.ESTADOS).keys() and estado in ["P", "A"]:
-        qs = qs.filter(estado=estado)
-
-    COLOR_ESTADO = {
-        "P": "#f59e0b",
-        "A": "#22c55e",
-        "C": "#ef4444",
-    }
-
-    events = []
-    for h in qs:
-        if not h.fecha:
-            continue
-
-        hhmm = getattr(h.hora_horario, "hora_Horas", "09:00")
-        try:
-            hour, minute = map(int, hhmm.split(":")[:2])
-        except Exception:
-            hour, minute = 9, 0
-
-        start_dt = datetime(h.fecha.year, h.fecha.month, h.fecha.day, hour, minute)
-        mins = _duracion_minutos(h.Tipo_servicio)
-        end_dt = start_dt + timedelta(minutes=mins)
-
-        title = f"{h.usuario_horario.nombre} · {h.Tipo_servicio.nombre}"
-
-        events.append({
-            "id": h.id,
-            "title": title,
-            "start": start_dt.isoformat(),
-            "end": end_dt.isoformat(),
-            "color": COLOR_ESTADO.get(h.estado, "#94a3b8"),
-            "extendedProps": {
-                "estado": h.get_estado_display(),
-                "servicio": h.Tipo_servicio.nombre,
-                "hora": hhmm,
-                "dia_semana": getattr(h.dia_horario, "dia_Dias", ""),
-                "rut": getattr(h.usuario_horario, "rut", ""),
-                "celular": getattr(h.usuario_horario, "celular", ""),
-            }
-        })
-
-    return JsonResponse(events, safe=False)
+    # Versión del rango (incluye canceladas: cancelar también la cambia) y
+    # de los nombres de servicio / recurso que se muestran
+    cat, ag = catalogo.actual(sucursal_id), agenda.actual(sucursal_id)
+    nombres = eventos.version_nombres(cat, ag)
+    etag, ultimo = eventos.version_rango(qs, estado, updated_since, nombres)
+    no_modificado = get_conditional_response(request, etag=etag)
+    if no_modificado is not None:
+        return no_modificado
+
+    # Proyección: solo las columnas del evento, sin instancias de modelo
+    qs = qs.order_by("fecha", "hora_inicio")
+    serializador = eventos.SerializadorEventos(cat, ag.nombres_recurso)
+
+    if updated_since:
+        # --- Modo delta: solo lo que cambió; las canceladas van en "removed" ---
+        desde = parse_datetime(updated_since.replace(" ", "+"))
+        if desde is None:
+            return HttpResponseBadRequest("updated_since inválido")
+        if timezone.is_naive(desde):
+            desde = timezone.make_aware(desde)
+
+        # Si cambiaron los nombres que vio el cliente, todo el rango está desactualizado
+        if request.GET.get("nombres", nombres) == nombres:
+            qs = qs.filter(modified_at__gt=desde)
+        cambiadas = qs.values_list(*eventos.CAMPOS_EVENTO)
+        events, removed = [], []
+        for fila in cambiadas:
+            pk, est = fila[0], fila[4]
+            if est == "C" or (estado in ["P", "A"] and est != estado):
+                removed.append(pk)
+            else:
+                events.append(serializador.evento(fila))
+        response = HttpResponse(
+            eventos.delta_json(events, removed, eventos.cursor_delta(ultimo, desde)),
+            content_type="application/json",
+        )
+    else:
+        # --- MOD: el calendario nunca muestra canceladas ---
+        qs = qs.exclude(estado="C")
+
+        # Si igual quieres filtrar por estado, solo permitimos P/A (C ya está excluida)
+        if estado in dict(Horario.ESTADOS).keys() and estado in ["P", "A"]:
+            qs = qs.filter(estado=estado)
+
+        filas = qs.values_list(*eventos.CAMPOS_EVENTO).iterator(chunk_size=eventos.EVENTOS_LOTE)
+        response = _json_streaming(request, serializador.arreglo_json(filas))
+        response["X-Delta-Cursor"] = eventos.cursor_delta(ultimo)
+
+    response["X-Nombres-Version"] = nombres
+    if response.has_header("Content-Encoding"):
+        etag = "W/" + etag  # el cuerpo comprimido no es idéntico byte a byte
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 @login_required
 @user_passes_test(_solo_staff)
+@_staff_de_sucursal
 def panel_export_rango(request):
     """
     Export CSV de la vista actual del calendario (rango visible).
@@ -210,63 +365,40 @@ def panel_export_rango(request):
     MODIFICACIÓN:
     - Agrega columnas: Agregados, Total
     - Prefetch de agregados para evitar N+1
+    - Streaming por lotes: memoria plana sin importar el rango
     """
-    start_str = request.GET.get("start")
-    end_str = request.GET.get("end")  # end exclusivo
-    servicio = request.GET.get("servicio")
-    estado = request.GET.get("estado")
-
-    if not (start_str and end_str):
-        return HttpResponseBadRequest("Faltan start/end")
-
-    start = parse_date(start_str)
-    end = parse_date(end_str)
-    if not (start and end):
-        return HttpResponseBadRequest("Fechas inválidas")
+    rango = _rango_export(request)
+    if isinstance(rango, HttpResponse):
+        return rango
+    start, end, servicio, estado = rango
 
-    qs = (
-        Horario.objects
-        .select_related('usuario_horario', 'hora_horario', 'Tipo_servicio', 'dia_horario')
-        .prefetch_related('agregados')  # MOD
-        .filter(fecha__gte=start, fecha__lt=end)
-        .order_by('fecha', 'hora_horario__hora_Horas')
-    )
-
-    if servicio and servicio.isdigit():
-        qs = qs.filter(Tipo_servicio_id=int(servicio))
-    if estado in dict(Horario.ESTADOS).keys():
-        qs = qs.filter(estado=estado)
-
-    resp = HttpResponse(content_type='text/csv; charset=utf-8')
-    resp['Content-Disposition'] = f'attachment; filename="citas_{start:%Y%m%d}_{end:%Y%m%d}.csv"'
-
-    w = csv.writer(resp)
-    w.writerow([
-        'ID', 'Fecha', 'Hora', 'Cliente', 'RUT', 'Teléfono', 'Servicio', 'Día', 'Estado',
-        'Agregados', 'Total'  # MOD
-    ])
+    qs = citas_rango(request.sucursal.id, start, end, servicio, estado)
 
     estado_label = dict(Horario.ESTADOS)
-    for c in qs:
-        agregados_txt = ", ".join([a.nombre for a in c.agregados.all()])  # usa prefetch
-        w.writerow([
-            c.id,
-            (c.fecha.isoformat() if c.fecha else ""),
-            c.hora_horario.hora_Horas,
-            c.usuario_horario.nombre,
-            c.usuario_horario.rut,
-            c.usuario_horario.celular,
-            c.Tipo_servicio.nombre,
-            c.dia_horario.dia_Dias,
-            estado_label.get(c.estado, ''),
-            agregados_txt,               # MOD
-            getattr(c, "total", ""),     # MOD (property total)
-        ])
-    return resp
+
+    def filas():
+        for c in qs.iterator(chunk_size=EXPORT_CHUNK):  # prefetch de agregados por lote
+            agregados_txt = ", ".join([a.nombre for a in c.agregados.all()])
+            yield [
+                c.id,
+                (c.fecha.isoformat() if c.fecha else ""),
+                f"{c.hora_inicio:%H:%M}",
+                c.usuario_horario.nombre,
+                c.usuario_horario.rut,
+                c.usuario_horario.celular,
+                c.Tipo_servicio.nombre,
+                c.get_dia_semana_display(),
+                estado_label.get(c.estado, ''),
+                agregados_txt,               # MOD
+                c.total,                     # MOD (anotado en SQL)
+            ]
+
+    return _csv_streaming(f"citas_{start:%Y%m%d}_{end:%Y%m%d}.csv", HEADERS_RANGO, filas())
 
 
 @login_required
 @user_passes_test(_solo_staff)
+@_staff_de_sucursal
 def panel_export_rango_excel(request):
     """
     Export Excel de la vista actual del calendario (rango visible).
@@ -274,102 +406,56 @@ def panel_export_rango_excel(request):
     MODIFICACIÓN:
     - Agrega columnas: Agregados, Total
     - Prefetch de agregados para evitar N+1
+    - Workbook write_only + archivo temporal: memoria constante
     """
-    start_str = request.GET.get("start")
-    end_str = request.GET.get("end")  # end exclusivo
-    servicio = request.GET.get("servicio")
-    estado = request.GET.get("estado")
+    rango = _rango_export(request)
+    if isinstance(rango, HttpResponse):
+        return rango
+    start, end, servicio, estado = rango
 
-    if not (start_str and end_str):
-        return HttpResponseBadRequest("Faltan start/end")
+    qs = citas_rango(request.sucursal.id, start, end, servicio, estado)
 
-    start = parse_date(start_str)
-    end = parse_date(end_str)
-    if not (start and end):
-        return HttpResponseBadRequest("Fechas inválidas")
+    # El .xlsx se arma en disco y se envía por bloques (FileResponse cierra el archivo)
+    tmp = tempfile.TemporaryFile()
+    escribir_excel_rango(qs, tmp)
+    tmp.seek(0)
 
-    qs = (
-        Horario.objects
-        .select_related('usuario_horario', 'hora_horario', 'Tipo_servicio', 'dia_horario')
-        .prefetch_related('agregados')  # MOD
-        .filter(fecha__gte=start, fecha__lt=end)
-        .order_by('fecha', 'hora_horario__hora_Horas')
+    filename = f'citas_{start:%Y%m%d}_{end:%Y%m%d}.xlsx'
+    return FileResponse(
+        tmp,
+        as_attachment=True,
+        filename=filename,
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
 
-    if servicio and servicio.isdigit():
-        qs = qs.filter(Tipo_servicio_id=int(servicio))
-    if estado in dict(Horario.ESTADOS).keys():
-        qs = qs.filter(estado=estado)
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Citas"
-
-    headers = [
-        'ID', 'Fecha', 'Hora', 'Cliente', 'RUT', 'Teléfono', 'Servicio', 'Día', 'Estado',
-        'Agregados', 'Total'  # MOD
-    ]
-    ws.append(headers)
-
-    estado_label = dict(Horario.ESTADOS)
-    for c in qs:
-        agregados_txt = ", ".join([a.nombre for a in c.agregados.all()])
-        ws.append([
-            c.id,
-            (c.fecha.strftime("%d-%m-%Y") if c.fecha else ""),
-            c.hora_horario.hora_Horas,
-            c.usuario_horario.nombre,
-            c.usuario_horario.rut,
-            c.usuario_horario.celular,
-            c.Tipo_servicio.nombre,
-            c.dia_horario.dia_Dias,
-            estado_label.get(c.estado, ""),
-            agregados_txt,           # MOD
-            getattr(c, "total", ""), # MOD
-        ])
-
-    header_fill = PatternFill("solid", fgColor="111111")
-    header_font = Font(color="FFFFFF", bold=True)
-    for col in range(1, len(headers) + 1):
-        cell = ws.cell(row=1, column=col)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    for col in range(1, len(headers) + 1):
-        max_len = 0
-        for row in range(1, ws.max_row + 1):
-            v = ws.cell(row=row, column=col).value
-            if v is None:
-                continue
-            max_len = max(max_len, len(str(v)))
-        ws.column_dimensions[get_column_letter(col)].width = min(max_len + 3, 40)
-
-    if ws.max_row >= 1:
-        last_col = get_column_letter(len(headers))
-        table_ref = f"A1:{last_col}{ws.max_row}"
-        tab = Table(displayName="TablaCitas", ref=table_ref)
-        style = TableStyleInfo(
-            name="TableStyleMedium9",
-            showFirstColumn=False,
-            showLastColumn=False,
-            showRowStripes=True,
-            showColumnStripes=False
-        )
-        tab.tableStyleInfo = style
-        ws.add_table(tab)
 
-    filename = f'citas_{start:%Y%m%d}_{end:%Y%m%d}.xlsx'
-    resp = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+@login_required
+@user_passes_test(_solo_staff)
+@_staff_de_sucursal
+@require_POST
+def panel_trabajo_excel(request):
+    """
+    POST ?start=...&end=... (mismos filtros que panel_export_rango_excel)
+    Encola el Excel para `trabajos_worker` y responde 202 con el id a consultar.
+    """
+    rango = _rango_export(request)
+    if isinstance(rango, HttpResponse):
+        return rango
+    start, end, servicio, estado = rango
+
+    t = trabajos.encolar(
+        "EXCEL",
+        usuario=request.user.id,
+        sucursal=request.sucursal.id,
+        start=start.isoformat(), end=end.isoformat(),
+        servicio=servicio or "", estado=estado or "",
     )
-    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
-    wb.save(resp)
-    return resp
+    return _trabajo_json(t, status=202)
 
 
 @login_required
 @user_passes_test(_solo_staff)
+@_staff_de_sucursal
 def panel_api_stats(request):
     """
     GET ?start=YYYY-MM-DD&end=YYYY-MM-DD (end exclusivo)
@@ -391,7 +477,10 @@ def panel_api_stats(request):
     if not (start and end):
         return JsonResponse({"labels": [], "values": []})
 
-    qs = Horario.objects.select_related("Tipo_servicio").filter(
+    # Sale del rollup diario (a lo más 1 fila por día/servicio/estado),
+    # no de recorrer cada cita del rango
+    qs = EstadisticaDiaria.objects.filter(
+        sucursal=request.sucursal,
         fecha__gte=start,
         fecha__lt=end
     )
@@ -407,21 +496,79 @@ def panel_api_stats(request):
         return JsonResponse({"labels": [], "values": []})
 
     if servicio.isdigit():
-        qs = qs.filter(Tipo_servicio_id=int(servicio))
+        qs = qs.filter(servicio_id=int(servicio))
 
     data = (
-        qs.values("Tipo_servicio__nombre")
-        .annotate(total=Count("id"))
-        .order_by("-total", "Tipo_servicio__nombre")
+        qs.values("servicio__nombre")
+        .annotate(total=Sum("citas"), monto=Sum("ingresos"))
+        .order_by("-total", "servicio__nombre")
     )
 
-    labels = [r["Tipo_servicio__nombre"] or "Sin servicio" for r in data]
+    labels = [r["servicio__nombre"] or "Sin servicio" for r in data]
     values = [r["total"] for r in data]
-    return JsonResponse({"labels": labels, "values": values})
+    ingresos = [r["monto"] for r in data]
+    return JsonResponse({"labels": labels, "values": values, "ingresos": ingresos})
+
+
+@login_required
+@user_passes_test(_solo_staff)
+@_staff_de_sucursal
+@require_GET
+def panel_api_ingresos(request):
+    """
+    GET ?start=YYYY-MM-DD&end=YYYY-MM-DD (end exclusivo)
+    Opcional: periodo=dia|semana|mes (default dia)  servicio=ID
+    Ingresos base + agregados de citas no canceladas.
+    """
+    rango = _rango_export(request)
+    if isinstance(rango, HttpResponse):
+        return rango
+    start, end, servicio, _ = rango
+
+    periodo = request.GET.get("periodo") or "dia"
+    if periodo not in analitica.PERIODOS:
+        return HttpResponseBadRequest("periodo debe ser dia, semana o mes")
+
+    servicio_id = int(servicio) if servicio and servicio.isdigit() else None
+    return JsonResponse(analitica.ingresos(request.sucursal.id, start, end, periodo, servicio_id))
+
+
+@login_required
+@user_passes_test(_solo_staff)
+@_staff_de_sucursal
+@require_GET
+def panel_api_ocupacion(request):
+    """
+    GET ?start=YYYY-MM-DD&end=YYYY-MM-DD (end exclusivo)
+    Ocupación por bloque de Horas y día de semana (0..1).
+    """
+    rango = _rango_export(request)
+    if isinstance(rango, HttpResponse):
+        return rango
+    start, end, _, _ = rango
+    return JsonResponse(analitica.ocupacion(request.sucursal.id, start, end))
+
+
+@login_required
+@user_passes_test(_solo_staff)
+@_staff_de_sucursal
+@require_GET
+def panel_api_tasas(request):
+    """
+    GET ?start=YYYY-MM-DD&end=YYYY-MM-DD (end exclusivo)  Opcional: servicio=ID
+    Tasa de cancelación y tasa de citas con agregados.
+    """
+    rango = _rango_export(request)
+    if isinstance(rango, HttpResponse):
+        return rango
+    start, end, servicio, _ = rango
+    servicio_id = int(servicio) if servicio and servicio.isdigit() else None
+    return JsonResponse(analitica.tasas(request.sucursal.id, start, end, servicio_id))
 
 
 @login_required
 @user_passes_test(_solo_staff)
+@_staff_de_sucursal
 def panel_api_canceladas(request):
     """
     Tabla canceladas debajo del calendario
@@ -439,9 +586,9 @@ def panel_api_canceladas(request):
 
     qs = (
         Horario.objects
-        .select_related("usuario_horario", "hora_horario", "Tipo_servicio")
-        .filter(fecha__gte=start, fecha__lt=end, estado="C")
-        .order_by("fecha", "hora_horario__hora_Horas")
+        .select_related("usuario_horario", "Tipo_servicio")
+        .filter(sucursal=request.sucursal, fecha__gte=start, fecha__lt=end, estado="C")
+        .order_by("fecha", "hora_inicio")
     )
 
     if servicio.isdigit():
@@ -451,7 +598,7 @@ def panel_api_canceladas(request):
         "nombre": h.usuario_horario.nombre,
         "rut": h.usuario_horario.rut,
         "fecha": h.fecha.strftime("%d-%m-%Y") if h.fecha else "",
-        "hora": h.hora_horario.hora_Horas,
+        "hora": f"{h.hora_inicio:%H:%M}",
         "servicio": h.Tipo_servicio.nombre,
     } for h in qs]
 
@@ -470,17 +617,18 @@ def _filtar_citas(request):
 
     qs = (
         Horario.objects
-        .select_related('usuario_horario', 'hora_horario', 'Tipo_servicio', 'dia_horario')
-        .order_by('fecha', 'hora_horario__hora_Horas')
+        .filter(sucursal=request.sucursal)
+        .select_related('usuario_horario', 'Tipo_servicio')
+        .prefetch_related('agregados')
+        .with_totals()
+        .order_by('fecha', 'hora_inicio')
     )
 
     if q:
-        qs = qs.filter(
-            Q(usuario_horario__nombre__icontains=q) |
-            Q(usuario_horario__rut__icontains=q)
-        )
+        ids = busqueda.usuarios_que_coinciden(q)
+        qs = qs.filter(usuario_horario__in=ids) if ids is not None else qs.none()
     if dia.isdigit():
-        qs = qs.filter(dia_horario__id=int(dia))
+        qs = qs.filter(dia_semana=int(dia))
     if servicio.isdigit():
         qs = qs.filter(Tipo_servicio__id=int(servicio))
     if estado in dict(Horario.ESTADOS).keys():
@@ -491,6 +639,7 @@ def _filtar_citas(request):
 
 @login_required
 @user_passes_test(_solo_staff)
+@_staff_de_sucursal
 def panel_horarios(request):
     qs, q, dia, servicio, estado = _filtar_citas(request)
 
@@ -507,15 +656,18 @@ def panel_horarios(request):
     qs_activas = qs.filter(estado__in=["P", "A"])
     qs_cancel = qs.filter(estado="C")
 
-    citas = Paginator(qs_activas, 10).get_page(request.GET.get('page'))
-    canceladas = Paginator(qs_cancel, 10).get_page(request.GET.get('page_c'))
+    # Cursor (fecha, hora, id): sin COUNT ni OFFSET. El total es opcional (?contar=1)
+    citas = PaginaKeyset(qs_activas, 10, request.GET.get('despues'), request.GET.get('antes'))
+    canceladas = PaginaKeyset(qs_cancel, 10, request.GET.get('despues_c'), request.GET.get('antes_c'))
+    total_citas = estimar_total(qs_activas) if request.GET.get('contar') else None
 
-    dias = Dias.objects.all().order_by('id')
-    servicios = Tipo_servicio.objects.all().order_by('nombre')
+    dias = DIAS_SEMANA
+    servicios = catalogo.actual(request.sucursal.id).servicios
 
     return render(request, 'panel/horarios_list.html', {
         'citas': citas,
         'canceladas': canceladas,
+        'total_citas': total_citas,
         'dias': dias,
         'servicios': servicios,
         'q': q,
@@ -529,31 +681,34 @@ def panel_horarios(request):
 
 @login_required
 @user_passes_test(_solo_staff)
+@_staff_de_sucursal
 def panel_export(request):
     qs, q, dia, servicio, estado = _filtar_citas(request)
 
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = f'attachment; filename="citas_{timezone.now():%Y%m%d_%H%M}.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow(['ID', 'Cliente', 'RUT', 'Día', 'Hora', 'Servicio', 'Estado'])
-
     estado_label = dict(Horario.ESTADOS)
-    for c in qs:
-        writer.writerow([
-            c.id,
-            getattr(c.usuario_horario, 'nombre', str(c.usuario_horario)),
-            getattr(c.usuario_horario, 'rut', ''),
-            str(c.dia_horario),
-            str(c.hora_horario),
-            getattr(c.Tipo_servicio, 'nombre', str(c.Tipo_servicio)),
-            estado_label.get(c.estado, '')
-        ])
-    return response
+
+    def filas():
+        for c in qs.iterator(chunk_size=EXPORT_CHUNK):
+            yield [
+                c.id,
+                getattr(c.usuario_horario, 'nombre', str(c.usuario_horario)),
+                getattr(c.usuario_horario, 'rut', ''),
+                c.get_dia_semana_display(),
+                f"{c.hora_inicio:%H:%M}",
+                getattr(c.Tipo_servicio, 'nombre', str(c.Tipo_servicio)),
+                estado_label.get(c.estado, '')
+            ]
+
+    return _csv_streaming(
+        f"citas_{timezone.now():%Y%m%d_%H%M}.csv",
+        ['ID', 'Cliente', 'RUT', 'Día', 'Hora', 'Servicio', 'Estado'],
+        filas(),
+    )
 
 
 @login_required
 @user_passes_test(_solo_staff)
+@_staff_de_sucursal
 def panel_set_estado(request, pk):
     if request.method != 'POST':
         return redirect(request.META.get('HTTP_REFERER', reverse('panel_horarios')))
@@ -564,15 +719,15 @@ def panel_set_estado(request, pk):
         messages.error(request, "Estado inválido.")
         return redirect(request.META.get('HTTP_REFERER', reverse('panel_horarios')))
 
-    h = get_object_or_404(Horario, pk=pk)
+    h = get_object_or_404(Horario, pk=pk, sucursal=request.sucursal)
 
-    # Evita “revivir” una cancelada si ya existe una activa en esa misma fecha+hora
+    # Evita “revivir” una cancelada si otra activa ya se cruza con su intervalo
     if h.estado == "C" and nuevo in ["P", "A"]:
-        conflicto = Horario.objects.filter(
-            fecha=h.fecha,
-            hora_horario=h.hora_horario,
-            estado__in=["P", "A"]
-        ).exclude(pk=h.pk).exists()
+        conflicto = (
+            Horario.objects.solapadas(h.sucursal_id, h.fecha, h.hora_inicio, h.hora_fin)
+            .filter(recurso_id=h.recurso_id)
+            .exclude(pk=h.pk).exists()
+        )
 
         if conflicto:
             messages.error(
@@ -607,7 +762,7 @@ def login_view(request):
 def mostrarindex(request):
     hoy=timezone.localdate()
     hoy_nombre = DIAS_ES[hoy.weekday()]
-    hoy_cerrado = DiaCerrado.objects.filter(fecha=hoy).exists()
+    hoy_cerrado = cierres.actual(request.sucursal.id).cerrado(hoy)
     return render(request, 'index.html',{
         "hoy_cerrado": hoy_cerrado,
         'hoy_nombre': hoy_nombre
@@ -616,16 +771,8 @@ def mostrarindex(request):
 
 
 def consultas(request):
-    servicios = Tipo_servicio.objects.all().order_by('nombre')
-    horario = [
-        ('Lunes', '12:00 – 19:00'),
-        ('Martes', '12:00 – 19:00'),
-        ('Miércoles', '12:00 – 19:00'),
-        ('Jueves', '12:00 – 19:00'),
-        ('Viernes', '12:00 – 19:00'),
-        ('Sábado', '12:00 – 19:30'),
-        ('Domingo', 'Cerrado'),
-    ]
+    servicios = catalogo.actual(request.sucursal.id).servicios
+    horario = agenda.actual(request.sucursal.id).horario_semana()
     return render(request, 'consulta.html', {
         'servicios': servicios,
         'horario_atencion': horario,
@@ -640,89 +787,82 @@ def mostrarAgendamiento(request):
     """
     Render del formulario agendar.html
     """
-    bases = Tipo_servicio.objects.filter(tipo="BASE").order_by("nombre")
-    addons = Tipo_servicio.objects.filter(tipo="ADDON").order_by("nombre")
-
-    dias_db = set(Dias.objects.values_list("dia_Dias", flat=True))
-    dias_dis = [d for d in ORDEN_DIAS_ATENCION if d in dias_db]
+    ag = agenda.actual(request.sucursal.id)
+    cat = ag.catalogo
+    fecha_min, fecha_max = _ventana_reservable(ag)
+    cierres_sucursal = cierres.actual(request.sucursal.id)
+    cerrados = cierres_sucursal.cerrados(fecha_min, fecha_max)
+    fechas_dis = [
+        {"value": f.isoformat(), "label": f"{_nombre_dia(f)} {f:%d-%m}"}
+        for f in ag.grilla(fecha_min, fecha_max)
+        if f not in cerrados
+    ]
 
     hoy = timezone.localdate()
     hoy_nombre = DIAS_ES[hoy.weekday()]
-    hoy_cerrado = DiaCerrado.objects.filter(fecha=hoy).exists()
+    hoy_cerrado = cierres_sucursal.cerrado(hoy)
 
     return render(request, "agendar.html", {
-        "tipos_base": bases,
-        "tipos_addons": addons,
-        "dias_disponibles": dias_dis,
+        "tipos_base": cat.bases,
+        "tipos_addons": cat.addons,
+        "recursos": [{"id": rid, "nombre": ag.nombres_recurso[rid]} for rid in ag.recursos],
+        "fechas_disponibles": fechas_dis,
         "hoy_nombre": hoy_nombre,
         "hoy_cerrado": hoy_cerrado,
     })
 
 
 def AgendarCita(request):
-    return render(request, "agendar.html", {"dias_disponibles": Dias.objects.all()})
+    return mostrarAgendamiento(request)
 
 
 # =========================
 # API Slots + lógica de disponibilidad
 # =========================
 
-def _calcular_slots_disponibles(fecha: date, servicio_id: int):
+def _calcular_slots_disponibles(sucursal_id, fecha: date, servicio_id: int, addons_ids=(), recurso_id=None):
     """
-    Slots disponibles para UNA fecha.
-    - Ocupadas: estado P o A (CANCELADA no bloquea)
+    Slots disponibles para UNA fecha en la sucursal.
+    - Ocupadas: estado P o A (CANCELADA no bloquea), todo su intervalo
     - Si fecha == HOY: NO mostrar horas que ya pasaron (sin margen)
-    - Si servicio dura 60': necesita 2 bloques consecutivos libres
-    """
-    if _nombre_dia(fecha) == "Domingo":
-        return []
-
-    horas = list(Horas.objects.order_by("id").values_list("hora_Horas", flat=True))
-
-    ocupadas = set(
-        Horario.objects.filter(fecha=fecha, estado__in=["P", "A"])
-        .values_list("hora_horario__hora_Horas", flat=True)
-    )
-
-    servicio = get_object_or_404(Tipo_servicio, id=servicio_id)
-    es_60 = "perfil" in (servicio.nombre or "").lower()
-
-    libres = [h for h in horas if h not in ocupadas]
-
-    # Filtrar horas pasadas si es HOY
-    hoy = timezone.localdate()
-    if fecha == hoy:
-        now = timezone.localtime(timezone.now())
-        h_now, m_now = now.hour, now.minute
-
-        def _es_futura(hhmm: str) -> bool:
-            try:
-                hh, mm = map(int, hhmm.split(":")[:2])
-            except Exception:
-                return False
-            return (hh, mm) > (h_now, m_now)
+    - La cita dura servicio + agregados (Tipo_servicio.duracion_minutos):
+      necesita esos bloques seguidos libres
+    - Solo dentro del horario de ese día y de la jornada del recurso
+      (agenda.py); sin `recurso_id`, basta con que haya alguno libre
 
-        libres = [h for h in libres if _es_futura(h)]
+    Se resuelve con el bitmap en memoria de `disponibilidad` (sin consultas
+    si la fecha ya está cargada). Un servicio de otra sucursal es 404.
+    """
+    slots = disponibilidad.slots_libres(sucursal_id, fecha, servicio_id, addons_ids, recurso_id)
+    if slots is None:
+        raise Http404("Servicio no encontrado.")
+    return slots
 
-    if not es_60:
-        return libres
 
-    # 60': pares consecutivos
-    consecutivos = []
-    libres_set = set(libres)
-    for i in range(len(horas) - 1):
-        h1 = horas[i]
-        h2 = horas[i + 1]
-        if h1 in libres_set and h2 in libres_set:
-            consecutivos.append(h1)
-    return consecutivos
+async def _en_memoria(sucursal_id, fecha, fn, *args):
+    """
+    Para vistas async: alista la fecha (disponibilidad.alistar, ORM async) y
+    corre `fn` del motor en memoria en el event loop, sin saltar de hilo.
+    Si una foto venció justo entre medio y `fn` necesita la BD, Django lo
+    corta antes de consultar (SynchronousOnlyOperation): se repite en un hilo.
+    """
+    await disponibilidad.alistar(sucursal_id, fecha)
+    try:
+        return fn(*args)
+    except SynchronousOnlyOperation:
+        return await sync_to_async(fn)(*args)
 
 
-def api_slots(request):
+async def api_slots(request):
     """
-    GET /api/slots?fecha=YYYY-MM-DD&servicio=ID
+    GET /api/slots?fecha=YYYY-MM-DD&servicio=ID[&addons=ID&addons=ID...][&recurso=ID]
+    Sin `recurso`: horas en que algún barbero / silla está libre.
     Respuesta: {"slots": ["12:00","12:30", ...]}
+    Vista async: con la fecha en memoria responde sin salir del event loop.
     """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
     fecha_str = request.GET.get("fecha")
     servicio_id = request.GET.get("servicio")
     if not fecha_str or not servicio_id:
@@ -733,14 +873,13 @@ def api_slots(request):
     except ValueError:
         return JsonResponse({"slots": []})
 
-    if DiaCerrado.objects.filter(fecha=f).exists():
+    sucursal_id = request.sucursal.id
+    if (await cierres.aactual(sucursal_id)).cerrado(f):
         return JsonResponse({"slots": []})
 
-    fecha_min, fecha_max = _ventana_reservable()
-    if f < fecha_min or f > fecha_max:
-        return JsonResponse({"slots": []})
-
-    if _nombre_dia(f) == "Domingo":
+    ag = await agenda.aactual(sucursal_id)
+    fecha_min, fecha_max = _ventana_reservable(ag)
+    if f < fecha_min or f > fecha_max or not ag.abre(f):
         return JsonResponse({"slots": []})
 
     try:
@@ -748,17 +887,86 @@ def api_slots(request):
     except (TypeError, ValueError):
         return JsonResponse({"slots": []})
 
-    slots = _calcular_slots_disponibles(f, servicio_id_int)
+    addons_ids = [int(a) for a in request.GET.getlist("addons") if a.isdigit()]
+    recurso = request.GET.get("recurso") or ""
+    recurso_id = int(recurso) if recurso.isdigit() else None
+    if recurso_id is not None and recurso_id not in ag.recursos:
+        return JsonResponse({"slots": []})
+    slots = await _en_memoria(
+        sucursal_id, f, _calcular_slots_disponibles,
+        sucursal_id, f, servicio_id_int, addons_ids, recurso_id,
+    )
     return JsonResponse({"slots": slots})
 
 
 @require_GET
-def api_ocupadas(request):
+def api_slots_semana(request):
+    """
+    GET /api/slots-semana
+    Slots libres para cada largo de cita posible (servicio base + agregados)
+    en toda la _ventana_reservable(), con cualquier recurso y por recurso,
+    más las horas sin lugar de cada día, en una sola respuesta. El cliente
+    suma las duraciones de lo elegido y busca los slots de
+    ceil(minutos / bloque_minutos) bloques.
+    Respuesta:
+    {"desde": "YYYY-MM-DD", "hasta": "YYYY-MM-DD", "bloque_minutos": 30,
+     "duraciones": {"<servicio_id>": minutos},
+     "recursos": [{"id": 1, "nombre": "Silla 1"}, ...],
+     "dias": {"YYYY-MM-DD": {"dia": "Lunes", "cerrado": false,
+                             "slots": {"<bloques>": ["12:00", ...]},
+                             "recursos": {"<recurso_id>": {"<bloques>": [...]}},
+                             "ocupadas": ["12:30", ...]}}}
+    Horario, jornadas y cierres de la sucursal salen de memoria (agenda.py,
+    cierres.py): cuesta a lo más una consulta a Horario para todos sus
+    recursos, sea cual sea el horizonte.
+    """
+    sucursal_id = request.sucursal.id
+    ag = agenda.actual(sucursal_id)
+    fecha_min, fecha_max = _ventana_reservable(ag)
+
+    cerrados = cierres.actual(sucursal_id).cerrados(fecha_min, fecha_max)
+    abiertos = ag.grilla(fecha_min, fecha_max)
+    disponibilidad.precargar(sucursal_id, fecha_min, fecha_max)
+    largos = disponibilidad.bloques_reservables(sucursal_id)
+
+    dias = {}
+    f = fecha_min
+    while f <= fecha_max:
+        nombre = _nombre_dia(f)
+        cerrado = f in cerrados or f not in abiertos
+        slots, por_recurso = ({}, {}) if cerrado else disponibilidad.slots_por_bloques(sucursal_id, f, largos)
+        dias[f.isoformat()] = {
+            "dia": nombre,
+            "cerrado": cerrado,
+            "slots": {str(b): slots.get(b, []) for b in largos},
+            "recursos": {
+                str(rid): {str(b): s for b, s in por_bloques.items()}
+                for rid, por_bloques in por_recurso.items()
+            },
+            "ocupadas": disponibilidad.horas_ocupadas(sucursal_id, f),
+        }
+        f += timedelta(days=1)
+
+    return JsonResponse({
+        "desde": fecha_min.isoformat(),
+        "hasta": fecha_max.isoformat(),
+        "bloque_minutos": agenda.BLOQUE_MINUTOS,
+        "duraciones": {str(sid): d for sid, d in ag.catalogo.duraciones.items()},
+        "recursos": [{"id": rid, "nombre": ag.nombres_recurso[rid]} for rid in ag.recursos],
+        "dias": dias,
+    })
+
+
+async def api_ocupadas(request):
     """
     GET /api/ocupadas?fecha=YYYY-MM-DD
-    Devuelve las horas NO disponibles (ocupadas) para esa fecha.
-    Considera ocupadas: estado P o A (Canceladas NO bloquean).
+    Devuelve las horas NO disponibles (ocupadas) para esa fecha: cada
+    bloque de la grilla que cruza una cita P o A (Canceladas NO bloquean)
+    y en el que ningún otro recurso que trabaje ese día está libre.
     """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
     fecha_str = request.GET.get("fecha")
     if not fecha_str:
         return JsonResponse({"rows": []})
@@ -768,31 +976,77 @@ def api_ocupadas(request):
     except ValueError:
         return JsonResponse({"rows": []})
 
-    qs = (
-        Horario.objects
-        .select_related("hora_horario", "dia_horario")
-        .filter(fecha=f, estado__in=["P", "A"])
-        .order_by("hora_horario__hora_Horas")
-    )
+    # Bitmaps por recurso en memoria (disponibilidad.py)
+    sucursal_id = request.sucursal.id
+    ocupadas = await _en_memoria(sucursal_id, f, disponibilidad.horas_ocupadas, sucursal_id, f)
 
-    rows = []
-    for h in qs:
-        rows.append({
-            "dia": h.dia_horario.dia_Dias,
-            "fecha": h.fecha.strftime("%d-%m-%Y") if h.fecha else "",
-            "hora": h.hora_horario.hora_Horas,
-        })
+    fecha_txt = f.strftime("%d-%m-%Y")
+    dia = _nombre_dia(f)
+    rows = [{"dia": dia, "fecha": fecha_txt, "hora": hora} for hora in ocupadas]
 
     return JsonResponse({"rows": rows})
 
 
+SSE_KEEPALIVE = 15        # segundos entre comentarios "ping"
+SSE_DURACION_MAX = 300    # Django 4.2 no avisa si el cliente se fue: la conexión se renueva
+SSE_RANGO_CALENDARIO = 62  # días: vista mensual del panel con sus semanas de borde
+
+
+async def api_stream_citas(request):
+    """
+    GET /api/stream?desde=YYYY-MM-DD&hasta=YYYY-MM-DD (hasta exclusivo)
+    Server-Sent Events con los avisos de reserva / cancelación / cambio de
+    estado de ese rango en la sucursal (ver difusion.py). Sin datos del cliente.
+
+    El rango puede cubrir todo lo reservable (horizonte_dias de la agenda)
+    o el mes del calendario del panel, lo que sea mayor.
+
+    Solo bajo ASGI: en WSGI responde 204, EventSource deja de reintentar y
+    las páginas siguen con su refresco normal.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    sucursal_id = request.sucursal.id
+    ag = await agenda.aactual(sucursal_id)
+    rango_max = max(SSE_RANGO_CALENDARIO, ag.reglas.horizonte)
+
+    hoy = timezone.localdate()
+    desde = parse_date(request.GET.get("desde") or "") or hoy
+    hasta = parse_date(request.GET.get("hasta") or "") or desde + timedelta(days=7)
+    if not desde < hasta <= desde + timedelta(days=rango_max):
+        return HttpResponseBadRequest("Rango inválido")
+
+    async def flujo():
+        loop = asyncio.get_running_loop()
+        with difusion.broker.suscribir(sucursal_id, desde, hasta) as cola:
+            yield "retry: 5000\n\n"
+            fin = loop.time() + SSE_DURACION_MAX
+            while (restante := fin - loop.time()) > 0:
+                try:
+                    aviso = await asyncio.wait_for(cola.get(), timeout=min(SSE_KEEPALIVE, restante))
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: cita\ndata: {json.dumps(aviso)}\n\n"
+
+    response = StreamingHttpResponse(flujo(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: no bufferizar el stream
+    return response
+
+
 # =========================
 # Registrar agendamiento (POST)
 # =========================
 
-def RegistrarHorario(request):
+async def RegistrarHorario(request):
+    # Vista async: las validaciones salen de memoria en el event loop; la
+    # reserva (transacción) y la página de éxito van en UN salto a un hilo
     if request.method != "POST":
-        return redirect("/Agendamiento/")
+        return redirect("agendar")
 
     name = request.POST.get("name")
     rutificador = request.POST.get("rut")
@@ -801,6 +1055,7 @@ def RegistrarHorario(request):
     addons_ids = request.POST.getlist("addons_ids")
     hora_str = request.POST.get("hora")
     fecha_str = request.POST.get("fecha")
+    recurso = request.POST.get("recurso_id") or ""
 
     if not all([name, rutificador, celu, servicio_base_id, hora_str, fecha_str]):
         return HttpResponseBadRequest("Faltan datos.")
@@ -810,62 +1065,70 @@ def RegistrarHorario(request):
     except ValueError:
         return HttpResponseBadRequest("Fecha inválida.")
 
-    if DiaCerrado.objects.filter(fecha=f).exists():
+    sucursal_id = request.sucursal.id
+    if (await cierres.aactual(sucursal_id)).cerrado(f):
         return HttpResponseBadRequest("Este día está cerrado. Selecciona otra fecha.")
 
-    fecha_min, fecha_max = _ventana_reservable()
+    ag = await agenda.aactual(sucursal_id)
+    fecha_min, fecha_max = _ventana_reservable(ag)
     if f < fecha_min or f > fecha_max:
         return HttpResponseBadRequest("Solo se puede agendar en la ventana permitida.")
 
-    nombre_dia = _nombre_dia(f)
-    if nombre_dia == "Domingo":
-        return HttpResponseBadRequest("No se atiende los domingos.")
+    if not ag.abre(f):
+        return HttpResponseBadRequest("Ese día no se atiende.")
 
-    dia_obj = get_object_or_404(Dias, dia_Dias=nombre_dia)
-    hora_obj = get_object_or_404(Horas, hora_Horas=hora_str)
+    hora_obj = ag.catalogo.hora_por_etiqueta.get(hora_str)
+    if hora_obj is None:
+        raise Http404("Hora no encontrada.")
 
     try:
         servicio_id_int = int(servicio_base_id)
     except (TypeError, ValueError):
         return HttpResponseBadRequest("Servicio inválido.")
 
-    slots_validos = _calcular_slots_disponibles(f, servicio_id_int)
+    # Sin recurso_id (o vacío) = cualquier barbero libre
+    recurso_id = int(recurso) if recurso.isdigit() else None
+    if recurso and recurso_id not in ag.recursos:
+        return HttpResponseBadRequest("Barbero inválido.")
+
+    slots_validos = await _en_memoria(
+        sucursal_id, f, _calcular_slots_disponibles,
+        sucursal_id, f, servicio_id_int, [int(a) for a in addons_ids if a.isdigit()], recurso_id,
+    )
     if hora_str not in slots_validos:
         return HttpResponseBadRequest("Esa hora no está disponible para el servicio elegido.")
 
-    if Horario.objects.filter(fecha=f, hora_horario=hora_obj, estado__in=["P", "A"]).exists():
-        return HttpResponseBadRequest("Esta hora ya está ocupada, selecciona otra.")
+    def confirmar():
+        # Reclamo atómico del bloque + usuario + agregados (reservas.reservar)
+        try:
+            user, horario = reservar(
+                sucursal_id=sucursal_id,
+                nombre=name,
+                rut=rutificador,
+                celular=celu,
+                fecha=f,
+                hora=hora_obj,
+                servicio_id=servicio_id_int,
+                addons_ids=addons_ids,
+                recurso_id=recurso_id,
+            )
+        except HoraOcupada:
+            return HttpResponseBadRequest("Esta hora ya está ocupada, selecciona otra.")
+        except ValidationError as e:
+            mensaje = e.message_dict.get("rut", ["El RUT ingresado no es válido."])[0]
+            messages.error(request, mensaje)
+            return redirect("agendar")
+
+        # base.html lee request.user (sesión + BD, síncrono)
+        return render(request, "exito.html", {
+            "nombre": user.nombre,
+            "rut": user.rut,
+            "fecha": f.strftime("%d-%m-%Y"),
+            "hora": hora_str,
+            "horario_id": horario.id,
+        })
 
-    try:
-        user = Usuario.objects.create(
-            nombre=name,
-            celular=celu,
-            rut=rutificador
-        )
-    except ValidationError as e:
-        mensaje = e.message_dict.get("rut", ["El RUT ingresado no es válido."])[0]
-        messages.error(request, mensaje)
-        return redirect("/Agendamiento/")
-
-    horario = Horario.objects.create(
-        usuario_horario=user,
-        dia_horario=dia_obj,
-        hora_horario=hora_obj,
-        Tipo_servicio_id=int(servicio_base_id),
-        fecha=f,
-        estado='P'
-    )
-    # Guardar agregados (si vienen)
-    if addons_ids:
-        horario.agregados.set(addons_ids)
-
-    return render(request, "exito.html", {
-        "nombre": user.nombre,
-        "rut": user.rut,
-        "fecha": f.strftime("%d-%m-%Y"),
-        "hora": hora_obj.hora_Horas,
-        "horario_id": horario.id,
-    })
+    return await sync_to_async(confirmar)()
 
 
 # =========================
@@ -873,9 +1136,17 @@ def RegistrarHorario(request):
 # =========================
 
 def obtener_horas_disponibles(request, dia_id):
-    horas_ocupadas = Horario.objects.filter(dia_horario_id=dia_id).values_list('hora_horario_id', flat=True)
-    horas_disponibles = Horas.objects.exclude(id__in=horas_ocupadas)
-    data = {'horas': [{'id': h.id, 'hora': h.hora_Horas} for h in horas_disponibles]}
+    cat = catalogo.actual(request.sucursal.id)
+    dia = cat.dia_por_id.get(dia_id)
+    dia_semana = agenda.NOMBRES_DIA.index(dia.dia_Dias) if dia and dia.dia_Dias in agenda.NOMBRES_DIA else None
+    horas_ocupadas = set(
+        Horario.objects.filter(sucursal=request.sucursal, dia_semana=dia_semana)
+        .values_list('hora_horario_id', flat=True)
+    )
+    data = {'horas': [
+        {'id': h.id, 'hora': etiqueta}
+        for h, etiqueta in zip(cat.horas, cat.etiquetas) if h.id not in horas_ocupadas
+    ]}
     return JsonResponse(data)
 
 
@@ -884,22 +1155,85 @@ def obtener_horas_disponibles(request, dia_id):
 # =========================
 
 def generar_comprobante(request, horario_id):
-    horario = get_object_or_404(Horario, id=horario_id)
-    contexto = {
-        'nombre': horario.usuario_horario.nombre,
-        'rut': horario.usuario_horario.rut,
-        'fecha': (horario.fecha.strftime("%d-%m-%Y") if horario.fecha else ""),
-        'hora': horario.hora_horario.hora_Horas,
-    }
-    html = render_to_string('comprobante.html', contexto)
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="comprobante_{horario.id}.pdf"'
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
+    """
+    PDF del comprobante servido desde el cache en disco (reportes.comprobante_pdf).
+    ETag = hash del contexto: con If-None-Match vigente responde 304 sin leer nada.
+    """
+    horario = get_object_or_404(
+        Horario.objects.select_related("usuario_horario", "Tipo_servicio").prefetch_related("agregados"),
+        id=horario_id, sucursal=request.sucursal,
+    )
+    contexto = contexto_comprobante(horario)
+    etag = f'"{clave_comprobante(horario.id, contexto)}"'
+
+    no_modificado = get_conditional_response(request, etag=etag)
+    if no_modificado is not None:
+        return no_modificado
+
+    ruta = comprobante_pdf(horario.id, contexto)
+    if ruta is None:
         return HttpResponse('Hubo un error al generar el PDF.')
+
+    response = FileResponse(
+        open(ruta, "rb"),
+        as_attachment=True,
+        filename=f"comprobante_{horario.id}.pdf",
+        content_type='application/pdf',
+    )
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
     return response
 
 
+@require_POST
+def comprobante_trabajo(request, horario_id):
+    """Encola el PDF del comprobante y responde 202 con el id a consultar."""
+    horario = get_object_or_404(Horario, id=horario_id, sucursal=request.sucursal)
+    t = trabajos.encolar("PDF", horario_id=horario.id)
+    return _trabajo_json(t, status=202)
+
+
+def _trabajo_json(t, status=200):
+    return JsonResponse({
+        "id": str(t.id),
+        "estado": t.estado,
+        "estado_url": reverse("trabajo_estado", args=[t.id]),
+        "descarga": reverse("trabajo_descargar", args=[t.id]) if t.estado == "L" else None,
+        "error": t.error,
+    }, status=status)
+
+
+def _trabajo_visible(request, pk):
+    # Los Excel son del panel: solo del staff que los pidió, en esa sucursal.
+    # Los PDF son del cliente (id UUID).
+    t = get_object_or_404(Trabajo, pk=pk)
+    if t.tipo == "EXCEL" and not (
+        sucursales.actual().es_staff(request.sucursal, request.user)
+        and t.parametros.get("usuario") == request.user.id
+        and t.parametros.get("sucursal") == request.sucursal.id
+    ):
+        raise Http404("Trabajo no encontrado.")
+    return t
+
+
+@require_GET
+def trabajo_estado(request, pk):
+    """GET /trabajos/<uuid>/  ->  {"estado": P/E/L/F, "descarga": url|null, ...}"""
+    return _trabajo_json(_trabajo_visible(request, pk))
+
+
+@require_GET
+def trabajo_descargar(request, pk):
+    t = _trabajo_visible(request, pk)
+    if t.estado != "L":
+        raise Http404("El archivo aún no está listo.")
+    try:
+        f = open(trabajos.ruta(t), "rb")
+    except FileNotFoundError:
+        raise Http404("El archivo ya no está disponible.")
+    return FileResponse(f, as_attachment=True, filename=t.nombre_archivo)
+
+
 def mostrarlistadoHora(request):
     week_days, hoy = semana_actual()
     fecha_q = request.GET.get("fecha")
@@ -907,11 +1241,12 @@ def mostrarlistadoHora(request):
 
     citas = (
         Horario.objects
-        .filter(fecha=f)
+        .filter(sucursal=request.sucursal, fecha=f)
         .exclude(estado='C')
-        .select_related('usuario_horario', 'hora_horario', 'Tipo_servicio', 'dia_horario')
+        .select_related('usuario_horario', 'Tipo_servicio')
         .prefetch_related('agregados')
-        .order_by('hora_horario__hora_Horas')
+        .with_totals()
+        .order_by('hora_inicio')
     )
 
     selected_label = f"{_nombre_dia(f)} {f:%d-%m-%Y}"
@@ -3,14 +3,58 @@ ASGI config for proyecto_integracion project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Despliegue: las APIs públicas de reserva se sirven con WSGI (gunicorn sync),
+que rinde más. Medido con prueba_carga (1 CPU, 2 workers, SQLite, 50
+clientes, 10 s, /api/slots con la fecha en memoria):
+
+    gunicorn sync (wsgi.py)      552 - 584 req/s   p50 ~86 ms
+    uvicorn (este módulo)        230 - 262 req/s   p50 ~190 ms
+
+Las vistas async ya no saltan de hilo con la fecha en memoria (views.
+_en_memoria), pero en Django 4.2 cada middleware de Django (sesión, CSRF,
+auth, mensajes...) corre process_request / process_response vía
+sync_to_async: ~12 saltos por request. Sin esa cadena uvicorn llega a ~450
+req/s, todavía bajo WSGI: el cálculo es CPU, no espera a la BD.
+
+Este módulo queda para el stream SSE (/api/stream, solo ASGI) o un proceso
+aparte que lo sirva:
+
+    uvicorn proyecto_integracion.asgi:application --host 0.0.0.0 --port $PORT --workers 2
+
+- Definir DB_CONN_MAX_AGE=0: las consultas de las vistas async corren en
+  hilos de sync_to_async y una conexión persistente por hilo no se reusa.
+- Los avisos SSE (Barberia/difusion.py) son por proceso; con varios workers
+  el calendario igual recibe el resto por el feed delta.
+- Bajo WSGI todo funciona (las vistas async se adaptan solas); /api/stream
+  responde 204 y las páginas vuelven al polling.
+- Los estáticos los sirve ServeStaticASGI (STATIC_ROOT, tras collectstatic)
+  antes de entrar a Django; SERVIDOR_ASGI=1 saca WhiteNoiseMiddleware de
+  MIDDLEWARE, que solo sirve bajo WSGI.
+
+Para repetir la comparación con los mismos workers:
+
+    python manage.py prueba_carga "http://127.0.0.1:8000/api/slots?fecha=...&servicio=1" --concurrencia 50
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'proyecto_integracion.settings')
+os.environ['SERVIDOR_ASGI'] = '1'
+
+from django.conf import settings  # noqa: E402
+from django.core.asgi import get_asgi_application  # noqa: E402
+from servestatic import ServeStaticASGI  # noqa: E402
 
-application = get_asgi_application()
+application = ServeStaticASGI(
+    get_asgi_application(),
+    root=settings.STATIC_ROOT,
+    prefix=settings.STATIC_URL,
+    autorefresh=settings.DEBUG,
+)
+if settings.DEBUG:
+    # Sin collectstatic en desarrollo: servir también las fuentes
+    for carpeta in settings.STATICFILES_DIRS:
+        application.add_files(carpeta, prefix=settings.STATIC_URL)
@@ -27,6 +27,8 @@ SECRET_KEY = os.environ.get('SECRET_KEY',"django-insecure-ezh=q2keszrncsv&zj5es)
 DEBUG = os.environ.get("DEBUG","True")== "True"
 
 ALLOWED_HOSTS = ['127.0.0.1','localhost','.onrender.com']
+# Dominios propios de sucursales (Sucursal.dominio), separados por coma
+ALLOWED_HOSTS += [h.strip() for h in os.getenv("SUCURSAL_HOSTS", "").split(",") if h.strip()]
 
 LOGIN_URL= '/login'
 LOGIN_REDIRECT_URL ='/panel/'
@@ -64,9 +66,14 @@ LOGGING ={
 
 }
 
+# Lo define asgi.py: bajo ASGI los estáticos los sirve ServeStaticASGI antes de
+# Django y WhiteNoiseMiddleware sobra
+SERVIDOR_ASGI = os.getenv("SERVIDOR_ASGI") == "1"
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    *([] if SERVIDOR_ASGI else ['whitenoise.middleware.WhiteNoiseMiddleware']),
+    'Barberia.sucursales.SucursalMiddleware',   # request.sucursal (host o /sucursal/<slug>/)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -104,8 +111,12 @@ DATABASE_URL = os.getenv("DATABASE_URL", "")
 
 if DATABASE_URL:
     # PRODUCCIÓN (Render): Postgres
+    # Bajo ASGI (uvicorn) las vistas async usan conexiones por hilo que no se
+    # reutilizan entre requests: ahí conviene DB_CONN_MAX_AGE=0 (ver asgi.py).
     DATABASES = {
-        "default": dj_database_url.config(default=DATABASE_URL, conn_max_age=600)
+        "default": dj_database_url.config(
+            default=DATABASE_URL, conn_max_age=int(os.getenv("DB_CONN_MAX_AGE", "600"))
+        )
     }
 else:
     # LOCAL (XAMPP): MySQL
@@ -166,6 +177,15 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Archivos generados por `manage.py trabajos_worker` (Excel / PDF)
+TRABAJOS_DIR = Path(os.getenv("TRABAJOS_DIR", BASE_DIR / 'trabajos'))
+# Un trabajo 'En curso' sin terminar tras este plazo se reencola (worker caído)
+TRABAJOS_PLAZO_MINUTOS = int(os.getenv("TRABAJOS_PLAZO_MINUTOS", "15"))
+TRABAJOS_MAX_INTENTOS = int(os.getenv("TRABAJOS_MAX_INTENTOS", "3"))
+
+# Cache en disco de los PDF de comprobante (direccionado por contenido)
+COMPROBANTES_DIR = Path(os.getenv("COMPROBANTES_DIR", BASE_DIR / 'cache' / 'comprobantes'))
 #STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 
@@ -18,8 +18,8 @@ urlpatterns = [
     path('Consulta/',views.consultas, name='consultas' ),
     path('Sobre/',views.mostrarSobreMI  , name='sobre' ),
     path('Agendamiento/', views.mostrarAgendamiento, name='agendar'),
-    path('Agendamiento/ListadoHora', views.mostrarlistadoHora),
-    path('RegistrarAgendamiento', views.RegistrarHorario),
+    path('Agendamiento/ListadoHora', views.mostrarlistadoHora, name='listado_hora'),
+    path('RegistrarAgendamiento', views.RegistrarHorario, name='registrar_agendamiento'),
     path('AgendarCita', views.AgendarCita),
 
     # APIs
@@ -28,6 +28,11 @@ urlpatterns = [
 
     # PDF
     path('comprobante/<int:horario_id>/', views.generar_comprobante, name='generar_comprobante'),
+    path('comprobante/<int:horario_id>/trabajo/', views.comprobante_trabajo, name='comprobante_trabajo'),
+
+    # Trabajos en segundo plano (manage.py trabajos_worker)
+    path('trabajos/<uuid:pk>/', views.trabajo_estado, name='trabajo_estado'),
+    path('trabajos/<uuid:pk>/descargar/', views.trabajo_descargar, name='trabajo_descargar'),
     
     # auth
     path('login/',  auth_views.LoginView.as_view(
@@ -44,9 +49,15 @@ urlpatterns = [
     path("panel/api/events/", views.panel_api_events, name="panel_api_events"),
     path("panel/export-rango/", views.panel_export_rango, name="panel_export_rango"),
     path("panel/exportar-excel/", views.panel_export_rango_excel, name="panel_export_rango_excel"),
+    path("panel/trabajos/excel/", views.panel_trabajo_excel, name="panel_trabajo_excel"),
     path("panel/api/stats/", views.panel_api_stats, name="panel_api_stats"),
     path("panel/api/canceladas/", views.panel_api_canceladas, name="panel_api_canceladas"),
-    path("api/ocupadas", views.api_ocupadas, name="api_ocupadas")
+    path("panel/api/analitica/ingresos/", views.panel_api_ingresos, name="panel_api_ingresos"),
+    path("panel/api/analitica/ocupacion/", views.panel_api_ocupacion, name="panel_api_ocupacion"),
+    path("panel/api/analitica/tasas/", views.panel_api_tasas, name="panel_api_tasas"),
+    path("api/ocupadas", views.api_ocupadas, name="api_ocupadas"),
+    path("api/slots-semana", views.api_slots_semana, name="api_slots_semana"),
+    path("api/stream", views.api_stream_citas, name="api_stream_citas"),
 
 
 